@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Cart, CartItem, Category, CustomUser, CustomerAddress, Order, OrderItem, PaymentRequest, Product, ProductRating, Review, Wishlist
+from .models import Cart, CartItem, Category, CustomUser, CustomerAddress, Order, OrderItem, PaymentRequest, Product, ProductRating, Recommendation, Review, SimilarProduct, WebhookEvent, Wishlist
 from django.contrib.auth.admin import UserAdmin
+from django.utils import timezone
 
 # Register your models here.
 
@@ -43,6 +44,16 @@ class ProductRatingAdmin(admin.ModelAdmin):
 admin.site.register(ProductRating, ProductRatingAdmin)
 
 
+class SimilarProductAdmin(admin.ModelAdmin):
+    list_display = ("product", "rank", "similar", "score")
+admin.site.register(SimilarProduct, SimilarProductAdmin)
+
+
+class RecommendationAdmin(admin.ModelAdmin):
+    list_display = ("product", "rank", "recommended", "score")
+admin.site.register(Recommendation, RecommendationAdmin)
+
+
 class WishlistAdmin(admin.ModelAdmin):
     list_display = ("user", "product")
 admin.site.register(Wishlist, WishlistAdmin)
@@ -54,4 +65,16 @@ admin.site.register([Order, OrderItem, CustomerAddress])
 
 @admin.register(PaymentRequest)
 class PaymentRequestAdmin(admin.ModelAdmin):
-    list_display = ('cart_code', 'email', 'created_at')
\ No newline at end of file
+    list_display = ('cart_code', 'email', 'created_at')
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('provider', 'event_id', 'event_type', 'status', 'attempts', 'received_at', 'finished_at')
+    list_filter = ('provider', 'status')
+    search_fields = ('event_id',)
+    actions = ['requeue']
+
+    @admin.action(description="Requeue selected events")
+    def requeue(self, request, queryset):
+        queryset.exclude(status=WebhookEvent.DONE).update(status=WebhookEvent.PENDING, attempts=0, run_at=timezone.now())
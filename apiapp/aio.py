@@ -0,0 +1,22 @@
+import asyncio
+import functools
+import weakref
+
+
+def loop_local(factory):
+    """
+    Cache factory()'s result per running event loop. Async HTTP clients and
+    semaphores belong to the loop they were first used on, so each loop gets
+    its own; they are dropped with the loop. cache_clear() forgets them all.
+    """
+    instances = weakref.WeakKeyDictionary()
+
+    @functools.wraps(factory)
+    def get():
+        loop = asyncio.get_running_loop()
+        if loop not in instances:
+            instances[loop] = factory()
+        return instances[loop]
+
+    get.cache_clear = instances.clear
+    return get
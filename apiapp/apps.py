@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.contrib.auth import password_validation
 
 
 class ApiappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apiapp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Load the password validators, and with them the common password
+        # list, at startup rather than on the first registration.
+        password_validation.get_default_password_validators()
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import math
+
+import httpx
+import stripe
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import daraja, payment_events
+from .aio import loop_local
+from .models import Cart, CartItem, PaymentRequest
+from .pricing import with_cart_totals
+from .views import checkout_session_params, mpesa_amount
+
+
+# Async variants of the payment initiation endpoints, for ASGI deployments.
+# The outbound call to Stripe or Safaricom is awaited on a pooled async HTTP
+# client rather than holding a worker thread for the round trip, and ORM
+# access goes through the async ORM, so a single process can keep hundreds
+# of payment initiations in flight. Each provider gets at most
+# PAYMENT_MAX_CONCURRENCY concurrent calls per process.
+#
+# Every middleware in settings.MIDDLEWARE is async-capable (WhiteNoise via
+# apiapp.middleware), so under ASGI these run on the event loop end to end;
+# keep it that way when adding middleware.
+#
+# DRF views can't be async, so these are plain Django views answering with
+# the same JSON as their DRF counterparts. payment_status_wait is here for the
+# same reason.
+
+
+@loop_local
+def get_stripe_client():
+    return stripe.StripeClient(settings.STRIPE_SECRET_KEY, http_client=stripe.HTTPXClient())
+
+
+@loop_local
+def stripe_slots():
+    return asyncio.Semaphore(settings.PAYMENT_MAX_CONCURRENCY)
+
+
+def request_data(request):
+    if request.content_type == "application/json":
+        try:
+            return json.loads(request.body or b"{}")
+        except ValueError:
+            return {}
+    return request.POST
+
+
+@csrf_exempt
+@require_POST
+async def create_checkout_session(request):
+    data = request_data(request)
+    cart_code = data.get("cart_code")
+    email = data.get("email")
+
+    cartitems = [item async for item in CartItem.objects.filter(cart__cart_code=cart_code).select_related("product").order_by("id")]
+    if not cartitems and not await Cart.objects.filter(cart_code=cart_code).aexists():
+        return JsonResponse({"error": "Invalid cart code"}, status=404)
+
+    try:
+        async with stripe_slots():
+            checkout_session = await get_stripe_client().checkout.sessions.create_async(
+                params=checkout_session_params(cart_code, email, cartitems)
+            )
+        return JsonResponse({'data': checkout_session})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+@csrf_exempt
+@require_POST
+async def lipa_na_mpesa(request):
+    data = request_data(request)
+    phone = data.get("phone")
+    cart_code = data.get("cart_code")
+    email = data.get("email")
+
+    if not phone or not cart_code or not email:
+        return JsonResponse({"error": "Phone, email and cart_code are required"}, status=400)
+
+    try:
+        cart = await with_cart_totals(Cart.objects.all()).aget(cart_code=cart_code)
+    except Cart.DoesNotExist:
+        return JsonResponse({"error": "Invalid cart code"}, status=404)
+
+    await PaymentRequest.objects.aupdate_or_create(cart_code=cart_code, defaults={"email": email})
+
+    try:
+        res = await daraja.get_async_client().stk_push(
+            phone, mpesa_amount(cart), account_reference=cart_code, description="Payment for cart"
+        )
+    except daraja.DarajaError as e:
+        return JsonResponse({"error": "M-Pesa credentials error", "details": str(e)}, status=500)
+    except httpx.HTTPError as e:
+        return JsonResponse({"error": "M-Pesa is unreachable", "details": str(e)}, status=502)
+
+    try:
+        return JsonResponse(res.json(), status=res.status_code, safe=False)
+    except ValueError:
+        return JsonResponse({
+            "error": "Failed to decode Safaricom response",
+            "details": res.text
+        }, status=500)
+
+
+async def payment_status_wait(request):
+    """
+    Long-poll version of payment_status: answers as soon as the payment for
+    ?cart_code= is Paid or Declined, or with its current status after
+    ?timeout= seconds (at most PAYMENT_STATUS_WAIT_TIMEOUT).
+    """
+    cart_code = request.GET.get("cart_code")
+    try:
+        timeout = float(request.GET.get("timeout", settings.PAYMENT_STATUS_WAIT_TIMEOUT))
+    except ValueError:
+        timeout = settings.PAYMENT_STATUS_WAIT_TIMEOUT
+    # nan would slip through the clamp below and never time out.
+    if not math.isfinite(timeout):
+        timeout = settings.PAYMENT_STATUS_WAIT_TIMEOUT
+    timeout = min(max(timeout, 0), settings.PAYMENT_STATUS_WAIT_TIMEOUT)
+
+    status = await payment_events.wait_for_status(cart_code or "", timeout)
+    if status is None:
+        return JsonResponse({"status": "NotFound"}, status=404)
+    return JsonResponse({"status": status})
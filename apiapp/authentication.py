@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import shared_cache
+from .models import AuthToken
+
+
+# Token authentication against AuthToken, which stores the SHA-256 of each
+# key rather than the key, without the per-request token/user join. A
+# snapshot of the token's user (every field but the password) is kept in a
+# small in-process LRU and, if the default Django cache is shared between
+# processes, in that too; both are keyed by the same digest, so neither
+# holds a usable credential either. A hit costs no query at all; the user
+# comes back as an instance with its password deferred, so saving it
+# (complete_profile does) never writes a stale password hash.
+#
+# signals.py invalidates a token's entries when it is deleted (logout) and
+# when its user is saved (e.g. deactivated). That clears this process's LRU
+# and the shared cache, but not other processes' LRUs: they may keep
+# accepting a revoked token for up to AUTH_TOKEN_LOCAL_TTL seconds. A
+# per-process cache backend (LocMem, the default) can't be invalidated from
+# another process either, so with one only the LRU is used. Bulk updates
+# (queryset.update) send no signals and are only picked up when entries
+# expire.
+
+# Invalidated entries are replaced by this for a few seconds, so a request
+# that read the old row just before the change can't cache it again.
+TOMBSTONE = "invalidated"
+TOMBSTONE_TTL = 10
+
+
+def digest(key):
+    return AuthToken.hash_key(key)
+
+
+def cache_key(token_digest):
+    return f"authtoken:{token_digest}"
+
+
+class LocalCache:
+    """A bounded, thread-safe LRU whose entries expire."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.AUTH_TOKEN_LOCAL_SIZE:
+                self.entries.popitem(last=False)
+
+    def add(self, key, value, ttl):
+        """Set key unless it holds an unexpired entry (e.g. a tombstone)."""
+        if self.get(key) is None:
+            self.set(key, value, ttl)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalCache()
+
+
+def snapshot_fields():
+    return [field.attname for field in get_user_model()._meta.concrete_fields if field.attname != "password"]
+
+
+def snapshot(token):
+    return {
+        "created": token.created,
+        "user": {name: getattr(token.user, name) for name in snapshot_fields()},
+    }
+
+
+def restore(token_digest, snap):
+    names = list(snap["user"])
+    user = get_user_model().from_db(DEFAULT_DB_ALIAS, names, [snap["user"][name] for name in names])
+    token = AuthToken.from_db(DEFAULT_DB_ALIAS, ["digest", "user_id", "created"], [token_digest, user.pk, snap["created"]])
+    token.user = user
+    return user, token
+
+
+def fetch(token_digest):
+    """TokenAuthentication's lookup, by digest."""
+    try:
+        token = AuthToken.objects.select_related("user").get(digest=token_digest)
+    except AuthToken.DoesNotExist:
+        raise exceptions.AuthenticationFailed(_("Invalid token."))
+    if not token.user.is_active:
+        raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+    return token.user, token
+
+
+def invalidate(token_digest):
+    local_cache.set(token_digest, TOMBSTONE, TOMBSTONE_TTL)
+    shared = shared_cache()
+    if shared is not None:
+        shared.set(cache_key(token_digest), TOMBSTONE, TOMBSTONE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication over AuthToken, reading token snapshots from the caches first."""
+
+    def authenticate_credentials(self, key):
+        token_digest = digest(key)
+        snap = local_cache.get(token_digest)
+        if snap is None:
+            shared = shared_cache()
+            snap = shared.get(cache_key(token_digest)) if shared is not None else None
+            if snap is None:
+                # Raises AuthenticationFailed for unknown tokens and inactive users.
+                user, token = fetch(token_digest)
+                if shared is not None:
+                    shared.add(cache_key(token_digest), snapshot(token), settings.AUTH_TOKEN_CACHE_TTL)
+                else:
+                    local_cache.add(token_digest, snapshot(token), settings.AUTH_TOKEN_LOCAL_TTL)
+                return user, token
+            if snap != TOMBSTONE:
+                local_cache.set(token_digest, snap, settings.AUTH_TOKEN_LOCAL_TTL)
+        if snap == TOMBSTONE:
+            return fetch(token_digest)
+        return restore(token_digest, snap)
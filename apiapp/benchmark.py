@@ -0,0 +1,249 @@
+import hashlib
+import hmac
+import json
+import statistics
+import time
+from contextlib import ExitStack
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import urls, views
+from .fake_daraja import FakeDaraja
+from .models import AuthToken, Cart, CartItem, Category, CustomUser, PaymentRequest, Product, Review
+from .seeding import SEED_PASSWORD
+
+
+# Load benchmark for every route in apiapp/urls.py, driven in-process
+# through the Django test client (async views included) against a seeded
+# database, usually a throwaway one (see `manage.py benchmark_api`).
+#
+# Each route has a request builder below taking the iteration number, so
+# requests that consume something (deleting a review, logging out) get a
+# fresh row every time. Routes without one are reported as skipped, so a new
+# route can't silently go unmeasured. M-Pesa calls go to a local FakeDaraja
+# and Stripe webhooks are signed with a throwaway secret; routes that would
+# call Stripe itself are skipped.
+
+WEBHOOK_SECRET = "whsec_benchmark"
+
+
+class Scenario:
+    """The seeded rows the request builders draw from, pool sized to the run."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.products = list(Product.objects.order_by("id").values("id", "slug")[:pool])
+        self.categories = list(Category.objects.order_by("id").values_list("slug", flat=True)[:pool])
+        self.users = list(CustomUser.objects.order_by("id")[:pool * 3])
+        self.carts = list(Cart.objects.order_by("id").values_list("cart_code", flat=True)[:pool * 2])
+        self.review_ids = list(Review.objects.order_by("-id").values_list("id", flat=True)[:pool * 2])
+        self.cart_item_ids = list(CartItem.objects.order_by("-id").values_list("id", flat=True)[:pool * 2])
+        if not (self.products and self.categories and len(self.users) >= 3 and len(self.carts) >= 2):
+            raise ValueError("Seed the database first (manage.py seed_shop).")
+
+        # Token holders: one for the authenticated reads, the rest are logged
+        # out one per iteration.
+        self.tokens = [AuthToken.issue(user)[1] for user in self.users[:pool + 1]]
+        for cart_code in self.carts:
+            PaymentRequest.objects.get_or_create(cart_code=cart_code, defaults={"email": self.users[0].email})
+
+    def pick(self, rows, i):
+        return rows[i % len(rows)]
+
+    def product(self, i):
+        return self.pick(self.products, i)
+
+    def user(self, i):
+        return self.pick(self.users, i)
+
+    def cart(self, i):
+        return self.pick(self.carts, i)
+
+    def take(self, rows, i):
+        # Rows that are used up by the request; one per iteration.
+        if i >= len(rows):
+            raise IndexError("Not enough seeded rows for this many iterations.")
+        return rows[i]
+
+    def auth(self, i=None):
+        key = self.tokens[0] if i is None else self.take(self.tokens[1:], i)
+        return {"HTTP_AUTHORIZATION": f"Token {key}"}
+
+
+def get(path, params=None, **headers):
+    return ("get", path, params, headers)
+
+
+def post(path, data=None, **headers):
+    return ("post", path, data, headers)
+
+
+def put(path, data=None, **headers):
+    return ("put", path, data, headers)
+
+
+def delete(path, **headers):
+    return ("delete", path, None, headers)
+
+
+def stripe_webhook(s, i):
+    session = {
+        "id": f"cs_bench_{i}", "object": "checkout.session", "amount_total": 1000, "currency": "usd",
+        "customer_email": s.user(i).email, "metadata": {"cart_code": s.cart(i)},
+    }
+    payload = json.dumps({"id": f"evt_bench_{i}", "object": "event", "type": "checkout.session.completed", "data": {"object": session}})
+    timestamp = int(time.time())
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return ("post", reverse("webhook"), payload, {"HTTP_STRIPE_SIGNATURE": f"t={timestamp},v1={signature}"})
+
+
+def mpesa_callback(s, i):
+    body = {"Body": {"stkCallback": {"ResultCode": 0, "AccountReference": s.cart(i), "CheckoutRequestID": f"ws_CO_bench_{i}"}}}
+    return post(reverse("mpesa_callback"), body)
+
+
+def stk_push(name):
+    return lambda s, i: post(reverse(name), {"phone": "254700000000", "cart_code": s.cart(i), "email": s.user(i).email})
+
+
+REQUESTS = {
+    "product_list": lambda s, i: get(reverse("product_list")),
+    "product_detail": lambda s, i: get(reverse("product_detail", args=[s.product(i)["slug"]])),
+    "product_detail_by_id": lambda s, i: get(reverse("product_detail_by_id", args=[s.product(i)["id"]])),
+    "category_list": lambda s, i: get(reverse("category_list")),
+    "category_detail": lambda s, i: get(reverse("category_detail", args=[s.pick(s.categories, i)])),
+    "add_to_cart": lambda s, i: post(reverse("add_to_cart"), {"cart_code": s.cart(i), "product_id": s.product(i)["id"]}),
+    "update_cart": lambda s, i: post(reverse("update_cart"), {"cart_code": s.cart(i), "operations": [
+        {"op": "add", "product_id": s.product(i)["id"], "quantity": 2},
+        {"op": "set", "product_id": s.product(i + 1)["id"], "quantity": 1},
+    ]}),
+    "update_cartitem_quantity": lambda s, i: put(reverse("update_cartitem_quantity"), {"item_id": s.take(s.cart_item_ids[s.pool:], i), "quantity": 2}),
+    "add_review": lambda s, i: post(reverse("add_review"), {
+        "product_id": s.product(-1 - i)["id"], "email": s.user(i).email, "rating": 4, "review": "Benchmark review",
+    }),
+    "update_review": lambda s, i: put(reverse("update_review", args=[s.take(s.review_ids[s.pool:], i)]), {"rating": 5, "review": "Updated"}),
+    "delete_review": lambda s, i: delete(reverse("delete_review", args=[s.take(s.review_ids, i)])),
+    "get_reviews": lambda s, i: get(reverse("get_reviews", args=[s.product(i)["id"]])),
+    "get-product-rating": lambda s, i: get(reverse("get-product-rating", args=[s.product(i)["id"]])),
+    "delete_cartitem": lambda s, i: delete(reverse("delete_cartitem", args=[s.take(s.cart_item_ids, i)])),
+    "add_to_wishlist": lambda s, i: post(reverse("add_to_wishlist"), {"email": s.user(i).email, "product_id": s.product(i)["id"]}),
+    "search": lambda s, i: get(reverse("search"), {"query": s.product(i)["slug"].split("-")[0]}),
+    "create_checkout_session": "calls Stripe",
+    "webhook": stripe_webhook,
+    "get_orders": lambda s, i: get(reverse("get_orders"), {"email": s.user(i).email}),
+    "create_user": lambda s, i: post(reverse("create_user"), {
+        "username": f"bench_created_{i}", "email": f"bench_created_{i}@example.com",
+        "first_name": "Bench", "last_name": "Created", "profile_picture_url": "",
+    }),
+    "existing_user": lambda s, i: get(reverse("existing_user", args=[s.user(i).email])),
+    "add_address": lambda s, i: post(reverse("add_address"), {"email": s.user(i).email, "street": "Moi Avenue", "city": "Nairobi", "state": "Nairobi", "phone": "0700000000"}),
+    "get_address": lambda s, i: get(reverse("get_address"), {"email": s.user(i).email}),
+    "my_wishlists": lambda s, i: get(reverse("my_wishlists"), {"email": s.user(i).email}),
+    "product_in_wishlist": lambda s, i: get(reverse("product_in_wishlist"), {"email": s.user(i).email, "product_id": s.product(i)["id"]}),
+    "get_cart": lambda s, i: get(reverse("get_cart", args=[s.cart(i)])),
+    "get_cart_stat": lambda s, i: get(reverse("get_cart_stat"), {"cart_code": s.cart(i)}),
+    "product_in_cart": lambda s, i: get(reverse("product_in_cart"), {"cart_code": s.cart(i), "product_id": s.product(i)["id"]}),
+    "register": lambda s, i: post(reverse("register"), {"email": f"bench_registered_{i}@example.com", "password": SEED_PASSWORD, "password_confirm": SEED_PASSWORD}),
+    "login": lambda s, i: post(reverse("login"), {"email_or_phone": s.user(i).email, "password": SEED_PASSWORD}),
+    "logout": lambda s, i: post(reverse("logout"), **s.auth(i)),
+    "profile": lambda s, i: get(reverse("profile"), **s.auth()),
+    "lipa_na_mpesa": stk_push("lipa_na_mpesa"),
+    "create_checkout_session_async": "calls Stripe",
+    "lipa_na_mpesa_async": stk_push("lipa_na_mpesa_async"),
+    "payment_status_wait": lambda s, i: get(reverse("payment_status_wait"), {"cart_code": s.cart(i), "timeout": 0}),
+    "mpesa_callback": mpesa_callback,
+    "payment_status": lambda s, i: get(reverse("payment_status"), {"cart_code": s.cart(i)}),
+    "complete-profile": lambda s, i: post(reverse("complete-profile"), {"phone_number": f"+2547{i:08d}"}, **s.auth()),
+    "similar-products": lambda s, i: get(reverse("similar-products", args=[s.product(i)["id"]])),
+    "product-recommendations": lambda s, i: get(reverse("product-recommendations", args=[s.product(i)["id"]])),
+    "cart-recommendations": lambda s, i: get(reverse("cart-recommendations", args=[s.cart(i)])),
+    "metrics": lambda s, i: get(reverse("metrics")),
+}
+
+
+def percentile(sorted_values, q):
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    return statistics.quantiles(sorted_values, n=100, method="inclusive")[q - 1]
+
+
+def measure(client, scenario, build, iterations, cold_cache):
+    timings, queries, sizes, statuses = [], [], [], {}
+    for i in range(iterations + 1):
+        method, path, data, headers = build(scenario, i)
+        kwargs = {"content_type": "application/json"} if method != "get" else {}
+        if method != "get" and data is not None and not isinstance(data, str):
+            data = json.dumps(data)
+        if cold_cache:
+            cache.clear()
+
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data, **kwargs, **headers)
+            elapsed = (time.perf_counter() - started) * 1000
+
+        if i == 0:
+            continue  # warm-up
+        timings.append(elapsed)
+        queries.append(len(captured))
+        sizes.append(len(response.content))
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    timings.sort()
+    return {
+        "method": method.upper(),
+        "path": path,
+        "status_codes": statuses,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "queries_mean": round(statistics.mean(queries), 2),
+        "queries_max": max(queries),
+        "bytes_mean": round(statistics.mean(sizes)),
+    }
+
+
+def run(iterations=50, only=None, cold_cache=False):
+    """
+    Benchmark every route (or just the names in only) and return the report:
+    {"endpoints": {url name: stats or {"skipped": reason}}}.
+    """
+    scenario = Scenario(iterations + 1)
+    client = Client(raise_request_exception=False)
+    endpoints = {}
+
+    with ExitStack() as stack:
+        daraja = stack.enter_context(FakeDaraja())
+        stack.enter_context(override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            MPESA_BASE_URL=daraja.url, MPESA_CONSUMER_KEY="benchmark", MPESA_CONSUMER_SECRET="benchmark",
+            MPESA_SHORTCODE="174379", MPESA_PASSKEY="benchmark",
+        ))
+        stack.enter_context(mock.patch.object(views, "endpoint_secret", WEBHOOK_SECRET))
+
+        for pattern in urls.urlpatterns:
+            name = pattern.name
+            if only and name not in only:
+                continue
+            build = REQUESTS.get(name, "no request builder in apiapp/benchmark.py")
+            if isinstance(build, str):
+                endpoints[name] = {"skipped": build}
+                continue
+            try:
+                endpoints[name] = measure(client, scenario, build, iterations, cold_cache)
+            except IndexError as e:
+                endpoints[name] = {"skipped": str(e)}
+
+    return {
+        "database": connection.vendor,
+        "iterations": iterations,
+        "cold_cache": cold_cache,
+        "endpoints": endpoints,
+    }
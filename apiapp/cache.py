@@ -0,0 +1,97 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+
+from .renderers import JSONRenderer
+
+
+# Every catalog key embeds the current catalog version, so bumping the version
+# (see signals.py) orphans all cached payloads at once; they age out via TTL.
+# The version only reaches the other worker processes through a shared cache
+# backend, so with a per-process one (LocMem, the default) nothing is cached.
+VERSION_KEY = "catalog:version"
+LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.05
+
+
+def shared_cache():
+    """The default Django cache if other processes see it too, else None."""
+    backend = caches["default"]
+    return None if isinstance(backend, (LocMemCache, DummyCache)) else backend
+
+
+def new_version():
+    # Time based, so a version key lost to eviction or a restart can never
+    # come back as a number that older cached payloads were stored under.
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, new_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, new_version(), timeout=None)
+
+
+def catalog_key(name, *parts):
+    return ":".join(["catalog", str(get_catalog_version()), name, *map(str, parts)])
+
+
+def get_or_build(key, build):
+    """
+    Read-through lookup of a rendered payload. On a miss only one caller
+    (whoever wins cache.add on the lock key) runs build(); the others wait for
+    its result instead of stampeding the database, and fall back to building
+    it themselves if the lock holder fails or takes longer than LOCK_TIMEOUT.
+    """
+    payload = cache.get(key)
+    if payload is not None:
+        return payload
+
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            payload = cache.get(key)
+            if payload is not None:
+                return payload
+            if cache.get(lock_key) is None:
+                # Lock released without a payload (the build failed).
+                break
+        return build()
+
+    try:
+        payload = build()
+        cache.set(key, payload, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        return payload
+    finally:
+        cache.delete(lock_key)
+
+
+def cached_catalog_response(name, *parts, build):
+    """
+    Serve a catalog endpoint from the cache. build() returns the serializer
+    data; it is rendered to JSON once and the bytes are what gets cached.
+    Without a shared cache backend every request renders afresh.
+    """
+    if shared_cache() is None:
+        payload = JSONRenderer().render(build())
+    else:
+        payload = get_or_build(
+            catalog_key(name, *parts),
+            lambda: JSONRenderer().render(build()),
+        )
+    return HttpResponse(payload, content_type="application/json")
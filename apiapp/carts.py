@@ -0,0 +1,76 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Cart, CartItem, Product
+from .pricing import with_cart_totals, with_line_totals
+
+
+# Cart mutations. Quantities only ever change through single UPDATE
+# statements (F() increments or blind sets), so concurrent taps on the same
+# cart can't lose each other's updates. A missing line is inserted and, if a
+# concurrent request inserted it first (unique cart/product), the update is
+# retried against that row.
+
+
+def get_cart_queryset():
+    """
+    Carts with their totals annotated and their lines (with products and
+    sub totals) loaded in one prefetch.
+    """
+    lines = with_line_totals(CartItem.objects.select_related("product").order_by("id"))
+    return with_cart_totals(Cart.objects.all()).prefetch_related(Prefetch("cartitems", queryset=lines))
+
+
+def upsert_line(cart, product_id, quantity, increment):
+    value = F("quantity") + quantity if increment else quantity
+    lines = CartItem.objects.filter(cart=cart, product_id=product_id)
+    if lines.update(quantity=value):
+        return
+    try:
+        with transaction.atomic():
+            CartItem.objects.create(cart=cart, product_id=product_id, quantity=quantity)
+    except IntegrityError:
+        lines.update(quantity=value)
+
+
+def apply_cart_operations(cart_code, operations):
+    """
+    Apply a batch of line operations to a cart (created if needed) in one
+    transaction and return the updated cart, prefetched for CartSerializer.
+
+    Each operation is {"op": "add" | "set" | "remove", "product_id", "quantity"}:
+    add increments the line by quantity, set replaces it (0 removes it) and
+    remove deletes it.
+    """
+    product_ids = {operation["product_id"] for operation in operations}
+    known = set(Product.objects.filter(id__in=product_ids).values_list("id", flat=True))
+    if product_ids - known:
+        raise ValidationError({"product_id": f"Unknown products: {sorted(product_ids - known)}"})
+
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(cart_code=cart_code)
+        for operation in operations:
+            op, product_id, quantity = operation["op"], operation["product_id"], operation.get("quantity", 1)
+            if op == "remove" or (op == "set" and quantity <= 0):
+                CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+            else:
+                upsert_line(cart, product_id, quantity, increment=(op == "add"))
+
+        # update() skips the CartItem signals, so move the cart's version here.
+        Cart.objects.filter(id=cart.id).update(updated_at=timezone.now())
+
+    return get_cart_queryset().get(id=cart.id)
+
+
+def set_line_quantity(item_id, quantity):
+    """Blind-set one line's quantity and return it with its product."""
+    with transaction.atomic():
+        lines = CartItem.objects.filter(id=item_id)
+        cart_id = lines.values_list("cart_id", flat=True).first()
+        if cart_id is None:
+            raise CartItem.DoesNotExist
+        lines.update(quantity=quantity)
+        Cart.objects.filter(id=cart_id).update(updated_at=timezone.now())
+    return with_line_totals(CartItem.objects.select_related("product")).get(id=item_id)
@@ -0,0 +1,93 @@
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from .cache import catalog_key, get_or_build, shared_cache
+from .models import Cart, Category, Product
+
+
+def conditional_on(version_func):
+    """
+    Wrap a view in django's condition() using a cheap version lookup instead
+    of the rendered body. version_func(request, *args, **kwargs) returns a
+    (last_modified, etag) pair, or None when there is nothing to compare
+    against (the view then runs normally, e.g. to produce its 404).
+
+    The version is looked up once per request and shared by the ETag and
+    Last-Modified checks, so a 304 costs a single small query.
+    """
+    def version(request, *args, **kwargs):
+        if not hasattr(request, "_row_version"):
+            request._row_version = version_func(request, *args, **kwargs)
+        return request._row_version
+
+    def etag(request, *args, **kwargs):
+        row_version = version(request, *args, **kwargs)
+        return row_version and row_version[1]
+
+    def last_modified(request, *args, **kwargs):
+        row_version = version(request, *args, **kwargs)
+        return row_version and row_version[0]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def queryset_version(name, queryset):
+    # Max(updated_at) catches edits, Count(id) catches rows leaving the set.
+    stats = queryset.aggregate(last_modified=Max("updated_at"), count=Count("id"))
+    last_modified = stats["last_modified"]
+    stamp = last_modified.timestamp() if last_modified else 0
+    return last_modified, f"{name}-{stats['count']}-{stamp}"
+
+
+# Catalog versions are cached next to the catalog payloads (and invalidated
+# with them), so a cache hit still costs no queries. Like the payloads, they
+# are only cached in a shared backend: a per-process one could hand out a
+# validator from before another worker's change and answer 304 for it.
+
+def cached_version(build, *parts):
+    if shared_cache() is None:
+        return build()
+    return get_or_build(catalog_key("version", *parts), build)
+
+
+def featured_products_version(request):
+    return cached_version(lambda: queryset_version("featured", Product.objects.filter(featured=True)), "featured")
+
+
+def categories_version(request):
+    return cached_version(lambda: queryset_version("categories", Category.objects.all()), "categories")
+
+
+def category_version(request, slug):
+    return cached_version(lambda: fetch_category_version(slug), "category", slug)
+
+
+def fetch_category_version(slug):
+    category = Category.objects.filter(slug=slug).annotate(
+        products_modified=Max("products__updated_at"),
+        product_count=Count("products"),
+    ).values("id", "updated_at", "products_modified", "product_count").first()
+    if category is None:
+        return None
+    last_modified = max(filter(None, [category["updated_at"], category["products_modified"]]))
+    return last_modified, f"category-{category['id']}-{category['product_count']}-{last_modified.timestamp()}"
+
+
+def cart_version(cart_code):
+    # Cart.updated_at is touched whenever one of its items changes (see
+    # signals.py); product edits show up through the items' products.
+    cart = Cart.objects.filter(cart_code=cart_code).annotate(
+        products_modified=Max("cartitems__product__updated_at"),
+    ).values("id", "updated_at", "products_modified").first()
+    if cart is None:
+        return None
+    last_modified = max(filter(None, [cart["updated_at"], cart["products_modified"]]))
+    return last_modified, f"cart-{cart['id']}-{last_modified.timestamp()}"
+
+
+def cart_version_from_path(request, cart_code):
+    return cart_version(cart_code)
+
+
+def cart_version_from_query(request):
+    return cart_version(request.GET.get("cart_code"))
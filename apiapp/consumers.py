@@ -0,0 +1,62 @@
+import asyncio
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from . import payment_events
+
+# A cart with no payment request won't get one by waiting; its socket closes too.
+CLOSING_STATUSES = payment_events.FINAL_STATUSES | {"NotFound"}
+
+
+class PaymentStatusConsumer(AsyncJsonWebsocketConsumer):
+    """
+    ws/payment-status/<cart_code>/ sends {"cart_code", "status"} on connect
+    and again whenever the status changes, and closes once it is final (or
+    NotFound). Changes are pushed through the channel layer, and also picked
+    up by re-reading the status every PAYMENT_STATUS_RECHECK seconds, for when
+    the publisher is in another process the layer doesn't reach. After
+    PAYMENT_STATUS_SOCKET_TIMEOUT seconds without a final status the socket is
+    closed; the client can reconnect if it still cares.
+    """
+
+    async def connect(self):
+        self.cart_code = self.scope["url_route"]["kwargs"]["cart_code"]
+        self.group = payment_events.group_name(self.cart_code)
+        self.status = None
+        self.recheck = None
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+        await self.send_current_status()
+        if self.status not in CLOSING_STATUSES:
+            self.recheck = asyncio.create_task(self.recheck_status())
+
+    async def disconnect(self, code):
+        if self.recheck is not None:
+            self.recheck.cancel()
+        await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def send_current_status(self):
+        status = await payment_events.current_status(self.cart_code)
+        await self.payment_status(payment_events.message(self.cart_code, status or "NotFound"))
+
+    async def recheck_status(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.PAYMENT_STATUS_SOCKET_TIMEOUT
+        while self.status not in CLOSING_STATUSES:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                await self.close()
+                return
+            await asyncio.sleep(min(remaining, settings.PAYMENT_STATUS_RECHECK))
+            await self.send_current_status()
+
+    async def payment_status(self, event):
+        # The push and the recheck may both report the same change.
+        if event["status"] == self.status:
+            return
+        self.status = event["status"]
+        await self.send_json({"cart_code": event["cart_code"], "status": event["status"]})
+        if event["status"] in CLOSING_STATUSES:
+            await self.close()
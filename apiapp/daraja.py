@@ -0,0 +1,234 @@
+import asyncio
+import base64
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .aio import loop_local
+
+
+# Client for Safaricom's Daraja API (M-Pesa STK push).
+#
+# One client per process (get_client()) keeps a pooled keep-alive session,
+# so checkouts reuse the TLS connection, and caches the OAuth token until
+# shortly before it expires instead of fetching a new one per checkout.
+# AsyncDarajaClient does the same for the async payment views.
+
+SANDBOX_URL = "https://sandbox.safaricom.co.ke"
+
+
+class DarajaError(Exception):
+    """Daraja answered, but not with what we asked for (e.g. no access token)."""
+
+
+class BaseDarajaClient:
+    # Refresh the token this many seconds before Daraja says it expires, so
+    # a request never goes out with a token that lapses in flight.
+    TOKEN_REFRESH_MARGIN = 60
+
+    def __init__(self, consumer_key, consumer_secret, shortcode, passkey, callback_url,
+                 base_url=SANDBOX_URL, timeout=10, retries=3):
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.shortcode = shortcode
+        self.passkey = passkey
+        self.callback_url = callback_url
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+
+        self._token = None
+        self._token_expires_at = 0
+
+    @classmethod
+    def from_settings(cls, **kwargs):
+        return cls(
+            consumer_key=settings.MPESA_CONSUMER_KEY,
+            consumer_secret=settings.MPESA_CONSUMER_SECRET,
+            shortcode=settings.MPESA_SHORTCODE,
+            passkey=settings.MPESA_PASSKEY,
+            callback_url=settings.MPESA_CALLBACK_URL,
+            base_url=settings.MPESA_BASE_URL or SANDBOX_URL,
+            timeout=settings.MPESA_TIMEOUT,
+            retries=settings.MPESA_RETRIES,
+            **kwargs,
+        )
+
+    def cached_token(self):
+        if self._token is not None and time.monotonic() < self._token_expires_at:
+            return self._token
+        return None
+
+    def store_token(self, status_code, text, data):
+        try:
+            self._token, expires_in = data["access_token"], int(data.get("expires_in", 3599))
+        except (TypeError, KeyError, ValueError) as e:
+            raise DarajaError(f"No access token in Daraja response ({status_code}): {text}") from e
+        self._token_expires_at = time.monotonic() + max(expires_in - self.TOKEN_REFRESH_MARGIN, 0)
+        return self._token
+
+    def clear_token(self):
+        self._token = None
+
+    def password(self, timestamp=None):
+        """(password, timestamp) for an STK push."""
+        timestamp = timestamp or datetime.now().strftime('%Y%m%d%H%M%S')
+        data_to_encode = f"{self.shortcode}{self.passkey}{timestamp}"
+        return base64.b64encode(data_to_encode.encode()).decode('utf-8'), timestamp
+
+    def stk_payload(self, phone, amount, account_reference, description):
+        password, timestamp = self.password()
+        return {
+            "BusinessShortCode": self.shortcode,
+            "Password": password,
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": amount,
+            "PartyA": phone,
+            "PartyB": self.shortcode,
+            "PhoneNumber": phone,
+            "CallBackURL": self.callback_url,
+            "AccountReference": account_reference,
+            "TransactionDesc": description,
+        }
+
+
+class DarajaClient(BaseDarajaClient):
+
+    def __init__(self, *args, pool_size=10, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Reads (the token) are retried on errors and 5xx responses. The STK
+        # push is only retried when the connection failed before it was
+        # sent, so a customer never gets two payment prompts.
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=0.2,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=pool_size, max_retries=retry))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=pool_size, max_retries=retry))
+        self._token_lock = threading.Lock()
+
+    def access_token(self):
+        """The cached OAuth token, fetching a new one if it is (nearly) expired."""
+        with self._token_lock:
+            token = self.cached_token()
+            if token is None:
+                res = self.session.get(
+                    f"{self.base_url}/oauth/v1/generate",
+                    params={"grant_type": "client_credentials"},
+                    auth=(self.consumer_key, self.consumer_secret),
+                    timeout=self.timeout,
+                )
+                token = self.store_token(res.status_code, res.text, json_or_none(res))
+            return token
+
+    def clear_token(self):
+        with self._token_lock:
+            super().clear_token()
+
+    def stk_push(self, phone, amount, account_reference, description):
+        """
+        Send an STK push and return the requests.Response. A 401 means the
+        cached token was revoked early, so it is refreshed and sent once more.
+        """
+        for attempt in range(2):
+            res = self.session.post(
+                f"{self.base_url}/mpesa/stkpush/v1/processrequest",
+                headers={"Authorization": f"Bearer {self.access_token()}"},
+                json=self.stk_payload(phone, amount, account_reference, description),
+                timeout=self.timeout,
+            )
+            if res.status_code != 401 or attempt:
+                return res
+            self.clear_token()
+
+
+class AsyncDarajaClient(BaseDarajaClient):
+    """
+    The same client for async views, on a pooled httpx.AsyncClient. At most
+    max_concurrency Daraja calls are in flight at once; the rest wait their
+    turn instead of opening ever more connections. Bound to the event loop
+    it is first used on, so get it with get_async_client().
+    """
+
+    def __init__(self, *args, max_concurrency=100, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.http = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            # Connection failures only, so the STK push is never sent twice.
+            transport=httpx.AsyncHTTPTransport(retries=self.retries),
+        )
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._token_lock = asyncio.Lock()
+
+    async def access_token(self):
+        async with self._token_lock:
+            token = self.cached_token()
+            if token is None:
+                for attempt in range(self.retries + 1):
+                    async with self._slots:
+                        res = await self.http.get(
+                            f"{self.base_url}/oauth/v1/generate",
+                            params={"grant_type": "client_credentials"},
+                            auth=(self.consumer_key, self.consumer_secret),
+                        )
+                    if res.status_code < 500:
+                        break
+                    await asyncio.sleep(0.2 * 2 ** attempt)
+                token = self.store_token(res.status_code, res.text, json_or_none(res))
+            return token
+
+    async def stk_push(self, phone, amount, account_reference, description):
+        """Send an STK push and return the httpx.Response (see DarajaClient.stk_push)."""
+        for attempt in range(2):
+            token = await self.access_token()
+            async with self._slots:
+                res = await self.http.post(
+                    f"{self.base_url}/mpesa/stkpush/v1/processrequest",
+                    headers={"Authorization": f"Bearer {token}"},
+                    json=self.stk_payload(phone, amount, account_reference, description),
+                )
+            if res.status_code != 401 or attempt:
+                return res
+            self.clear_token()
+
+
+def json_or_none(res):
+    try:
+        return res.json()
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """The process-wide DarajaClient, built from settings."""
+    return DarajaClient.from_settings()
+
+
+@loop_local
+def get_async_client():
+    """The DarajaClient for async views, one per event loop."""
+    return AsyncDarajaClient.from_settings(max_concurrency=settings.PAYMENT_MAX_CONCURRENCY)
+
+
+@receiver(setting_changed)
+def reset_client(setting, **kwargs):
+    if setting.startswith("MPESA_") or setting == "PAYMENT_MAX_CONCURRENCY":
+        get_client.cache_clear()
+        get_async_client.cache_clear()
@@ -0,0 +1,80 @@
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# A local stand-in for the Daraja API, used by the tests (and handy for
+# trying the M-Pesa checkout without sandbox credentials: point
+# MPESA_BASE_URL at it). It issues tokens, accepts STK pushes and counts
+# what it saw, including how many TCP connections were opened.
+
+
+class FakeDarajaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        if not self.path.startswith("/oauth/v1/generate"):
+            return self.reply(404, {"errorMessage": "Not found"})
+        if not self.headers.get("Authorization", "").startswith("Basic "):
+            return self.reply(400, {"errorMessage": "Invalid credentials"})
+        self.server.token_requests += 1
+        self.server.token = uuid.uuid4().hex
+        self.reply(200, {"access_token": self.server.token, "expires_in": str(self.server.expires_in)})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path != "/mpesa/stkpush/v1/processrequest":
+            return self.reply(404, {"errorMessage": "Not found"})
+        if self.headers.get("Authorization") != f"Bearer {self.server.token}":
+            return self.reply(401, {"errorMessage": "Invalid Access Token"})
+        self.server.stk_pushes.append(body)
+        self.reply(200, {
+            "MerchantRequestID": uuid.uuid4().hex,
+            "CheckoutRequestID": f"ws_CO_{len(self.server.stk_pushes)}",
+            "ResponseCode": "0",
+            "ResponseDescription": "Success. Request accepted for processing",
+            "CustomerMessage": "Success. Request accepted for processing",
+        })
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeDaraja(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, expires_in=3599):
+        super().__init__(("127.0.0.1", 0), FakeDarajaHandler)
+        self.expires_in = expires_in
+        self.token = None
+        self.connections = 0
+        self.token_requests = 0
+        self.stk_pushes = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def revoke_token(self):
+        self.token = None
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,147 @@
+import functools
+
+from cloudinary.models import CloudinaryField
+from django.db import models
+from django.utils.encoding import is_protected_type
+from rest_framework import serializers
+
+
+# Read-only fast path for the big list endpoints. A FastListSerializer is
+# compiled once from a DRF ModelSerializer class: it works out which
+# .values() columns the serializer's fields read (following nested
+# serializers through foreign keys) and a converter per column, so a page is
+# serialized from plain row dicts instead of model instances and DRF's
+# per-field machinery. The output is the same as
+# SerializerClass(queryset, many=True).data, down to the rendered bytes.
+#
+# Only what those serializers use is supported: model fields, serializers
+# nested through a forward foreign key, and one level of many=True nesting
+# over a reverse foreign key (fetched with one extra query). Anything else
+# (SerializerMethodField, source="*", ...) fails at compile time.
+
+CLOUDINARY_CACHE_SIZE = 4096
+
+
+def cloudinary_writer(model_field):
+    @functools.lru_cache(maxsize=CLOUDINARY_CACHE_SIZE)
+    def write(raw):
+        # What DRF's ModelField gives for the value the ORM would have loaded.
+        value = model_field.from_db_value(raw, None, None)
+        return value if is_protected_type(value) else model_field.get_prep_value(value)
+
+    return write
+
+
+class RowWriter:
+    """Turns one .values() row into the serializer's output dict."""
+
+    def __init__(self, serializer, prefix=""):
+        model = serializer.Meta.model
+        self.paths = []
+        self.annotations = {}
+        # (output name, row key, converter or None, nested RowWriter or
+        # None); many=True fields have no row key and are filled in by
+        # FastListSerializer.data().
+        self.fields = []
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+
+            if isinstance(field, serializers.ModelField):
+                if not isinstance(field.model_field, CloudinaryField):
+                    raise TypeError(f"{name}: unsupported ModelField")
+                # Read the stored string as is and convert it (memoized) the
+                # way the field would, rather than parsing it into a
+                # CloudinaryResource per row.
+                key = f"raw_{prefix}{field.model_field.attname}".replace("__", "_")
+                self.annotations[key] = models.ExpressionWrapper(
+                    models.F(prefix + field.model_field.attname), output_field=models.CharField()
+                )
+                self.fields.append((name, key, cloudinary_writer(field.model_field), None))
+                continue
+
+            if field.source == "*" or "." in field.source:
+                raise TypeError(f"{name}: unsupported source {field.source!r}")
+            model_field = model._meta.get_field(field.source)
+
+            if isinstance(field, serializers.ListSerializer):
+                if prefix:
+                    raise TypeError(f"{name}: many=True is only supported at the top level")
+                self.fields.append((name, None, model_field, FastListSerializer(type(field.child))))
+            elif isinstance(field, serializers.Serializer):
+                # Forward foreign key; a null one serializes as None.
+                key = prefix + field.source
+                self.paths.append(key)
+                self.fields.append((name, key, None, RowWriter(field, prefix=key + "__")))
+            elif isinstance(field, serializers.ReadOnlyField | serializers.IntegerField | serializers.CharField):
+                key = prefix + model_field.attname
+                self.paths.append(key)
+                self.fields.append((name, key, None, None))
+            elif isinstance(field, serializers.Field) and not isinstance(field, serializers.SerializerMethodField):
+                key = prefix + model_field.attname
+                self.paths.append(key)
+                self.fields.append((name, key, field.to_representation, None))
+            else:
+                raise TypeError(f"{name}: unsupported field {type(field).__name__}")
+
+        for name, key, convert, nested in self.fields:
+            if isinstance(nested, RowWriter):
+                self.paths += nested.paths
+                self.annotations.update(nested.annotations)
+
+    @property
+    def many(self):
+        return [(name, relation, child) for name, key, relation, child in self.fields if key is None]
+
+    def write(self, row):
+        data = {}
+        for name, key, convert, nested in self.fields:
+            value = row[key] if key is not None else None
+            if value is None:
+                data[name] = None
+            elif nested is not None:
+                data[name] = nested.write(row)
+            elif convert is not None:
+                data[name] = convert(value)
+            else:
+                data[name] = value
+        return data
+
+
+class FastListSerializer:
+    """
+    Compiled from serializer_class on first use. rows(queryset) is the
+    .values() queryset to page through; data(rows) serializes those rows.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @functools.cached_property
+    def writer(self):
+        return RowWriter(self.serializer_class())
+
+    def rows(self, queryset, *extra):
+        writer = self.writer
+        if writer.many:
+            extra = (*extra, queryset.model._meta.pk.attname)
+        names = dict.fromkeys([*extra, *writer.paths, *writer.annotations])
+        return queryset.annotate(**writer.annotations).values(*names)
+
+    def data(self, rows):
+        rows = list(rows)
+        writer = self.writer
+        results = [writer.write(row) for row in rows]
+
+        for name, relation, child in writer.many:
+            pk = relation.model._meta.pk.attname
+            fk = relation.field.attname
+            related = {row[pk]: [] for row in rows}
+            if related:
+                queryset = relation.related_model._default_manager.filter(**{f"{fk}__in": list(related)}).order_by("pk")
+                for related_row in child.rows(queryset, fk):
+                    related[related_row[fk]].append(child.writer.write(related_row))
+            for row, result in zip(rows, results):
+                result[name] = related[row[pk]]
+        return results
@@ -0,0 +1,34 @@
+from django.db import transaction
+
+from .models import Cart, Order, OrderItem
+
+
+def fulfill_cart(cart_code, checkout_id, amount, currency, customer_email, status="Paid"):
+    """
+    Turn a paid cart into an Order, shared by the Stripe and M-Pesa paths.
+
+    Runs in one transaction with the cart row locked, so a crash can't leave
+    a half-copied order and two concurrent deliveries can't both copy the
+    same cart. Items are read with their products in one query, written with
+    one bulk_create (snapshotting each unit price) and the cart is deleted
+    last, so the query count doesn't grow with the size of the cart.
+    """
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().get(cart_code=cart_code)
+        cartitems = list(cart.cartitems.select_related("product"))
+
+        order = Order.objects.create(
+            stripe_checkout_id=checkout_id,
+            amount=amount,
+            currency=currency,
+            customer_email=customer_email,
+            status=status,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=item.product, quantity=item.quantity, unit_price=item.product.price)
+            for item in cartitems
+        ])
+
+        cart.delete()
+
+    return order
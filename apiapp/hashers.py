@@ -0,0 +1,48 @@
+import functools
+import secrets
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+# Django's Argon2 and bcrypt hashers with their cost read from settings
+# (PASSWORD_ARGON2_*, PASSWORD_BCRYPT_ROUNDS), so it can be tuned per
+# deployment. The algorithm names are unchanged: hashes made by Django's own
+# classes still verify, and any hash with other parameters is redone with
+# these on the user's next successful login.
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class BCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    @property
+    def rounds(self):
+        return settings.PASSWORD_BCRYPT_ROUNDS
+
+
+@functools.lru_cache
+def dummy_hash(hasher_classes):
+    return hashers.make_password(secrets.token_urlsafe())
+
+
+def check_unknown_user(password):
+    """
+    Spend what checking a wrong password costs a real account: a verify
+    against a hash from the default hasher, with its current parameters.
+    That's what stored hashes are upgraded to on login, but an account still
+    on an older hasher or parameters costs a different amount until then, so
+    timing can still tell those apart from unknown accounts.
+    """
+    hashers.check_password(password, dummy_hash(tuple(settings.PASSWORD_HASHERS)))
@@ -0,0 +1,76 @@
+from django.db import IntegrityError, transaction
+
+
+# Unique identifiers derived from a name: usernames from an email prefix,
+# slugs from product and category names. The base is used as is if free,
+# otherwise base<separator>N with the lowest free N. Every existing candidate
+# is read in one startswith query instead of probing candidates one query at a
+# time. If another writer takes the value between that read and our insert,
+# the unique constraint fails and the next free value is tried.
+
+ATTEMPTS = 5
+
+# A base at max_length is cut short to fit the suffix, so candidates start
+# with a shorter stem; the lookup leaves room for suffixes up to this many
+# digits. Past that, clashes are caught by allocate()'s retries.
+SUFFIX_DIGITS = 4
+
+
+def stem(base, separator="-", max_length=None):
+    """The prefix every candidate for base (with a short enough suffix) starts with."""
+    if max_length:
+        return base[:max_length - len(separator) - SUFFIX_DIGITS]
+    return base
+
+
+def taken_values(model, field, base, separator="-", max_length=None):
+    prefix = stem(base, separator, max_length)
+    return set(model._default_manager.filter(**{f"{field}__startswith": prefix}).values_list(field, flat=True))
+
+
+def candidate(base, n, separator="-", max_length=None):
+    suffix = f"{separator}{n}"
+    if max_length and len(base) + len(suffix) > max_length:
+        return base[:max_length - len(suffix)] + suffix
+    return base + suffix
+
+
+def next_free(base, taken, separator="-", max_length=None):
+    """The first of base, base<separator>1, base<separator>2, ... not in taken."""
+    if base not in taken:
+        return base
+    n = 1
+    while (value := candidate(base, n, separator, max_length)) in taken:
+        n += 1
+    return value
+
+
+def allocate(model, field, base, create, separator="-"):
+    """
+    Call create(value) with the next free value of model.field for base and
+    return its result. create does the write; it is retried with a fresh
+    value when it fails because someone else got there first.
+    """
+    max_length = model._meta.get_field(field).max_length
+    base = base[:max_length] if max_length else base
+    clashed = set()
+    for attempt in range(ATTEMPTS):
+        taken = taken_values(model, field, base, separator, max_length) | clashed
+        value = next_free(base, taken, separator, max_length)
+        try:
+            with transaction.atomic():
+                return create(value)
+        except IntegrityError:
+            # Only retry if it was our value that clashed.
+            if attempt == ATTEMPTS - 1 or not model._default_manager.filter(**{field: value}).exists():
+                raise
+            clashed.add(value)
+
+
+def save_with_unique(instance, field, base, save, separator="-"):
+    """Save a new instance with save() once field is set to a free value for base."""
+    def save_as(value):
+        setattr(instance, field, value)
+        save()
+
+    allocate(type(instance), field, base, save_as, separator)
@@ -0,0 +1,251 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+
+# Per-request instrumentation. RequestMetricsMiddleware times every sampled
+# request: database queries (count and time, through an execute wrapper that
+# signals.py installs on every connection), rendering the response body
+# (DRF's JSON encoding, timed with a post-render callback) and the request as
+# a whole. Each request gets a Server-Timing header and a DEBUG log line on
+# the apiapp.requests logger, and is added to a rolling window per URL name
+# that the metrics view exposes in Prometheus text format.
+#
+# The middleware works in both sync and async mode. The request's timing is
+# found through a context variable rather than a wrapper on the request
+# thread's connection, so queries run from async views (on sync_to_async
+# threads, with connections of their own) are counted too.
+#
+# METRICS_SAMPLE_RATE is the fraction of requests measured; the rest go
+# straight through. The windows live in process memory, so with several
+# worker processes each /metrics scrape sees one worker.
+
+logger = logging.getLogger("apiapp.requests")
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+current_timing = contextvars.ContextVar("current_timing", default=None)
+
+# (key, metric name, help)
+SERIES = (
+    ("duration", "apiapp_request_duration_seconds", "Time spent handling the request, middleware included."),
+    ("db", "apiapp_request_db_seconds", "Time spent in database queries."),
+    ("serialize", "apiapp_request_serialize_seconds", "Time spent rendering the response body."),
+    ("queries", "apiapp_request_queries", "Database queries run."),
+)
+
+
+class RequestTiming:
+    """What one request spent its time on. Also the connection's execute wrapper."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def server_timing(self):
+        return ", ".join([
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f"serialize;dur={self.serialize * 1000:.1f}",
+            f"total;dur={self.duration * 1000:.1f}",
+        ])
+
+
+class ViewStats:
+    def __init__(self, window):
+        self.samples = {key: deque(maxlen=window) for key, _, _ in SERIES}
+        self.sums = {key: 0 for key, _, _ in SERIES}
+        self.count = 0
+        self.errors = 0
+
+    def add(self, timing, status_code):
+        for key, _, _ in SERIES:
+            value = getattr(timing, key)
+            self.samples[key].append(value)
+            self.sums[key] += value
+        self.count += 1
+        if status_code >= 500:
+            self.errors += 1
+
+
+class Registry:
+    """Rolling per-view stats, shared by the threads of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view, timing, status_code):
+        with self.lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = ViewStats(settings.METRICS_WINDOW)
+            stats.add(timing, status_code)
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+    def exposition(self):
+        """The stats in Prometheus text format."""
+        with self.lock:
+            views = {
+                view: (stats.count, stats.errors, dict(stats.sums), {key: sorted(values) for key, values in stats.samples.items()})
+                for view, stats in sorted(self.views.items())
+            }
+
+        lines = []
+        for key, name, help_text in SERIES:
+            lines += [
+                f"# HELP {name} {help_text} Quantiles over the last {settings.METRICS_WINDOW} sampled requests.",
+                f"# TYPE {name} summary",
+            ]
+            for view, (count, _, sums, samples) in views.items():
+                label = f'view="{escape(view)}"'
+                for q in QUANTILES:
+                    lines.append(f'{name}{{{label},quantile="{q}"}} {quantile(samples[key], q)}')
+                lines.append(f"{name}_sum{{{label}}} {sums[key]}")
+                lines.append(f"{name}_count{{{label}}} {count}")
+
+        lines += [
+            "# HELP apiapp_request_errors_total Sampled requests answered with a 5xx.",
+            "# TYPE apiapp_request_errors_total counter",
+        ]
+        lines += [f'apiapp_request_errors_total{{view="{escape(view)}"}} {errors}' for view, (_, errors, _, _) in views.items()]
+        lines += [
+            "# HELP apiapp_metrics_sample_rate Fraction of requests measured.",
+            "# TYPE apiapp_metrics_sample_rate gauge",
+            f"apiapp_metrics_sample_rate {settings.METRICS_SAMPLE_RATE}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def timed_execute(execute, sql, params, many, context):
+    timing = current_timing.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    return timing(execute, sql, params, many, context)
+
+
+def install(connection):
+    if timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timed_execute)
+
+
+def quantile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def escape(label_value):
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return (match and match.view_name) or "unresolved"
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Or Django would run the sync hook through sync_to_async.
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        timing = request._timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        return self.finish(request, timing, response)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        timing = request._timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        return self.finish(request, timing, response)
+
+    def finish(self, request, timing, response):
+        timing.duration = time.perf_counter() - timing.started
+
+        view = view_name(request)
+        registry.record(view, timing, response.status_code)
+        response["Server-Timing"] = timing.server_timing()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "%s %s %s %s %.1fms %d queries",
+                request.method, request.path, view, response.status_code, timing.duration * 1000, timing.queries,
+                extra={
+                    "view": view,
+                    "method": request.method,
+                    "path": request.path,
+                    "status_code": response.status_code,
+                    "duration_ms": round(timing.duration * 1000, 3),
+                    "db_ms": round(timing.db * 1000, 3),
+                    "serialize_ms": round(timing.serialize * 1000, 3),
+                    "queries": timing.queries,
+                },
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that part.
+        timing = getattr(request, "_timing", None)
+        if timing is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                timing.serialize += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    async def aprocess_template_response(self, request, response):
+        return RequestMetricsMiddleware.process_template_response(self, request, response)
+
+
+def metrics(request):
+    """Prometheus scrape endpoint. Needs Authorization: Bearer METRICS_TOKEN when that is set."""
+    if settings.METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+    return HttpResponse(registry.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8")
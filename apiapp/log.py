@@ -0,0 +1,117 @@
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+
+
+# Logging plumbing, wired up by LOGGING in settings.
+#
+# BackgroundStreamHandler puts records on a queue and a QueueListener thread
+# formats and writes them, so a request thread never waits on stdout (which
+# is unbuffered in the Docker image). RedactFilter masks credentials and
+# personal details in structured fields before the record leaves the calling
+# thread, and JsonFormatter writes one JSON object per line.
+#
+# Log payloads as fields, not in the message, so they get redacted and stay
+# machine-readable:
+#
+#     logger.info("M-Pesa callback received", extra={"payload": data})
+
+# Field names containing any of these (case-insensitive, "_" ignored) are masked.
+REDACTED = ("password", "passkey", "secret", "token", "authorization", "phone", "email", "card")
+
+MASK = "[redacted]"
+
+# Attributes every LogRecord has; anything else came in through extra=.
+RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+def sensitive(key):
+    key = str(key).lower().replace("_", "")
+    return any(word in key for word in REDACTED)
+
+
+def redact(value):
+    """A copy of value with sensitive fields masked, looking into dicts and lists."""
+    if isinstance(value, dict):
+        # Daraja callback metadata comes as [{"Name": "PhoneNumber", "Value": ...}]
+        if sensitive(value.get("Name", "")) and "Value" in value:
+            return {**value, "Value": MASK}
+        return {key: MASK if sensitive(key) else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in RECORD_ATTRS}
+
+
+class RedactFilter(logging.Filter):
+    def filter(self, record):
+        for key, value in extra_fields(record).items():
+            setattr(record, key, MASK if sensitive(key) else redact(value))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **extra_fields(record),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class BackgroundStreamHandler(logging.handlers.QueueHandler):
+    """
+    Writes to stream from a listener thread. If the queue fills up (the
+    stream can't keep up), records are dropped and counted rather than
+    blocking the caller.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread.
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Only the cheap part here: resolve the message (its args may change
+        # after we return) and the traceback (its frames would). The
+        # formatter runs later, on the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+        self.target.close()
+        super().close()
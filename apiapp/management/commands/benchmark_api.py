@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apiapp import benchmark, seeding
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and time every route in apiapp/urls.py "
+        "through the Django test client. Reports p50/p95/p99 latency, queries "
+        "and bytes per request as JSON, so runs can be compared."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50, help="Measured requests per route.")
+        parser.add_argument("--only", nargs="+", metavar="URL_NAME", help="Only these routes.")
+        parser.add_argument("--cold-cache", action="store_true", help="Clear the cache before every request.")
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument("--products", type=int, default=5000)
+        parser.add_argument("--reviews", type=int, default=20000)
+        parser.add_argument("--carts", type=int, default=500)
+        parser.add_argument("--wishlists", type=int, default=5000)
+        parser.add_argument("--orders", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        volumes = {name: options[name] for name in ["users", "categories", "products", "reviews", "carts", "wishlists", "orders"]}
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seeded = seeding.seed_shop(**volumes, seed=options["seed"])
+            report = benchmark.run(iterations=options["iterations"], only=options["only"], cold_cache=options["cold_cache"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report["seeded"] = seeded
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}."))
+        else:
+            self.stdout.write(output)
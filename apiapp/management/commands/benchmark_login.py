@@ -0,0 +1,97 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from apiapp.models import CustomUser
+from apiapp.serializers import UserLoginSerializer
+
+
+PASSWORD = "benchmark-Login-2024"
+
+
+def legacy_login(email_or_phone, password):
+    # The old UserLoginSerializer.validate: find the user, then authenticate(),
+    # which fetches them again.
+    user = CustomUser.objects.get(email=email_or_phone)
+    return authenticate(username=user.email, password=password)
+
+
+def login(email_or_phone, password):
+    serializer = UserLoginSerializer(data={"email_or_phone": email_or_phone, "password": password})
+    serializer.is_valid()
+    return serializer.validated_data.get("user")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure login throughput per worker: the old double lookup on PBKDF2 "
+        "against the single-fetch login on each configured hasher, plus the first "
+        "login of users whose hash gets upgraded. Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=20, help="Logins per scenario.")
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = self.run(options["logins"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, logins):
+        classes = settings.PASSWORD_HASHER_CLASSES
+        report = {"password_hasher": settings.PASSWORD_HASHER, "scenarios": {}}
+
+        def hashers(first):
+            return [classes[first], *(hasher for name, hasher in classes.items() if name != first)]
+
+        def users(prefix, hasher):
+            with override_settings(PASSWORD_HASHERS=hashers(hasher)):
+                password = make_password(PASSWORD)
+            CustomUser.objects.bulk_create([
+                CustomUser(username=f"{prefix}{n}", email=f"{prefix}{n}@example.com", password=password) for n in range(logins)
+            ])
+            return [f"{prefix}{n}@example.com" for n in range(logins)]
+
+        scenarios = report["scenarios"]
+        with override_settings(PASSWORD_HASHERS=hashers("pbkdf2")):
+            scenarios["legacy_pbkdf2"] = self.measure(legacy_login, users("legacy", "pbkdf2"))
+        for name in classes:
+            with override_settings(PASSWORD_HASHERS=hashers(name)):
+                emails = users(name, name)
+                scenarios[f"single_fetch_{name}"] = self.measure(login, emails)
+                scenarios[f"unknown_user_{name}"] = self.measure(login, [f"nobody{n}@example.com" for n in range(logins)])
+
+        # First login of PBKDF2 users under the configured hasher: verify,
+        # rehash and save. Their next logins cost single_fetch_<configured>.
+        if settings.PASSWORD_HASHER != "pbkdf2":
+            scenarios["rehash_from_pbkdf2"] = self.measure(login, users("upgrade", "pbkdf2"))
+        return report
+
+    def measure(self, func, emails):
+        timings, queries, succeeded = [], [], 0
+        for email in emails:
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                succeeded += func(email, PASSWORD) is not None
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+        timings.sort()
+        return {
+            "logins_per_second": round(1000 / statistics.mean(timings), 1),
+            "mean_ms": round(statistics.mean(timings), 2),
+            "p50_ms": round(timings[len(timings) // 2], 2),
+            "p95_ms": round(timings[max(int(len(timings) * 0.95) - 1, 0)], 2),
+            "queries_per_login": round(statistics.mean(queries), 2),
+            "succeeded": succeeded,
+        }
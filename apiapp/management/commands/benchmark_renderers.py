@@ -0,0 +1,86 @@
+import io
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework import parsers, renderers
+
+from apiapp import renderers as fast
+from apiapp import seeding
+from apiapp.models import Category, Product
+from apiapp.pagination import page_payload
+from apiapp.serializers import CategoryDetailSerializer
+from apiapp.views import FAST_PRODUCT_LIST
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare encoding (and parsing back) a category_detail payload with DRF's "
+        "stdlib JSON renderer and apiapp.renderers, with and without orjson. Runs "
+        "against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, options):
+        seeding.seed_shop(users=0, categories=1, products=options["products"], reviews=0, carts=0, wishlists=0,
+                          orders=0, derived=False)
+        # Images, so the Cloudinary values are in there too.
+        Product.objects.update(image="image/upload/v1700000000/products/sample.jpg")
+        category = Category.objects.get()
+
+        # What category_detail builds, with every product on the one page.
+        data = CategoryDetailSerializer(category).data
+        products = FAST_PRODUCT_LIST.data(FAST_PRODUCT_LIST.rows(category.products.order_by("id")))
+        data["products"] = page_payload(products, "bmV4dA")
+
+        stdlib_renderer = fast.JSONRenderer()
+        stdlib_renderer.use_orjson = False
+        stdlib_parser = fast.JSONParser()
+        stdlib_parser.use_orjson = False
+        candidates = {
+            "drf": (renderers.JSONRenderer(), parsers.JSONParser()),
+            "apiapp_stdlib": (stdlib_renderer, stdlib_parser),
+        }
+        if fast.orjson is not None:
+            candidates["apiapp_orjson"] = (fast.JSONRenderer(), fast.JSONParser())
+
+        expected = renderers.JSONRenderer().render(data)
+        report = {"products": len(products), "bytes": len(expected), "orjson": fast.orjson is not None, "renderers": {}}
+        for name, (renderer, parser) in candidates.items():
+            body = renderer.render(data)
+            report["renderers"][name] = {
+                "identical_output": body == expected,
+                "encode": self.measure(lambda: renderer.render(data), options["iterations"]),
+                "parse": self.measure(lambda: parser.parse(io.BytesIO(body)), options["iterations"]),
+            }
+
+        baseline = report["renderers"]["drf"]["encode"]["mean_ms"]
+        for result in report["renderers"].values():
+            result["encode_speedup"] = round(baseline / result["encode"]["mean_ms"], 2)
+        return report
+
+    def measure(self, func, iterations):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return {
+            "mean_ms": round(statistics.mean(timings), 3),
+            "p50_ms": round(timings[len(timings) // 2], 3),
+            "p95_ms": round(timings[max(int(len(timings) * 0.95) - 1, 0)], 3),
+        }
@@ -0,0 +1,95 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apiapp import search
+from apiapp.models import Category, Product
+from apiapp.seeding import WORDS
+from apiapp.serializers import ProductListSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the full-text product search against the old icontains scan on a "
+        "synthetic catalog. Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100_000)
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, options):
+        rng = random.Random(options["seed"])
+        categories = Category.objects.bulk_create(
+            [Category(name=f"{word.title()} Goods", slug=f"{word}-goods") for word in WORDS[:20]]
+        )
+        Product.objects.bulk_create(
+            [
+                Product(
+                    name=" ".join(rng.sample(WORDS, 3)).title(),
+                    description=" ".join(rng.choices(WORDS, k=30)),
+                    price=rng.randint(100, 100_000) / 100,
+                    slug=f"product-{i}",
+                    category=rng.choice(categories),
+                )
+                for i in range(options["products"])
+            ],
+            batch_size=5000,
+        )
+
+        started = time.perf_counter()
+        search.rebuild_index()
+        index_seconds = time.perf_counter() - started
+
+        # Mix of whole words, multi-word queries and typeahead prefixes.
+        queries = []
+        for _ in range(options["queries"]):
+            kind = rng.random()
+            if kind < 0.4:
+                queries.append(rng.choice(WORDS))
+            elif kind < 0.7:
+                queries.append(" ".join(rng.sample(WORDS, 2)))
+            else:
+                word = rng.choice(WORDS)
+                queries.append(word[:rng.randint(2, len(word))])
+
+        def legacy(query):
+            return ProductListSerializer(search.legacy_search_queryset(query), many=True).data
+
+        def ranked(query):
+            return ProductListSerializer(search.search_products(query), many=True).data
+
+        return {
+            "products": options["products"],
+            "search_backend": search.search_backend() or "icontains",
+            "index_build_seconds": round(index_seconds, 3),
+            "icontains_unpaginated": self.measure(legacy, queries),
+            "full_text_first_page": self.measure(ranked, queries),
+        }
+
+    def measure(self, func, queries):
+        timings, rows = [], 0
+        for query in queries:
+            started = time.perf_counter()
+            rows += len(func(query))
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return {
+            "mean_ms": round(statistics.mean(timings), 2),
+            "p50_ms": round(timings[len(timings) // 2], 2),
+            "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+            "rows_per_query": rows // len(queries),
+        }
@@ -0,0 +1,77 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from apiapp import seeding
+from apiapp.fast_serializers import FastListSerializer
+from apiapp.models import Category, Order, Product, Wishlist
+from apiapp.serializers import CategoryListSerializer, OrderSerializer, ProductListSerializer, WishlistSerializer
+
+
+# (serializer, queryset, what the view prefetches for the DRF version)
+CASES = {
+    "products": (ProductListSerializer, lambda: Product.objects.all(), ()),
+    "categories": (CategoryListSerializer, lambda: Category.objects.all(), ()),
+    "orders": (OrderSerializer, lambda: Order.objects.all(), ("items__product",)),
+    "wishlists": (WishlistSerializer, lambda: Wishlist.objects.all(), ("user", "product")),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DRF serialization of model instances against the values()-based "
+        "fast path for the list endpoints, in rows per second, and check both render "
+        "the same bytes. Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=10_000)
+        parser.add_argument("--orders", type=int, default=2000)
+        parser.add_argument("--wishlists", type=int, default=5000)
+        parser.add_argument("--iterations", type=int, default=5)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, options):
+        seeding.seed_shop(products=options["products"], orders=options["orders"], wishlists=options["wishlists"],
+                          reviews=0, derived=False)
+        report = {}
+        for name, (serializer_class, queryset, prefetch) in CASES.items():
+            fast = FastListSerializer(serializer_class)
+
+            def drf():
+                return serializer_class(queryset().prefetch_related(*prefetch), many=True).data
+
+            def values():
+                return fast.data(fast.rows(queryset()))
+
+            slow_bytes, fast_bytes = JSONRenderer().render(drf()), JSONRenderer().render(values())
+            report[name] = {
+                "rows": queryset().count(),
+                "identical_output": slow_bytes == fast_bytes,
+                "drf": self.measure(drf, options["iterations"]),
+                "fast": self.measure(values, options["iterations"]),
+            }
+            report[name]["speedup"] = round(report[name]["drf"]["ms"] / report[name]["fast"]["ms"], 2)
+        return report
+
+    def measure(self, serialize, iterations):
+        timings = []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                rows = len(serialize())
+                timings.append(time.perf_counter() - started)
+            queries = len(captured)
+        best = min(timings)
+        return {"ms": round(best * 1000, 2), "rows_per_second": round(rows / best), "queries": queries}
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from apiapp import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold orders placed since the last run into the co-purchase matrix and "
+        "refresh the frequently-bought-together lists they affect."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Orders read per chunk.")
+        parser.add_argument("--full", action="store_true", help="Discard the matrix and rebuild from the first order.")
+        parser.add_argument(
+            "--settle-seconds", type=int, default=None,
+            help="Leave orders younger than this for a later run (default: RECOMMENDATIONS_SETTLE_SECONDS).",
+        )
+
+    def handle(self, *args, **options):
+        last_order_id, refreshed = recommendations.build(
+            chunk_size=options["chunk_size"], full=options["full"], settle_seconds=options["settle_seconds"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed orders up to #{last_order_id}; refreshed {refreshed} products."
+        ))
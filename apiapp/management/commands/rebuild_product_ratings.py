@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from apiapp.models import ProductRating, Review
+
+
+class Command(BaseCommand):
+    help = "Rebuild every ProductRating row from the reviews table in one aggregate pass."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        histogram = {
+            name: Count("id", filter=Q(rating=stars))
+            for stars, name in ProductRating.STAR_FIELDS.items()
+        }
+        rows = Review.objects.values("product_id").annotate(
+            total_reviews=Count("id"),
+            rating_sum=Sum("rating"),
+            **histogram,
+        )
+
+        with transaction.atomic():
+            ProductRating.objects.all().delete()
+            created = ProductRating.objects.bulk_create(
+                [ProductRating(**row) for row in rows.iterator()],
+                batch_size=options["batch_size"],
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {len(created)} products."))
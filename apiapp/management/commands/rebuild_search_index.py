@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apiapp import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from the product table."
+
+    def handle(self, *args, **options):
+        backend = search.search_backend()
+        if backend is None:
+            self.stdout.write(self.style.WARNING("No full-text index on this database; search uses icontains."))
+            return
+
+        with transaction.atomic():
+            search.rebuild_index()
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the {backend} product search index."))
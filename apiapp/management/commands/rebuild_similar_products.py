@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apiapp import similarity
+
+
+class Command(BaseCommand):
+    help = "Recompute every product's top-K similar products from category, price band and co-purchases."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = similarity.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} similar product links."))
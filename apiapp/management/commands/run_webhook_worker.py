@@ -0,0 +1,49 @@
+import time
+from statistics import quantiles
+
+from django.core.management.base import BaseCommand
+
+from apiapp import webhooks
+from apiapp.models import WebhookEvent
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued Stripe and M-Pesa webhook events: fulfill paid carts, "
+        "retry failures with backoff and dead-letter events that keep failing. "
+        "Run as many workers as needed; they never take the same event."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit once no events are due instead of polling.")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--max-events", type=int, default=None, help="Exit after processing this many events.")
+
+    def handle(self, *args, **options):
+        latencies = []
+        counts = {"done": 0, "retry": 0, "dead": 0}
+        try:
+            while options["max_events"] is None or sum(counts.values()) < options["max_events"]:
+                event = webhooks.run_one()
+                if event is None:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                outcome = "retry" if event.status == WebhookEvent.PENDING else event.status
+                counts[outcome] += 1
+                latencies.append(event.latency.total_seconds() * 1000)
+                self.stdout.write(
+                    f"{event} {outcome} attempt={event.attempts} "
+                    f"duration={event.duration.total_seconds() * 1000:.1f}ms "
+                    f"latency={latencies[-1]:.1f}ms"
+                )
+        except KeyboardInterrupt:
+            pass
+
+        summary = ", ".join(f"{count} {outcome}" for outcome, count in counts.items())
+        if len(latencies) > 1:
+            p50, p95 = (quantiles(latencies, n=100, method="inclusive")[i] for i in (49, 94))
+            summary += f"; latency p50={p50:.1f}ms p95={p95:.1f}ms"
+        self.stdout.write(self.style.SUCCESS(f"Processed {sum(counts.values())} events: {summary}."))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apiapp import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic shop (users, categories, products, reviews, "
+        "carts, wishlists and orders) for benchmarking and load testing. "
+        f"Seeded users log in with the password {seeding.SEED_PASSWORD!r}."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--categories", type=int, default=10)
+        parser.add_argument("--products", type=int, default=2000)
+        parser.add_argument("--reviews", type=int, default=5000)
+        parser.add_argument("--carts", type=int, default=200)
+        parser.add_argument("--wishlists", type=int, default=1000)
+        parser.add_argument("--orders", type=int, default=1000)
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per bulk insert.")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed, for repeatable data.")
+        parser.add_argument("--skip-derived", action="store_true",
+                            help="Don't rebuild ratings, the search index, similar products and recommendations.")
+
+    def handle(self, *args, **options):
+        volumes = {name: options[name] for name in ["users", "categories", "products", "reviews", "carts", "wishlists", "orders"]}
+        with transaction.atomic():
+            created = seeding.seed_shop(
+                **volumes, batch_size=options["batch_size"], seed=options["seed"], derived=not options["skip_derived"],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            "Seeded " + ", ".join(f"{count} {name.replace('_', ' ')}" for name, count in created.items()) + "."
+        ))
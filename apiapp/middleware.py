@@ -0,0 +1,43 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise import middleware as whitenoise
+
+
+class WhiteNoiseMiddleware(whitenoise.WhiteNoiseMiddleware):
+    """
+    WhiteNoise that can sit in an async middleware chain. WhiteNoise itself
+    is sync-only, which makes Django run the whole chain (and async views
+    behind it) through async_to_sync under ASGI. Here only requests for
+    static files leave the event loop, to look the file up and open it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        url = request.path_info
+        if self.autorefresh:
+            # Files are looked up on disk per request (DEBUG); skip URLs that
+            # can't be one.
+            if self.might_be_file(url):
+                static_file = await sync_to_async(self.find_file)(url)
+            else:
+                static_file = None
+        else:
+            static_file = self.files.get(url)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+    def might_be_file(self, url):
+        return url.startswith(self.static_prefix) or any(url.startswith(prefix) for root, prefix in self.directories)
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:48
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_histogram(apps, schema_editor):
+    ProductRating = apps.get_model('apiapp', 'ProductRating')
+    Review = apps.get_model('apiapp', 'Review')
+    star_fields = ['one_star', 'two_star', 'three_star', 'four_star', 'five_star']
+
+    ProductRating.objects.all().delete()
+    rows = Review.objects.values('product_id').annotate(
+        total_reviews=Count('id'),
+        rating_sum=Sum('rating'),
+        **{name: Count('id', filter=Q(rating=stars)) for stars, name in enumerate(star_fields, start=1)}
+    )
+    ProductRating.objects.bulk_create([ProductRating(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiapp', '0003_alter_category_image_alter_product_image'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='productrating',
+            name='average_rating',
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='five_star',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='four_star',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='one_star',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='three_star',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='two_star',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_histogram, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:30
+
+from django.db import migrations
+
+
+# Backend-specific full-text index used by apiapp.search. Only PostgreSQL and
+# SQLite (with FTS5) get one; elsewhere search falls back to icontains.
+
+POSTGRES_CREATE = """
+CREATE TABLE apiapp_product_search (
+    product_id bigint PRIMARY KEY REFERENCES apiapp_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+    document tsvector NOT NULL
+);
+CREATE INDEX apiapp_product_search_document_gin ON apiapp_product_search USING gin (document);
+INSERT INTO apiapp_product_search (product_id, document)
+SELECT p.id,
+       setweight(to_tsvector('simple', coalesce(p.name, '')), 'A') ||
+       setweight(to_tsvector('simple', coalesce(c.name, '')), 'B') ||
+       setweight(to_tsvector('simple', coalesce(p.description, '')), 'C')
+FROM apiapp_product p LEFT JOIN apiapp_category c ON c.id = p.category_id;
+"""
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE apiapp_product_fts USING fts5(name, category, description)",
+    """
+    INSERT INTO apiapp_product_fts (rowid, name, category, description)
+    SELECT p.id, p.name, coalesce(c.name, ''), p.description
+    FROM apiapp_product p LEFT JOIN apiapp_category c ON c.id = p.category_id
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_CREATE)
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                return
+        for statement in SQLITE_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS apiapp_product_search")
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS apiapp_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiapp', '0005_category_updated_at_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_recorded_events_done(apps, schema_editor):
+    # Events recorded before the queue existed were processed when received.
+    WebhookEvent = apps.get_model("apiapp", "WebhookEvent")
+    WebhookEvent.objects.update(status="done", attempts=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiapp', '0011_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='run_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('dead', 'Dead')], default='pending', max_length=10),
+        ),
+        migrations.RunPython(mark_recorded_events_done, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(fields=['status', 'run_at'], name='webhook_event_queue_idx'),
+        ),
+    ]
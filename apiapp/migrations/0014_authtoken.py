@@ -0,0 +1,40 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:04
+
+import hashlib
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def hash_existing_tokens(apps, schema_editor):
+    # Move rest_framework.authtoken's plaintext keys over as digests; their
+    # holders keep working, and the old rows go.
+    Token = apps.get_model('authtoken', 'Token')
+    AuthToken = apps.get_model('apiapp', 'AuthToken')
+    AuthToken.objects.bulk_create([
+        AuthToken(digest=hashlib.sha256(key.encode()).hexdigest(), user_id=user_id, created=created)
+        for key, user_id, created in Token.objects.values_list('key', 'user_id', 'created').iterator()
+    ], batch_size=1000)
+    Token.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiapp', '0013_query_pattern_indexes'),
+        ('authtoken', '0003_tokenproxy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthToken',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auth_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(hash_existing_tokens, migrations.RunPython.noop),
+    ]
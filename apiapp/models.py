@@ -1,9 +1,16 @@
+import hashlib
+import secrets
+from functools import partial
+
 from django.conf import settings
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
 from django.utils.text import slugify
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 from cloudinary.models import CloudinaryField
+from .identifiers import save_with_unique
 # Create your models here.
 
 
@@ -29,28 +36,45 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.email or self.username
 
+
+class AuthToken(models.Model):
+    # API tokens (the "Token <key>" header). Only the SHA-256 of the key is
+    # stored, so the table holds no usable credential; the key itself is
+    # returned once, by issue(), to the login or registration response. A
+    # user gets a token per login, and logout deletes just the one it used.
+    digest = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="auth_tokens", on_delete=models.CASCADE)
+    created = models.DateTimeField(default=timezone.now)
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, user):
+        """Create a token for user; returns (token, key)."""
+        key = secrets.token_hex(20)
+        return cls.objects.create(digest=cls.hash_key(key), user=user), key
+
+    def __str__(self):
+        return f"Token for {self.user_id}"
+
    
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True, blank=True)
     image = CloudinaryField('image', blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
     def save(self, *args, **kwargs):
-
-        if not self.slug:
-            self.slug = slugify(self.name)
-            unique_slug = self.slug
-            counter = 1
-            if Product.objects.filter(slug=unique_slug).exists():
-                unique_slug = f'{self.slug}-{counter}'
-                counter += 1
-            self.slug = unique_slug
-        
-        super().save(*args, **kwargs)
+        if self.slug:
+            super().save(*args, **kwargs)
+        else:
+            save_with_unique(self, "slug", slugify(self.name) or "category", partial(super().save, *args, **kwargs))
 
 
 class Product(models.Model):
@@ -61,22 +85,41 @@ class Product(models.Model):
     image = CloudinaryField('image', blank=True, null=True)
     featured = models.BooleanField(default=False)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, related_name="products",  blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Nearest-price neighbours within a category (similarity.py).
+            models.Index(fields=["category", "price"], name="product_category_price_idx"),
+            # Featured products, paged by id (product_list). Partial, so it
+            # only holds the few featured rows.
+            models.Index(fields=["id"], condition=models.Q(featured=True), name="product_featured_idx"),
+        ]
 
     def __str__(self):
         return self.name
     
     def save(self, *args, **kwargs):
+        if self.slug:
+            super().save(*args, **kwargs)
+        else:
+            save_with_unique(self, "slug", slugify(self.name) or "product", partial(super().save, *args, **kwargs))
+
+
+class SimilarProduct(models.Model):
+    # Precomputed top-K neighbours of a product (see similarity.py), read by
+    # the product detail and similar products endpoints.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="similar_links")
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
 
-        if not self.slug:
-            self.slug = slugify(self.name)
-            unique_slug = self.slug
-            counter = 1
-            if Product.objects.filter(slug=unique_slug).exists():
-                unique_slug = f'{self.slug}-{counter}'
-                counter += 1
-            self.slug = unique_slug
-        
-        super().save(*args, **kwargs)
+    class Meta:
+        unique_together = ["product", "rank"]
+        ordering = ["product", "rank"]
+
+    def __str__(self):
+        return f"{self.product_id} ~ {self.similar_id} ({self.score:.2f})"
 
 
 class Cart(models.Model):
@@ -93,6 +136,9 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="item")
     quantity = models.IntegerField(default=1)
 
+    class Meta:
+        unique_together = ["cart", "product"]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in cart {self.cart.cart_code}"
     
@@ -124,13 +170,44 @@ class Review(models.Model):
     class Meta:
         unique_together = ["user", "product"]
         ordering = ["-created"]
+        indexes = [
+            # A product's reviews, newest first (get_reviews, product detail).
+            models.Index(fields=["product", "-created", "-id"], name="review_product_created_idx"),
+            # Per-product star counts (rebuild_product_ratings).
+            models.Index(fields=["product", "rating"], name="review_product_rating_idx"),
+        ]
 
 
 
 class ProductRating(models.Model):
+    # Materialized per-product review aggregate, kept current with F() deltas
+    # by the Review signals (see signals.py) and rebuilt in bulk by the
+    # rebuild_product_ratings management command.
+    STAR_FIELDS = {
+        1: "one_star",
+        2: "two_star",
+        3: "three_star",
+        4: "four_star",
+        5: "five_star",
+    }
+
     product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='rating')
-    average_rating = models.FloatField(default=0.0)
     total_reviews = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    one_star = models.PositiveIntegerField(default=0)
+    two_star = models.PositiveIntegerField(default=0)
+    three_star = models.PositiveIntegerField(default=0)
+    four_star = models.PositiveIntegerField(default=0)
+    five_star = models.PositiveIntegerField(default=0)
+
+    @property
+    def average_rating(self):
+        if not self.total_reviews:
+            return 0.0
+        return self.rating_sum / self.total_reviews
+
+    def star_count(self, stars):
+        return getattr(self, self.STAR_FIELDS[stars])
 
     def __str__(self):
         return f"{self.product.name} - {self.average_rating} ({self.total_reviews} reviews)"
@@ -145,6 +222,10 @@ class Wishlist(models.Model):
 
     class Meta:
         unique_together = ["user", "product"]
+        indexes = [
+            # A user's wishlist, newest first (my_wishlists).
+            models.Index(fields=["user", "-created", "-id"], name="wishlist_user_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
@@ -160,6 +241,13 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=[("Pending", "Pending"), ("Paid", "Paid")])
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # A customer's orders by case-insensitive email, newest first
+            # (get_orders filters on Upper(customer_email) to use it).
+            models.Index(Upper("customer_email"), models.F("created_at").desc(), models.F("id").desc(), name="order_email_created_idx"),
+        ]
+
     def __str__(self):
         return f"Order {self.stripe_checkout_id} - {self.status}"
     
@@ -168,12 +256,49 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
+    # Price paid per unit, copied from the product at fulfillment time.
+    # Null for orders placed before it was recorded.
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
     def __str__(self):
         return f"Order {self.product.name} - {self.order.stripe_checkout_id}"
     
 
 
+class CoPurchase(models.Model):
+    # Sparse item-item co-occurrence matrix built from order history by
+    # recommendations.py: how many orders contained both products. The
+    # diagonal (product == other) holds how many orders contained the product.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ["product", "other"]
+
+
+class Recommendation(models.Model):
+    # Persisted "frequently bought together" top-N per product. score is the
+    # share of the product's orders that also contained the recommendation.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="recommendations")
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ["product", "rank"]
+        ordering = ["product", "rank"]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} ({self.score:.2f})"
+
+
+class RecommendationWatermark(models.Model):
+    # Highest order id already folded into CoPurchase.
+    last_order_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
 # Newly Added 
 
 class CustomerAddress(models.Model):
@@ -194,4 +319,62 @@ class PaymentRequest(models.Model):
     status = models.CharField(max_length=20, default="Pending")
 
     def __str__(self):
-        return f"{self.cart_code} - {self.status}"
\ No newline at end of file
+        return f"{self.cart_code} - {self.status}"
+
+
+class WebhookEvent(models.Model):
+    # Every inbound payment notification, keyed by the provider's own id (the
+    # Stripe event id, the M-Pesa CheckoutRequestID). The unique key is what
+    # makes a retried delivery a no-op, see webhooks.record_event().
+    #
+    # Each event is also a job for the webhook worker: pending until it has
+    # been processed (done), or until it has failed WEBHOOK_MAX_ATTEMPTS
+    # times (dead).
+    PROVIDER_CHOICES = [
+        ("stripe", "Stripe"),
+        ("mpesa", "M-Pesa"),
+    ]
+    PENDING = "pending"
+    DONE = "done"
+    DEAD = "dead"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (DONE, "Done"),
+        (DEAD, "Dead"),
+    ]
+
+    provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES)
+    event_id = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ["provider", "event_id"]
+        indexes = [
+            models.Index(fields=["status", "run_at"], name="webhook_event_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.event_id}"
+
+    @property
+    def latency(self):
+        """Time from receipt to the end of the last attempt."""
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.received_at
+
+    @property
+    def duration(self):
+        """Time the last attempt took."""
+        if self.finished_at is None or self.started_at is None:
+            return None
+        return self.finished_at - self.started_at
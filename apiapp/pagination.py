@@ -0,0 +1,120 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+
+
+# Keyset ("seek") pagination shared by the list endpoints. A page is fetched
+# by filtering past the last row of the previous page on the ordering columns
+# rather than with OFFSET, so every page costs the same however deep it is.
+# The ordering must end in a unique column (id) to make the cursor exact.
+#
+# Cursors are opaque to clients: urlsafe base64 of the last row's ordering
+# values.
+
+
+def get_page_size(request):
+    try:
+        page_size = int(request.query_params.get("page_size", settings.PAGINATION_PAGE_SIZE))
+    except ValueError:
+        page_size = settings.PAGINATION_PAGE_SIZE
+    return min(max(page_size, 1), settings.PAGINATION_MAX_PAGE_SIZE)
+
+
+def encode_cursor(values):
+    data = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, ValueError):
+        raise NotFound("Invalid cursor")
+    return values
+
+
+def get_cursor(request):
+    """
+    The raw cursor from the query string, validated. Safe to use in cache keys.
+    """
+    cursor = request.query_params.get("cursor")
+    if cursor:
+        decode_cursor(cursor)
+    return cursor
+
+
+def keyset_page(request, queryset, ordering):
+    """
+    Return (rows, next_cursor) for the page of queryset that follows the
+    request's ?cursor=, ordered by ordering, e.g. ("-created", "-id").
+    """
+    page_size = get_page_size(request)
+    fields = [name.lstrip("-") for name in ordering]
+    queryset = queryset.order_by(*ordering)
+
+    cursor = get_cursor(request)
+    if cursor:
+        values = decode_cursor(cursor)
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise NotFound("Invalid cursor")
+        model_fields = [queryset.model._meta.get_field(name) for name in fields]
+        try:
+            values = [field.to_python(value) for field, value in zip(model_fields, values)]
+        except (TypeError, ValidationError):
+            raise NotFound("Invalid cursor")
+        queryset = queryset.filter(seek_filter(ordering, values))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        # Rows are model instances, or dicts from a .values() queryset.
+        values = [last[name] for name in fields] if isinstance(last, dict) else [getattr(last, name) for name in fields]
+        next_cursor = encode_cursor([cursor_value(value) for value in values])
+    return rows, next_cursor
+
+
+def seek_filter(ordering, values):
+    # (a, b) after (x, y) == a > x OR (a = x AND b > y), with < for
+    # descending columns.
+    condition = Q()
+    equal = {}
+    for name, value in zip(ordering, values):
+        field = name.lstrip("-")
+        lookup = "lt" if name.startswith("-") else "gt"
+        condition |= Q(**equal, **{f"{field}__{lookup}": value})
+        equal[field] = value
+    return condition
+
+
+def cursor_value(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def offset_page(request):
+    """
+    (offset, limit) for result sets that can't be seeked by key, such as
+    relevance-ranked search results. The cursor stays opaque either way.
+    """
+    cursor = get_cursor(request)
+    offset = decode_cursor(cursor) if cursor else 0
+    if not isinstance(offset, int) or offset < 0:
+        raise NotFound("Invalid cursor")
+    return offset, get_page_size(request)
+
+
+def next_offset_cursor(offset, limit, rows):
+    return encode_cursor(offset + limit) if len(rows) > limit else None
+
+
+def page_payload(results, next_cursor):
+    return {"results": results, "next": next_cursor}
@@ -0,0 +1,75 @@
+import asyncio
+import re
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .models import PaymentRequest
+
+
+# Payment status push. When a PaymentRequest's status changes, the new
+# status is sent to the channel layer group of its cart_code; the payment
+# status WebSocket (consumers.PaymentStatusConsumer) and the long-poll view
+# (async_views.payment_status_wait) listen on it, so a checkout page waiting on
+# M-Pesa hears about the callback as soon as it is processed instead of
+# polling payment_status.
+#
+# The webhook worker publishes, so in production the channel layer has to be
+# shared between processes (CHANNEL_LAYER_BACKEND, e.g. channels_redis). With
+# the in-memory layer only listeners in the publishing process hear it; the
+# long-poll view and the WebSocket both re-read the status every
+# PAYMENT_STATUS_RECHECK seconds, so they still answer, just later.
+
+FINAL_STATUSES = {"Paid", "Declined"}
+
+
+def group_name(cart_code):
+    # Group names only allow ASCII alphanumerics, hyphens, underscores and
+    # periods.
+    return "payment-status." + re.sub(r"[^\w.-]", "_", cart_code, flags=re.ASCII)[:80]
+
+
+def message(cart_code, status):
+    return {"type": "payment.status", "cart_code": cart_code, "status": status}
+
+
+def publish(cart_code, status):
+    """Tell everyone waiting on cart_code that its payment is now status."""
+    layer = get_channel_layer()
+    if layer is not None:
+        async_to_sync(layer.group_send)(group_name(cart_code), message(cart_code, status))
+
+
+async def current_status(cart_code):
+    return await PaymentRequest.objects.filter(cart_code=cart_code).values_list("status", flat=True).afirst()
+
+
+async def wait_for_status(cart_code, timeout):
+    """
+    The cart's payment status once it is final, or its status after timeout
+    seconds. None if there is no payment request for the cart.
+    """
+    layer = get_channel_layer()
+    channel = await layer.new_channel()
+    await layer.group_add(group_name(cart_code), channel)
+    try:
+        # Subscribed before reading, so a status published in between is
+        # still heard.
+        status = await current_status(cart_code)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while status is not None and status not in FINAL_STATUSES:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                received = await asyncio.wait_for(
+                    layer.receive(channel), min(remaining, settings.PAYMENT_STATUS_RECHECK)
+                )
+                status = received["status"]
+            except asyncio.TimeoutError:
+                status = await current_status(cart_code)
+        return status
+    finally:
+        await layer.group_discard(group_name(cart_code), channel)
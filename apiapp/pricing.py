@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F, IntegerField, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import CartItem
+
+
+# Cart pricing, computed by the database. Every place that shows or charges
+# a cart total goes through these expressions so the serializers, Stripe and
+# M-Pesa all agree to the cent, and each total costs one query at most.
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def line_total(prefix=""):
+    return ExpressionWrapper(F(f"{prefix}quantity") * F(f"{prefix}product__price"), output_field=MONEY)
+
+
+def cart_total_expressions(prefix=""):
+    return {
+        "cart_total": Coalesce(Sum(line_total(prefix)), Value(Decimal("0.00")), output_field=MONEY),
+        "total_quantity": Coalesce(Sum(f"{prefix}quantity"), Value(0), output_field=IntegerField()),
+    }
+
+
+def with_line_totals(cartitems):
+    """Annotate each CartItem with sub_total = quantity * product price."""
+    return cartitems.annotate(sub_total=line_total())
+
+
+def with_cart_totals(carts):
+    """Annotate each Cart with cart_total and total_quantity."""
+    return carts.annotate(**cart_total_expressions("cartitems__"))
+
+
+def cart_totals(cart):
+    """
+    {"cart_total", "total_quantity"} for one cart, from its annotations when
+    it was loaded through with_cart_totals(), otherwise in one aggregate query.
+    """
+    if hasattr(cart, "cart_total"):
+        return {"cart_total": cart.cart_total, "total_quantity": cart.total_quantity}
+    return CartItem.objects.filter(cart=cart).aggregate(**cart_total_expressions())
@@ -0,0 +1,181 @@
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Sum
+from django.utils import timezone
+
+from .models import CoPurchase, Order, OrderItem, Product, Recommendation, RecommendationWatermark
+
+
+# "Frequently bought together" engine.
+#
+# Orders newer than the watermark are streamed in chunks of order ids. Each
+# chunk's (order, product) rows become a sparse order x product incidence
+# matrix B, and its contribution to the co-occurrence matrix C = B^T B is
+# computed with vectorized NumPy pair expansion (no per-order Python loops).
+# The deltas are added onto the persisted CoPurchase rows of the products
+# they touch, and only those products get their top-N recomputed: ranking a
+# product's row by co-occurrence count depends on nothing else, so the
+# incremental result is the same as a full rebuild.
+#
+# Order ids are handed out before their transactions commit, so an order can
+# become visible after a higher id already has. The watermark therefore stops
+# short of the first order placed less than RECOMMENDATIONS_SETTLE_SECONDS
+# ago; those are folded in by a later build, once they've had time to commit.
+# A build holds a lock on the watermark row throughout, so concurrent builds
+# run one after the other instead of counting the same orders twice.
+
+
+def top_n():
+    return settings.RECOMMENDATIONS_TOP_N
+
+
+def co_occurrence(orders, products):
+    """
+    (product, other, count) arrays for C = B^T B over one batch of
+    (order, product) rows, diagonal included.
+    """
+    if not len(orders):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    # An order counts once per product however many lines it has.
+    rows = np.unique(np.stack([orders, products], axis=1), axis=0)
+    orders, products = rows[:, 0], rows[:, 1]
+
+    # rows are sorted by order, so each order is a contiguous group; pair
+    # every row with every row of its group.
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, len(orders)])
+    group = np.repeat(np.arange(len(starts)), sizes)
+    row_size, row_start = sizes[group], starts[group]
+
+    left = np.repeat(np.arange(len(orders)), row_size)
+    first_pair = np.cumsum(row_size) - row_size
+    right = np.repeat(row_start, row_size) + (np.arange(left.size) - np.repeat(first_pair, row_size))
+
+    return sum_pairs(products[left], products[right], np.ones(left.size, dtype=np.int64))
+
+
+def sum_pairs(products, others, counts):
+    pairs, inverse = np.unique(np.stack([products, others], axis=1), axis=0, return_inverse=True)
+    totals = np.bincount(inverse.ravel(), weights=counts, minlength=len(pairs)).astype(np.int64)
+    return pairs[:, 0], pairs[:, 1], totals
+
+
+def top_pairs(products, others, counts, n):
+    """Per product, the n others with the highest count (diagonal excluded)."""
+    keep = products != others
+    products, others, counts = products[keep], others[keep], counts[keep]
+    order = np.lexsort((others, -counts, products))
+    products, others, counts = products[order], others[order], counts[order]
+    starts = np.flatnonzero(np.r_[True, products[1:] != products[:-1]]) if len(products) else np.empty(0, dtype=np.int64)
+    rank = np.arange(len(products)) - np.repeat(starts, np.diff(np.r_[starts, len(products)]))
+    keep = rank < n
+    return products[keep], others[keep], counts[keep], rank[keep]
+
+
+def settled_orders(after_order_id, settle_seconds):
+    """Orders past the watermark, up to the first one that may not have committed yet."""
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    orders = Order.objects.filter(id__gt=after_order_id)
+    first_unsettled = orders.filter(created_at__gt=cutoff).aggregate(id=Min("id"))["id"]
+    return orders if first_unsettled is None else orders.filter(id__lt=first_unsettled)
+
+
+def stream_order_items(after_order_id, chunk_size, settle_seconds):
+    """Yield (last_order_id, orders, products) arrays, chunk_size orders at a time."""
+    orders = settled_orders(after_order_id, settle_seconds)
+    while True:
+        order_ids = list(orders.filter(id__gt=after_order_id).order_by("id").values_list("id", flat=True)[:chunk_size])
+        if not order_ids:
+            return
+        items = OrderItem.objects.filter(order_id__gt=after_order_id, order_id__lte=order_ids[-1]).values_list("order_id", "product_id")
+        rows = np.array(list(items.iterator(chunk_size=10_000)), dtype=np.int64).reshape(-1, 2)
+        yield order_ids[-1], rows[:, 0], rows[:, 1]
+        after_order_id = order_ids[-1]
+
+
+def build(chunk_size=1000, full=False, settle_seconds=None):
+    """
+    Fold settled orders newer than the watermark into CoPurchase and refresh
+    the top-N of every product they touched. Returns (orders_seen_up_to,
+    products_refreshed).
+    """
+    if settle_seconds is None:
+        settle_seconds = settings.RECOMMENDATIONS_SETTLE_SECONDS
+    RecommendationWatermark.objects.get_or_create(pk=1)
+    with transaction.atomic():
+        watermark = RecommendationWatermark.objects.select_for_update().get(pk=1)
+        return fold(watermark, chunk_size, full, settle_seconds)
+
+
+def fold(watermark, chunk_size, full, settle_seconds):
+    """build() itself, with the watermark row locked."""
+    if full:
+        CoPurchase.objects.all().delete()
+        Recommendation.objects.all().delete()
+        watermark.last_order_id = 0
+        watermark.save()
+
+    parts = ([], [], [])
+    last_order_id = watermark.last_order_id
+    for last_order_id, orders, products in stream_order_items(watermark.last_order_id, chunk_size, settle_seconds):
+        for part, values in zip(parts, co_occurrence(orders, products)):
+            part.append(values)
+
+    if not parts[0]:
+        return last_order_id, 0
+    delta = sum_pairs(*(np.concatenate(part) for part in parts))
+    touched = np.unique(delta[0])
+
+    existing = np.array(
+        list(CoPurchase.objects.filter(product_id__in=touched.tolist()).values_list("product_id", "other_id", "count")),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    products, others, counts = sum_pairs(
+        np.r_[existing[:, 0], delta[0]],
+        np.r_[existing[:, 1], delta[1]],
+        np.r_[existing[:, 2], delta[2]],
+    )
+
+    CoPurchase.objects.filter(product_id__in=touched.tolist()).delete()
+    CoPurchase.objects.bulk_create(
+        [CoPurchase(product_id=p, other_id=o, count=c) for p, o, c in zip(products.tolist(), others.tolist(), counts.tolist())],
+        batch_size=5000,
+    )
+
+    diagonal = dict(zip(products[products == others].tolist(), counts[products == others].tolist()))
+    best = top_pairs(products, others, counts, top_n())
+    Recommendation.objects.filter(product_id__in=touched.tolist()).delete()
+    Recommendation.objects.bulk_create(
+        [
+            Recommendation(product_id=p, recommended_id=o, score=c / diagonal[p], rank=r)
+            for p, o, c, r in zip(*(column.tolist() for column in best))
+        ],
+        batch_size=5000,
+    )
+
+    watermark.last_order_id = last_order_id
+    watermark.save()
+
+    return last_order_id, len(touched)
+
+
+def for_cart(product_ids, limit=None):
+    """
+    Products most often bought with any of product_ids, best first, excluding
+    the products themselves. Scores from each cart line are summed.
+    """
+    limit = limit or top_n()
+    ranked = list(
+        Recommendation.objects.filter(product_id__in=product_ids)
+        .exclude(recommended_id__in=product_ids)
+        .values("recommended_id")
+        .annotate(total=Sum("score"))
+        .order_by("-total", "recommended_id")[:limit]
+    )
+    products = Product.objects.in_bulk([row["recommended_id"] for row in ranked])
+    return [(products[row["recommended_id"]], row["total"]) for row in ranked if row["recommended_id"] in products]
@@ -0,0 +1,78 @@
+import codecs
+import io
+
+from cloudinary import CloudinaryResource
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# JSON renderer and parser for REST_FRAMEWORK. With orjson installed the
+# encoding and decoding happen in orjson; without it (or for anything orjson
+# can't do, such as integers past 64 bits or indented output) they fall back
+# to DRF's stdlib-based classes. Either way the rendered bytes are what DRF's
+# JSONRenderer would produce: orjson hands every type it doesn't know, and
+# datetimes, to the same default() the stdlib encoder uses.
+
+# NaN/Infinity aside (orjson writes null, the strict stdlib encoder refuses),
+# the only difference is how some floats are spelled, e.g. 1e16 for 1e+16.
+# When parsing, integers past 64 bits come back as floats.
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+class JSONEncoder(encoders.JSONEncoder):
+    """DRF's encoder, plus Cloudinary resources written the way the serializers write them."""
+
+    def default(self, obj):
+        if isinstance(obj, CloudinaryResource):
+            return obj.get_prep_value() or obj.public_id
+        return super().default(obj)
+
+
+# default() keeps no state, so one instance serves every render.
+encoder = JSONEncoder()
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    encoder_class = JSONEncoder
+    use_orjson = orjson is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # orjson only writes compact UTF-8; indent=N, ?ensure_ascii and the
+        # spaced separators stay with the stdlib encoder.
+        if not self.use_orjson or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping of the JavaScript line separators as DRF.
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+class JSONParser(parsers.JSONParser):
+    renderer_class = JSONRenderer
+    use_orjson = orjson is not None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        if not self.use_orjson or codecs.lookup(encoding).name != "utf-8":
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # Let the stdlib parser have a go, for its ParseError message if
+            # nothing else.
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import consumers
+
+
+websocket_urlpatterns = [
+    path("ws/payment-status/<str:cart_code>/", consumers.PaymentStatusConsumer.as_asgi()),
+]
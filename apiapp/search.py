@@ -0,0 +1,152 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+
+# Product search runs against a ranked inverted index kept next to the
+# product table (see migration 0006):
+#   * PostgreSQL: apiapp_product_search, a weighted tsvector per product
+#     with a GIN index.
+#   * SQLite: apiapp_product_fts, an FTS5 virtual table keyed by product id.
+# Other backends (or SQLite builds without FTS5) fall back to the original
+# icontains scan, still paginated.
+#
+# Name matches outrank category matches, which outrank description matches.
+# The last search term is treated as a prefix so typeahead works.
+
+POSTGRES_TABLE = "apiapp_product_search"
+SQLITE_TABLE = "apiapp_product_fts"
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_index_tables = {}
+
+
+def search_backend():
+    if connection.vendor == "postgresql":
+        return "postgresql"
+    if connection.vendor == "sqlite":
+        name = connection.settings_dict["NAME"]
+        if name not in _index_tables:
+            _index_tables[name] = SQLITE_TABLE in connection.introspection.table_names()
+        if _index_tables[name]:
+            return "sqlite"
+    return None
+
+
+def tokenize(query):
+    return [token.lower() for token in TOKEN_RE.findall(query)]
+
+
+def search_products(query, offset=0, limit=20):
+    """
+    Return up to limit products matching every term in query, most relevant
+    first, skipping the first offset matches.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    backend = search_backend()
+
+    if backend is None:
+        return list(legacy_search_queryset(query).order_by("name", "id")[offset:offset + limit])
+
+    if backend == "postgresql":
+        sql = (
+            f"SELECT product_id FROM {POSTGRES_TABLE}, to_tsquery('simple', %s) query "
+            "WHERE document @@ query "
+            "ORDER BY ts_rank(document, query) DESC, product_id LIMIT %s OFFSET %s"
+        )
+        terms = " & ".join(tokens[:-1] + [f"{tokens[-1]}:*"])
+    else:
+        # bm25() scores are negative; lower is better. Column weights follow
+        # the table's column order: name, category, description.
+        sql = (
+            f"SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s "
+            f"ORDER BY bm25({SQLITE_TABLE}, 10.0, 5.0, 1.0), rowid LIMIT %s OFFSET %s"
+        )
+        terms = " ".join(f'"{token}"' for token in tokens[:-1]) + f' "{tokens[-1]}"*'
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [terms, limit, offset])
+        ids = [row[0] for row in cursor.fetchall()]
+
+    products = Product.objects.in_bulk(ids)
+    return [products[product_id] for product_id in ids if product_id in products]
+
+
+def legacy_search_queryset(query):
+    return Product.objects.filter(Q(name__icontains=query) |
+                                  Q(description__icontains=query) |
+                                  Q(category__name__icontains=query))
+
+
+def index_products(product_ids=None, category_id=None):
+    """
+    (Re)index the given products, every product of a category, or the whole
+    catalog when called with no arguments. One statement either way.
+    """
+    backend = search_backend()
+    if backend is None:
+        return
+
+    where, params = "", []
+    if product_ids is not None:
+        if not product_ids:
+            return
+        where = f"WHERE p.id IN ({', '.join(['%s'] * len(product_ids))})"
+        params = list(product_ids)
+    elif category_id is not None:
+        where = "WHERE p.category_id = %s"
+        params = [category_id]
+
+    source = (
+        "FROM apiapp_product p LEFT JOIN apiapp_category c ON c.id = p.category_id "
+        f"{where}"
+    )
+
+    with connection.cursor() as cursor:
+        if backend == "postgresql":
+            cursor.execute(
+                f"INSERT INTO {POSTGRES_TABLE} (product_id, document) "
+                "SELECT p.id, "
+                "setweight(to_tsvector('simple', coalesce(p.name, '')), 'A') || "
+                "setweight(to_tsvector('simple', coalesce(c.name, '')), 'B') || "
+                "setweight(to_tsvector('simple', coalesce(p.description, '')), 'C') "
+                f"{source} "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                params,
+            )
+        else:
+            cursor.execute(
+                f"DELETE FROM {SQLITE_TABLE} WHERE rowid IN (SELECT p.id {source})",
+                params,
+            )
+            cursor.execute(
+                f"INSERT INTO {SQLITE_TABLE} (rowid, name, category, description) "
+                f"SELECT p.id, p.name, coalesce(c.name, ''), p.description {source}",
+                params,
+            )
+
+
+def remove_products(product_ids):
+    backend = search_backend()
+    if backend is None or not product_ids:
+        return
+
+    table, key = (POSTGRES_TABLE, "product_id") if backend == "postgresql" else (SQLITE_TABLE, "rowid")
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {key} IN ({placeholders})", list(product_ids))
+
+
+def rebuild_index():
+    backend = search_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {POSTGRES_TABLE if backend == 'postgresql' else SQLITE_TABLE}")
+    index_products()
@@ -0,0 +1,150 @@
+import random
+import string
+from io import StringIO
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db.models import Max
+from django.utils.text import slugify
+
+from .models import Cart, CartItem, Category, CustomUser, Order, OrderItem, Product, Review, Wishlist
+
+
+# Synthetic shop data for benchmarks and local load testing. Everything is
+# written with bulk_create in batches, so model signals don't run; the
+# derived tables they would maintain (ratings, search index, similar
+# products, recommendations) are rebuilt in bulk at the end instead.
+#
+# Names continue from the highest existing id, so seeding twice adds to the
+# shop rather than colliding with the first run.
+
+WORDS = (
+    "wireless bluetooth speaker portable charger cable leather wallet cotton shirt "
+    "running shoes kitchen blender stainless steel bottle gaming mouse keyboard monitor "
+    "notebook pencil backpack travel pillow organic coffee green tea face cream vitamin "
+    "smart watch fitness tracker camera lens tripod desk lamp office chair sofa cushion"
+).split()
+
+# Every seeded user can log in with this password.
+SEED_PASSWORD = "seeded-Shopper-2024"
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+
+
+def create(model, objects, batch_size):
+    """bulk_create a generator of unsaved objects in batches; return the new ids."""
+    first = next_id(model)
+    for batch in batched(objects, batch_size):
+        model.objects.bulk_create(batch)
+    return list(model.objects.filter(id__gte=first).order_by("id").values_list("id", flat=True))
+
+
+def unique_pairs(rng, left, right, count):
+    """Up to count distinct (l, r) pairs drawn at random."""
+    count = min(count, len(left) * len(right))
+    pairs = set()
+    while len(pairs) < count:
+        pairs.add((rng.choice(left), rng.choice(right)))
+    return pairs
+
+
+def seed_shop(users=200, categories=10, products=2000, reviews=5000, carts=200, wishlists=1000, orders=1000,
+              batch_size=1000, seed=42, derived=True):
+    """Generate a shop of the given size and return how many rows of each kind were added."""
+    rng = random.Random(seed)
+    password = make_password(SEED_PASSWORD)
+
+    start = next_id(CustomUser)
+    user_ids = create(CustomUser, (
+        CustomUser(username=f"shopper{n}", email=f"shopper{n}@example.com", password=password,
+                   first_name=rng.choice(WORDS).title(), last_name=rng.choice(WORDS).title())
+        for n in range(start, start + users)
+    ), batch_size)
+    emails = dict(CustomUser.objects.filter(id__in=user_ids).values_list("id", "email"))
+
+    start = next_id(Category)
+    category_ids = create(Category, (
+        Category(name=f"{rng.choice(WORDS).title()} {n}", slug=f"category-{n}") for n in range(start, start + categories)
+    ), batch_size)
+
+    def product(n):
+        name = " ".join(rng.sample(WORDS, 3)).title()
+        return Product(
+            name=name,
+            slug=f"{slugify(name)}-{n}",
+            description=" ".join(rng.choices(WORDS, k=30)),
+            price=rng.randint(100, 100_000) / 100,
+            featured=rng.random() < 0.05,
+            category_id=rng.choice(category_ids) if category_ids else None,
+        )
+
+    start = next_id(Product)
+    product_ids = create(Product, (product(n) for n in range(start, start + products)), batch_size)
+    prices = dict(Product.objects.filter(id__in=product_ids).values_list("id", "price"))
+
+    review_count = len(create(Review, (
+        Review(user_id=user_id, product_id=product_id, rating=rng.choices(range(1, 6), weights=(1, 1, 2, 4, 4))[0],
+               review=" ".join(rng.choices(WORDS, k=12)))
+        for user_id, product_id in unique_pairs(rng, user_ids, product_ids, reviews if user_ids and product_ids else 0)
+    ), batch_size))
+
+    wishlist_count = len(create(Wishlist, (
+        Wishlist(user_id=user_id, product_id=product_id)
+        for user_id, product_id in unique_pairs(rng, user_ids, product_ids, wishlists if user_ids and product_ids else 0)
+    ), batch_size))
+
+    cart_ids = create(Cart, (
+        Cart(cart_code="".join(rng.choices(string.ascii_letters + string.digits, k=11))) for _ in range(carts)
+    ), batch_size)
+    cart_item_count = len(create(CartItem, (
+        CartItem(cart_id=cart_id, product_id=product_id, quantity=rng.randint(1, 3))
+        for cart_id in cart_ids
+        for product_id in (rng.sample(product_ids, min(rng.randint(1, 5), len(product_ids))))
+    ), batch_size))
+
+    lines = {}
+    start = next_id(Order)
+    for n in range(start, start + (orders if user_ids and product_ids else 0)):
+        lines[n] = [(product_id, rng.randint(1, 3)) for product_id in rng.sample(product_ids, min(rng.randint(1, 4), len(product_ids)))]
+    order_ids = create(Order, (
+        Order(stripe_checkout_id=f"seed_{n}", amount=sum(prices[p] * q for p, q in items), currency="usd",
+              customer_email=emails[rng.choice(user_ids)], status="Paid")
+        for n, items in lines.items()
+    ), batch_size)
+    order_item_count = len(create(OrderItem, (
+        OrderItem(order_id=order_id, product_id=product_id, quantity=quantity, unit_price=prices[product_id])
+        for order_id, items in zip(order_ids, lines.values())
+        for product_id, quantity in items
+    ), batch_size))
+
+    if derived:
+        rebuild_derived()
+
+    return {
+        "users": len(user_ids),
+        "categories": len(category_ids),
+        "products": len(product_ids),
+        "reviews": review_count,
+        "wishlists": wishlist_count,
+        "carts": len(cart_ids),
+        "cart_items": cart_item_count,
+        "orders": len(order_ids),
+        "order_items": order_item_count,
+    }
+
+
+def rebuild_derived():
+    """Rebuild what the skipped signals and batch jobs would have produced."""
+    for command in ["rebuild_product_ratings", "rebuild_search_index", "rebuild_similar_products"]:
+        call_command(command, stdout=StringIO())
+    # The seeded orders are all committed already.
+    call_command("build_recommendations", settle_seconds=0, stdout=StringIO())
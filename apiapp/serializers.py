@@ -1,13 +1,28 @@
 from rest_framework import serializers 
 from django.contrib.auth import get_user_model
-from .models import Cart, CartItem, CustomerAddress, Order, OrderItem, Product, Category, ProductRating, Review, Wishlist
-from django.contrib.auth import authenticate
+from .models import Cart, CartItem, CustomerAddress, Order, OrderItem, Product, Category, ProductRating, Recommendation, Review, Wishlist
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from .models import CustomUser
+from .hashers import check_unknown_user
+from .identifiers import allocate
+from .pricing import cart_totals
 import re
 
 
+# Number of reviews embedded in a product detail response.
+REVIEWS_PAGE_SIZE = 10
+
+# Histogram field name -> star rating it counts.
+RATING_HISTOGRAM = {
+    "poor_review": 1,
+    "fair_review": 2,
+    "good_review": 3,
+    "very_good_review": 4,
+    "excellent_review": 5,
+}
+
+
 
 class ProductListSerializer(serializers.ModelSerializer):
     class Meta:
@@ -44,7 +59,7 @@ class ProductDetailSerializer(serializers.ModelSerializer):
 
     # Newly Added
 
-    reviews = ReviewSerializer(read_only=True, many=True)
+    reviews = serializers.SerializerMethodField()
     rating = ProductRatingSerializer(read_only=True)
     poor_review = serializers.SerializerMethodField()
     fair_review = serializers.SerializerMethodField()
@@ -63,30 +78,53 @@ class ProductDetailSerializer(serializers.ModelSerializer):
 
     # Newly Added
 
+    def get_reviews(self, product):
+        # views.get_product_detail_queryset() prefetches one page of reviews
+        # (with their users) into `review_page`; fall back to the first page.
+        reviews = getattr(product, "review_page", None)
+        if reviews is None:
+            reviews = product.reviews.select_related("user")[:REVIEWS_PAGE_SIZE]
+        return ReviewSerializer(reviews, many=True).data
+
     def get_similar_products(self, product):
-        products = Product.objects.filter(category=product.category).exclude(id=product.id)
-        serializer = ProductListSerializer(products, many=True)
+        # Precomputed neighbours (similarity.py), prefetched into
+        # `similar_page` by views.get_product_detail_queryset().
+        links = getattr(product, "similar_page", None)
+        if links is None:
+            links = product.similar_links.select_related("similar")
+        serializer = ProductListSerializer([link.similar for link in links], many=True)
         return serializer.data
+
+    def get_rating_histogram(self, product):
+        # The histogram is materialized on the product's ProductRating row,
+        # which get_product_detail_queryset() joins in.
+        try:
+            rating = product.rating
+        except ProductRating.DoesNotExist:
+            return dict.fromkeys(RATING_HISTOGRAM, 0)
+        return {name: rating.star_count(stars) for name, stars in RATING_HISTOGRAM.items()}
     
     def get_poor_review(self, product):
-        poor_review_count = product.reviews.filter(rating=1).count()
-        return poor_review_count
+        return self.get_rating_histogram(product)["poor_review"]
     
     def get_fair_review(self, product):
-        fair_review_count = product.reviews.filter(rating=2).count()
-        return fair_review_count
+        return self.get_rating_histogram(product)["fair_review"]
     
     def get_good_review(self, product):
-        good_review_count = product.reviews.filter(rating=3).count()
-        return good_review_count
+        return self.get_rating_histogram(product)["good_review"]
     
     def get_very_good_review(self, product):
-        very_good_review_count = product.reviews.filter(rating=4).count()
-        return very_good_review_count
+        return self.get_rating_histogram(product)["very_good_review"]
     
     def get_excellent_review(self, product):
-        excellent_review_count = product.reviews.filter(rating=5).count()
-        return excellent_review_count
+        return self.get_rating_histogram(product)["excellent_review"]
+
+
+class RecommendationSerializer(serializers.ModelSerializer):
+    product = ProductListSerializer(source="recommended", read_only=True)
+    class Meta:
+        model = Recommendation
+        fields = ["product", "score"]
 
 
 class CategoryListSerializer(serializers.ModelSerializer):
@@ -95,10 +133,10 @@ class CategoryListSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "image", "slug"]
 
 class CategoryDetailSerializer(serializers.ModelSerializer):
-    products = ProductListSerializer(many=True, read_only=True)
+    # Products are paged separately by views.category_detail.
     class Meta:
         model = Category
-        fields = ["id", "name", "image", "products"]
+        fields = ["id", "name", "image"]
 
 
 
@@ -111,6 +149,9 @@ class CartItemSerializer(serializers.ModelSerializer):
 
     
     def get_sub_total(self, cartitem):
+        # Annotated by pricing.with_line_totals() wherever lines are loaded.
+        if hasattr(cartitem, "sub_total"):
+            return cartitem.sub_total
         total = cartitem.product.price * cartitem.quantity 
         return total
 
@@ -124,11 +165,25 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ["id", "cart_code", "cartitems", "cart_total"]
 
     def get_cart_total(self, cart):
-        items = cart.cartitems.all()
-        total = sum([item.quantity * item.product.price for item in items])
-        return total
+        return cart_totals(cart)["cart_total"]
     
 
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=["add", "set", "remove"])
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, default=1)
+
+    def validate(self, attrs):
+        if attrs["op"] == "add" and attrs["quantity"] < 1:
+            raise serializers.ValidationError("Quantity to add must be at least 1")
+        return attrs
+
+
+class CartOperationsSerializer(serializers.Serializer):
+    cart_code = serializers.CharField(max_length=11)
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+
 class CartStatSerializer(serializers.ModelSerializer): 
     total_quantity = serializers.SerializerMethodField()
     class Meta:
@@ -136,9 +191,7 @@ class CartStatSerializer(serializers.ModelSerializer):
         fields = ["id", "cart_code", "total_quantity"]
 
     def get_total_quantity(self, cart):
-        items = cart.cartitems.all()
-        total = sum([item.quantity for item in items])
-        return total
+        return cart_totals(cart)["total_quantity"]
 
 
 
@@ -184,8 +237,7 @@ class SimpleCartSerializer(serializers.ModelSerializer):
         fields = ["id", "cart_code", "num_of_items"]
 
     def get_num_of_items(self, cart):
-        num_of_items = sum([item.quantity for item in cart.cartitems.all()])
-        return num_of_items
+        return cart_totals(cart)["total_quantity"]
     
 
 
@@ -251,12 +303,10 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
                 base_username = f"user_{validated_data['phone_number'][-4:]}"
             
             # Ensure username is unique
-            username = base_username
-            counter = 1
-            while CustomUser.objects.filter(username=username).exists():
-                username = f"{base_username}_{counter}"
-                counter += 1
-            validated_data['username'] = username
+            validated_data.pop('username', None)
+            return allocate(CustomUser, 'username', base_username,
+                            lambda username: CustomUser.objects.create_user(**validated_data, username=username),
+                            separator='_')
         
         user = CustomUser.objects.create_user(**validated_data)
         return user
@@ -271,28 +321,19 @@ class UserLoginSerializer(serializers.Serializer):
         password = attrs.get('password')
         
         if email_or_phone and password:
-            # Try to find user by email first
-            user = None
-            if '@' in email_or_phone:
-                try:
-                    user = CustomUser.objects.get(email=email_or_phone)
-                except CustomUser.DoesNotExist:
-                    pass
-            else:
-                # Try to find by phone number
-                try:
-                    user = CustomUser.objects.get(phone_number=email_or_phone)
-                except CustomUser.DoesNotExist:
-                    pass
-            
-            if user:
-                # Authenticate using username (since that's what Django expects)
-                user = authenticate(username=user.email, password=password)
-                if user:
-                    if not user.is_active:
-                        raise serializers.ValidationError("User account is disabled")
-                    attrs['user'] = user
-                    return attrs
+            # One fetch, by email or phone number, then check the password on
+            # that row (check_password also upgrades an outdated hash).
+            lookup = 'email' if '@' in email_or_phone else 'phone_number'
+            user = CustomUser.objects.filter(**{lookup: email_or_phone}).first()
+            if user is None:
+                # Verify against a dummy hash anyway, so an unknown account
+                # takes about as long as a wrong password (see hashers.py).
+                check_unknown_user(password)
+            elif user.check_password(password):
+                if not user.is_active:
+                    raise serializers.ValidationError("User account is disabled")
+                attrs['user'] = user
+                return attrs
             
             raise serializers.ValidationError("Invalid credentials")
         else:
@@ -1,36 +1,159 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from django.db.models import Avg
+from django.db.models import F
+from django.utils import timezone
 
 
-from apiapp.models import ProductRating, Review
+from apiapp import authentication, instrumentation, search, similarity
+from apiapp.cache import bump_catalog_version
+from apiapp.models import AuthToken, Cart, CartItem, Category, CustomUser, Product, ProductRating, Review
 
 
-@receiver(post_save, sender=Review)
-def update_product_rating_on_save(sender, instance, **kwargs):
-    product= instance.product
-    reviews = product.reviews.all()
-    total_reviews = reviews.count()
+# ProductRating is a running aggregate: every receiver below applies an
+# atomic F() delta to the product's row instead of rescanning its reviews.
+
+def adjust_product_rating(product_id, rating, delta):
+    changes = {
+        "total_reviews": F("total_reviews") + delta,
+        "rating_sum": F("rating_sum") + delta * rating,
+        ProductRating.STAR_FIELDS[rating]: F(ProductRating.STAR_FIELDS[rating]) + delta,
+    }
+    ProductRating.objects.filter(product_id=product_id).update(**changes)
+
 
+def move_product_rating(product_id, old_rating, new_rating):
+    old_field = ProductRating.STAR_FIELDS[old_rating]
+    new_field = ProductRating.STAR_FIELDS[new_rating]
+    ProductRating.objects.filter(product_id=product_id).update(**{
+        "rating_sum": F("rating_sum") + (new_rating - old_rating),
+        old_field: F(old_field) - 1,
+        new_field: F(new_field) + 1,
+    })
 
-    review_average = reviews.aggregate(Avg('rating'))['rating__avg'] or 0.0
 
-    product_rating, created = ProductRating.objects.get_or_create(product=product)
-    product_rating.average_rating = review_average
-    product_rating.total_reviews = total_reviews
-    product_rating.save()
+@receiver(post_init, sender=Review)
+def remember_saved_rating(sender, instance, **kwargs):
+    # Read straight from __dict__ so deferred loads don't trigger a query.
+    instance._saved_rating = instance.__dict__.get("rating")
+    instance._saved_product_id = instance.__dict__.get("product_id")
+
+
+@receiver(post_save, sender=Review)
+def update_product_rating_on_save(sender, instance, created, **kwargs):
+    rating = int(instance.rating)
+    old_rating = instance._saved_rating
+    old_product_id = instance._saved_product_id
+
+    if created:
+        ProductRating.objects.get_or_create(product_id=instance.product_id)
+        adjust_product_rating(instance.product_id, rating, 1)
+    elif old_product_id != instance.product_id:
+        adjust_product_rating(old_product_id, int(old_rating), -1)
+        ProductRating.objects.get_or_create(product_id=instance.product_id)
+        adjust_product_rating(instance.product_id, rating, 1)
+    elif old_rating is not None and int(old_rating) != rating:
+        move_product_rating(instance.product_id, int(old_rating), rating)
+
+    instance._saved_rating = rating
+    instance._saved_product_id = instance.product_id
 
 
 @receiver(post_delete, sender=Review)
 def update_product_rating_on_delete(sender, instance, **kwargs):
-    product = instance.product 
-    reviews = product.reviews.all()
-    total_reviews = reviews.count() 
+    # Only decrement an existing row: when a product is deleted its rating row
+    # goes with it, and recreating it here would violate the foreign key.
+    if instance._saved_rating is None:
+        return
+    adjust_product_rating(instance._saved_product_id, int(instance._saved_rating), -1)
+
+
+# Catalog cache invalidation: any change to a row that feeds a cached catalog
+# payload moves the catalog to a new version. Review is included because the
+# product detail payload embeds reviews, and the rating deltas above use
+# update(), which sends no ProductRating signals of its own.
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ProductRating)
+@receiver(post_delete, sender=ProductRating)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+# Cart.updated_at is the cart's row version for conditional GETs, so item
+# changes have to move it too.
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def touch_cart(sender, instance, **kwargs):
+    # Nothing to touch when the items are going because the cart is.
+    if isinstance(kwargs.get("origin"), Cart):
+        return
+    Cart.objects.filter(id=instance.cart_id).update(updated_at=timezone.now())
+
+
+# Full-text search index (see search.py). Category names are part of each
+# product's document, so category changes reindex its products.
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.index_products([instance.id])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.id])
+
+
+# Similar products index (see similarity.py); deletions cascade on their own.
+
+@receiver(post_save, sender=Product)
+def refresh_similar_products(sender, instance, raw=False, **kwargs):
+    if not raw:
+        similarity.refresh_product(instance)
+
+
+@receiver(post_save, sender=Category)
+def index_category_products(sender, instance, **kwargs):
+    search.index_products(category_id=instance.id)
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_products(sender, instance, **kwargs):
+    # Deleting a category nulls its products' category with a bulk update,
+    # so note which products to reindex before they lose the link.
+    instance._product_ids = list(instance.products.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def reindex_uncategorized_products(sender, instance, **kwargs):
+    search.index_products(getattr(instance, "_product_ids", []))
+
+
+@receiver(post_save, sender=AuthToken)
+@receiver(post_delete, sender=AuthToken)
+def invalidate_cached_token(sender, instance, created=False, **kwargs):
+    # A brand new token can't have been cached yet.
+    if not created:
+        authentication.invalidate(instance.digest)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_cached_user_tokens(sender, instance, raw=False, **kwargs):
+    # Cached token snapshots carry the user's fields, is_active included.
+    if not raw:
+        for token_digest in AuthToken.objects.filter(user_id=instance.pk).values_list("digest", flat=True):
+            authentication.invalidate(token_digest)
 
-    review_average = reviews.aggregate(Avg("rating"))["rating__avg"] or 0.0
 
+# Every connection (each thread gets its own) reports its queries to the
+# request being measured, if any.
 
-    product_rating, created = ProductRating.objects.get_or_create(product=product)
-    product_rating.average_rating = review_average 
-    product_rating.total_reviews = total_reviews 
-    product_rating.save() 
\ No newline at end of file
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    instrumentation.install(connection)
@@ -0,0 +1,150 @@
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import OrderItem, Product, SimilarProduct
+
+
+# Similar products are scored offline and stored as each product's top-K
+# SimilarProduct rows. A pair scores for
+#   * sharing a category,
+#   * sitting in the same or a nearby price band (bands grow geometrically,
+#     so "nearby" scales with the price), and
+#   * being bought together, from OrderItem co-occurrence.
+# The score is symmetric, which lets a single product's refresh also update
+# the lists it appears in (see refresh_product).
+
+CATEGORY_WEIGHT = 1.0
+PRICE_BAND_WEIGHT = 0.5
+CO_PURCHASE_WEIGHT = 1.0
+PRICE_BAND_RATIO = 1.5
+
+
+def top_k():
+    return settings.SIMILAR_PRODUCTS_K
+
+
+def price_band(price):
+    return math.floor(math.log(max(float(price), 0.01), PRICE_BAND_RATIO))
+
+
+def score(a, b, co_purchases=0):
+    """a and b are (id, category_id, price) tuples."""
+    value = PRICE_BAND_WEIGHT / (1 + abs(price_band(a[2]) - price_band(b[2])))
+    if a[1] is not None and a[1] == b[1]:
+        value += CATEGORY_WEIGHT
+    if co_purchases:
+        value += CO_PURCHASE_WEIGHT * math.log1p(co_purchases)
+    return value
+
+
+def co_purchase_counts(product_id=None):
+    """
+    {product_id: Counter({other_product_id: orders containing both})},
+    for every product or just one.
+    """
+    pairs = OrderItem.objects.filter(order__items__isnull=False)
+    if product_id is not None:
+        pairs = pairs.filter(product_id=product_id)
+    pairs = pairs.values_list("product_id", "order__items__product_id").annotate(orders=Count("order", distinct=True))
+
+    counts = defaultdict(Counter)
+    for product, other, orders in pairs.order_by():
+        if product != other:
+            counts[product][other] = orders
+    return counts
+
+
+def best(product, candidates, co_purchases):
+    scored = sorted(
+        ((score(product, other, co_purchases.get(other[0], 0)), other[0]) for other in candidates if other[0] != product[0]),
+        key=lambda pair: (-pair[0], pair[1]),
+    )
+    return scored[:top_k()]
+
+
+def links_for(product_id, scored):
+    return [
+        SimilarProduct(product_id=product_id, similar_id=similar_id, score=value, rank=rank)
+        for rank, (value, similar_id) in enumerate(scored)
+    ]
+
+
+def rebuild(batch_size=1000):
+    """
+    Recompute every product's neighbours. Candidates are the K nearest-priced
+    products on either side within the same category plus every co-purchased
+    product, so the cost grows with n log n rather than n squared.
+    """
+    k = top_k()
+    products = list(Product.objects.values_list("id", "category_id", "price"))
+    by_id = {product[0]: product for product in products}
+    co_purchases = co_purchase_counts()
+
+    by_category = defaultdict(list)
+    for product in products:
+        by_category[product[1]].append(product)
+
+    links = []
+    for members in by_category.values():
+        members.sort(key=lambda product: (product[2], product[0]))
+        for i, product in enumerate(members):
+            candidates = members[max(i - k, 0):i + k + 1]
+            partners = co_purchases.get(product[0], {})
+            candidates += [by_id[other] for other in partners if other in by_id]
+            links += links_for(product[0], best(product, set(candidates), partners))
+
+    with transaction.atomic():
+        SimilarProduct.objects.all().delete()
+        SimilarProduct.objects.bulk_create(links, batch_size=batch_size)
+    return len(links)
+
+
+def refresh_product(product):
+    """
+    Recompute one product's neighbours and rescore it in every list it is
+    in or now belongs in, in a fixed number of queries. Other lists keep it
+    even if it now scores lower; a better candidate it should give way to is
+    picked up by the next full rebuild.
+    """
+    k = top_k()
+    me = (product.id, product.category_id, product.price)
+    same_category = Product.objects.filter(category_id=product.category_id).exclude(id=product.id)
+    candidates = list(same_category.filter(price__gte=product.price).order_by("price", "id").values_list("id", "category_id", "price")[:k])
+    candidates += list(same_category.filter(price__lt=product.price).order_by("-price", "-id").values_list("id", "category_id", "price")[:k])
+
+    partners = co_purchase_counts(product.id).get(product.id, {})
+    known = {candidate[0] for candidate in candidates}
+    missing = [other for other in partners if other not in known]
+    candidates += list(Product.objects.filter(id__in=missing).values_list("id", "category_id", "price"))
+
+    scored = best(me, candidates, partners)
+
+    with transaction.atomic():
+        SimilarProduct.objects.filter(product_id=product.id).delete()
+
+        # The lists of its new neighbours and of everyone who already lists
+        # it (its old score may be stale if the price or category changed).
+        referrers = SimilarProduct.objects.filter(similar_id=product.id).values("product_id")
+        affected = {similar_id for _, similar_id in scored}
+        other_lists = defaultdict(list)
+        for link in SimilarProduct.objects.filter(Q(product_id__in=affected) | Q(product_id__in=referrers)):
+            affected.add(link.product_id)
+            if link.similar_id != product.id:
+                other_lists[link.product_id].append((link.score, link.similar_id))
+
+        by_id = {candidate[0]: candidate for candidate in candidates}
+        missing = [other for other in affected if other not in by_id]
+        by_id.update((other[0], other) for other in Product.objects.filter(id__in=missing).values_list("id", "category_id", "price"))
+
+        links = links_for(product.id, scored)
+        for other_id in affected:
+            value = score(me, by_id[other_id], partners.get(other_id, 0))
+            merged = sorted(other_lists[other_id] + [(value, product.id)], key=lambda pair: (-pair[0], pair[1]))
+            links += links_for(other_id, merged[:k])
+
+        SimilarProduct.objects.filter(product_id__in=affected).delete()
+        SimilarProduct.objects.bulk_create(links)
@@ -1,3 +1,1409 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import hmac
+import importlib
+import json
+import logging
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from cloudinary import CloudinaryResource
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from django.utils.functional import lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from .daraja import DarajaClient
+from .fast_serializers import FastListSerializer
+from .fake_daraja import FakeDaraja
+from .fulfillment import fulfill_cart
+from .models import AuthToken, Cart, CartItem, Category, CoPurchase, CustomerAddress, CustomUser, Order, OrderItem, PaymentRequest, Product, ProductRating, Recommendation, RecommendationWatermark, Review, SimilarProduct, WebhookEvent, Wishlist
+from .pricing import cart_totals, with_cart_totals
+from .routing import websocket_urlpatterns
+from .serializers import REVIEWS_PAGE_SIZE, CategoryListSerializer, OrderSerializer, ProductDetailSerializer, ProductListSerializer, WishlistSerializer
+from . import async_views, authentication, benchmark, hashers, identifiers, instrumentation, log, middleware, renderers, seeding, urls, views, webhooks
 
 # Create your tests here.
+
+
+class ProductDetailQueryCountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Electronics")
+        cls.product = Product.objects.create(name="Phone", description="A phone", price="199.99", category=cls.category)
+        Product.objects.create(name="Tablet", description="A tablet", price="299.99", category=cls.category)
+        Product.objects.create(name="Laptop", description="A laptop", price="999.99", category=cls.category)
+
+    def setUp(self):
+        cache.clear()
+
+    def add_reviews(self, count, start=0):
+        for i in range(start, start + count):
+            user = CustomUser.objects.create(username=f"user{i}", email=f"user{i}@example.com")
+            Review.objects.create(product=self.product, user=user, rating=i % 5 + 1, review="Nice")
+
+    def test_product_detail_query_count_is_constant(self):
+        self.add_reviews(3)
+        with self.assertNumQueries(3):
+            small = self.client.get(reverse("product_detail", args=[self.product.slug]))
+
+        self.add_reviews(37, start=3)
+        with self.assertNumQueries(3):
+            large = self.client.get(reverse("product_detail", args=[self.product.slug]))
+
+        self.assertEqual(len(small.json()["reviews"]), 3)
+        self.assertEqual(len(large.json()["reviews"]), REVIEWS_PAGE_SIZE)
+        self.assertEqual(len(large.json()["similar_products"]), 2)
+        self.assertEqual(large.json()["poor_review"], 8)
+        self.assertEqual(large.json()["excellent_review"], 8)
+
+    def test_similar_products_query_count_is_constant(self):
+        self.add_reviews(25)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("similar-products", args=[self.product.id]))
+        self.assertEqual(len(response.json()["similar_products"]), 2)
+
+    def test_reviews_are_paged(self):
+        self.add_reviews(REVIEWS_PAGE_SIZE + 3)
+        response = self.client.get(reverse("product_detail", args=[self.product.slug]), {"reviews_page": 2})
+        self.assertEqual(len(response.json()["reviews"]), 3)
+
+
+class ProductRatingHistogramTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Kettle", description="A kettle", price="25.00")
+        cls.users = [CustomUser.objects.create(username=f"rater{i}", email=f"rater{i}@example.com") for i in range(3)]
+
+    def rating(self):
+        return ProductRating.objects.get(product=self.product)
+
+    def test_review_signals_apply_deltas(self):
+        first = Review.objects.create(product=self.product, user=self.users[0], rating=5, review="Great")
+        Review.objects.create(product=self.product, user=self.users[1], rating=3, review="Fine")
+        rating = self.rating()
+        self.assertEqual((rating.total_reviews, rating.rating_sum, rating.five_star, rating.three_star), (2, 8, 1, 1))
+        self.assertEqual(rating.average_rating, 4.0)
+
+        first.rating = 1
+        first.save()
+        rating = self.rating()
+        self.assertEqual((rating.total_reviews, rating.rating_sum, rating.five_star, rating.one_star), (2, 4, 0, 1))
+
+        Review.objects.get(id=first.id).delete()
+        rating = self.rating()
+        self.assertEqual((rating.total_reviews, rating.rating_sum, rating.one_star, rating.three_star), (1, 3, 0, 1))
+
+    def test_rebuild_command_matches_signals(self):
+        for stars, user in zip([2, 4, 4], self.users):
+            Review.objects.create(product=self.product, user=user, rating=stars, review="Ok")
+        expected = self.rating()
+        ProductRating.objects.all().delete()
+
+        call_command("rebuild_product_ratings", stdout=StringIO())
+        rebuilt = self.rating()
+        for field in ["total_reviews", "rating_sum", *ProductRating.STAR_FIELDS.values()]:
+            self.assertEqual(getattr(rebuilt, field), getattr(expected, field))
+
+    def test_get_rating_reads_materialized_row(self):
+        Review.objects.create(product=self.product, user=self.users[0], rating=4, review="Good")
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("get-product-rating", args=[self.product.id]))
+        self.assertEqual(response.data["total_reviews"], 1)
+        self.assertEqual(response.data["breakdown"]["very_good"], 1)
+
+    def test_deleting_product_cascades_cleanly(self):
+        Review.objects.create(product=self.product, user=self.users[0], rating=4, review="Good")
+        self.product.delete()
+        self.assertFalse(ProductRating.objects.exists())
+
+
+class CatalogCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Books")
+        cls.product = Product.objects.create(name="Novel", description="A novel", price="12.00", featured=True, category=cls.category)
+
+    def setUp(self):
+        location = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location},
+        }))
+
+    def test_catalog_endpoints_are_served_from_cache(self):
+        urls = [
+            reverse("product_list"),
+            reverse("category_list"),
+            reverse("category_detail", args=[self.category.slug]),
+            reverse("product_detail", args=[self.product.slug]),
+        ]
+        for url in urls:
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(first.content, second.content)
+
+    def test_catalog_changes_bump_the_version(self):
+        self.client.get(reverse("product_list"))
+        Product.objects.create(name="Atlas", description="An atlas", price="30.00", featured=True)
+        response = self.client.get(reverse("product_list"))
+        self.assertEqual(len(response.json()["results"]), 2)
+
+        self.category.name = "Rare books"
+        self.category.save()
+        response = self.client.get(reverse("category_list"))
+        self.assertEqual(response.json()[0]["name"], "Rare books")
+
+    def test_per_process_cache_backend_is_not_used(self):
+        # Another worker's LocMem would never hear about a catalog change.
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            self.client.get(reverse("product_list"))
+            Product.objects.filter(pk=self.product.pk).update(name="Epic")
+            response = self.client.get(reverse("product_list"))
+        self.assertEqual(response.json()["results"][0]["name"], "Epic")
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Lamp", description="A lamp", price="40.00", featured=True)
+        cls.cart = Cart.objects.create(cart_code="abc123")
+        CartItem.objects.create(cart=cls.cart, product=cls.product, quantity=2)
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_revalidates(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        self.assertIn("Last-Modified", response.headers)
+
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        return etag
+
+    def test_product_list_revalidates(self):
+        etag = self.assert_revalidates(reverse("product_list"))
+        self.product.price = "45.00"
+        self.product.save()
+        response = self.client.get(reverse("product_list"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cart_reads_revalidate_until_items_change(self):
+        url = reverse("get_cart", args=[self.cart.cart_code])
+        etag = self.assert_revalidates(url)
+        stat_etag = self.assert_revalidates(reverse("get_cart_stat"), {"cart_code": self.cart.cart_code})
+
+        item = CartItem.objects.get(cart=self.cart)
+        item.quantity = 3
+        item.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        response = self.client.get(reverse("get_cart_stat"), {"cart_code": self.cart.cart_code}, HTTP_IF_NONE_MATCH=stat_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_validators_follow_changes_from_other_processes(self):
+        # An update() fires no signals, like a change made by another worker;
+        # with a per-process cache the validators still come from the database.
+        etag = self.assert_revalidates(reverse("product_list"))
+        Product.objects.filter(pk=self.product.pk).update(price="45.00", updated_at=timezone.now())
+        response = self.client.get(reverse("product_list"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_cart_is_not_conditional(self):
+        response = self.client.get(reverse("get_cart", args=["missing"]), HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Audio")
+        cls.by_name = Product.objects.create(name="Wireless Speaker", description="Loud", price="50.00")
+        cls.by_description = Product.objects.create(name="Dock", description="Charges a wireless speaker", price="20.00")
+        cls.by_category = Product.objects.create(name="Cable", description="Plain", price="5.00", category=cls.category)
+
+    def search(self, query, **params):
+        response = self.client.get(reverse("search"), {"query": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.data["results"]]
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.search("wireless speaker"), [self.by_name.id, self.by_description.id])
+
+    def test_last_term_matches_as_prefix(self):
+        self.assertEqual(self.search("wirel"), [self.by_name.id, self.by_description.id])
+
+    def test_results_are_paginated(self):
+        response = self.client.get(reverse("search"), {"query": "wireless", "page_size": 1})
+        self.assertEqual(self.search("wireless", page_size=1, cursor=response.data["next"]), [self.by_description.id])
+
+    def test_index_follows_product_and_category_changes(self):
+        self.assertEqual(self.search("audio"), [self.by_category.id])
+        self.category.name = "Sound"
+        self.category.save()
+        self.assertEqual(self.search("audio"), [])
+        self.assertEqual(self.search("sound"), [self.by_category.id])
+
+        self.by_name.delete()
+        self.assertEqual(self.search("wireless"), [self.by_description.id])
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Garden")
+        cls.products = [
+            Product.objects.create(name=f"Plant {i}", description="Green", price="3.00", featured=True, category=cls.category)
+            for i in range(5)
+        ]
+        cls.user = CustomUser.objects.create(username="gardener", email="gardener@example.com")
+        for product in cls.products:
+            Review.objects.create(product=product, user=cls.user, rating=4, review="Grows well")
+
+    def setUp(self):
+        cache.clear()
+
+    def collect(self, url, key=None, **params):
+        ids, cursor = [], None
+        while True:
+            query = {**params, "page_size": 2, **({"cursor": cursor} if cursor else {})}
+            page = self.client.get(url, query).json()
+            if key:
+                page = page[key]
+            self.assertLessEqual(len(page["results"]), 2)
+            ids += [row["id"] for row in page["results"]]
+            cursor = page["next"]
+            if cursor is None:
+                return ids
+
+    def test_product_list_pages_through_everything(self):
+        self.assertEqual(self.collect(reverse("product_list")), [p.id for p in self.products])
+
+    def test_category_detail_pages_its_products(self):
+        url = reverse("category_detail", args=[self.category.slug])
+        self.assertEqual(self.collect(url, key="products"), [p.id for p in self.products])
+        self.assertEqual(self.client.get(url).json()["name"], "Garden")
+
+    def test_reviews_page_newest_first(self):
+        ids = []
+        for product in self.products:
+            ids += self.collect(reverse("get_reviews", args=[product.id]))
+        self.assertEqual(len(ids), 5)
+
+    def test_wishlists_page_by_created(self):
+        for product in self.products:
+            Wishlist.objects.create(user=self.user, product=product)
+        ids = self.collect(reverse("my_wishlists"), email=self.user.email)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse("product_list"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(SIMILAR_PRODUCTS_K=2)
+class SimilarProductsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shoes = Category.objects.create(name="Shoes")
+        cls.hats = Category.objects.create(name="Hats")
+        cls.runner = Product.objects.create(name="Runner", description="Shoe", price="80.00", category=cls.shoes)
+        cls.trainer = Product.objects.create(name="Trainer", description="Shoe", price="85.00", category=cls.shoes)
+        cls.boot = Product.objects.create(name="Boot", description="Shoe", price="400.00", category=cls.shoes)
+        cls.cap = Product.objects.create(name="Cap", description="Hat", price="15.00", category=cls.hats)
+
+    def similar_ids(self, product):
+        return list(SimilarProduct.objects.filter(product=product).values_list("similar_id", flat=True))
+
+    def test_saves_keep_neighbours_ranked(self):
+        self.assertEqual(self.similar_ids(self.runner), [self.trainer.id, self.boot.id])
+        self.assertEqual(self.similar_ids(self.trainer), [self.runner.id, self.boot.id])
+
+    @override_settings(SIMILAR_PRODUCTS_K=1)
+    def test_saving_keeps_other_lists_intact(self):
+        call_command("rebuild_similar_products", stdout=StringIO())
+        self.assertEqual(self.similar_ids(self.boot), [self.trainer.id])
+
+        # Trainer's own top 1 is Runner, but Boot still lists Trainer.
+        self.trainer.save()
+        self.assertEqual(self.similar_ids(self.trainer), [self.runner.id])
+        self.assertEqual(self.similar_ids(self.boot), [self.trainer.id])
+
+        # A new neighbour takes its place where it scores higher.
+        twin = Product.objects.create(name="Boot 2", description="Shoe", price="400.00", category=self.shoes)
+        self.assertEqual(self.similar_ids(self.boot), [twin.id])
+        self.assertEqual(self.similar_ids(twin), [self.boot.id])
+
+    def test_rebuild_scores_co_purchases(self):
+        for i in range(5):
+            order = Order.objects.create(stripe_checkout_id=f"cs_{i}", amount="95.00", currency="usd", customer_email="a@example.com", status="Paid")
+            OrderItem.objects.create(order=order, product=self.runner)
+            OrderItem.objects.create(order=order, product=self.cap)
+
+        call_command("rebuild_similar_products", stdout=StringIO())
+        self.assertEqual(self.similar_ids(self.runner), [self.cap.id, self.trainer.id])
+        self.assertEqual(self.similar_ids(self.cap)[0], self.runner.id)
+
+    def test_detail_reads_precomputed_neighbours(self):
+        cache.clear()
+        response = self.client.get(reverse("similar-products", args=[self.runner.id]))
+        self.assertEqual([p["id"] for p in response.json()["similar_products"]], [self.trainer.id, self.boot.id])
+
+
+@override_settings(RECOMMENDATIONS_SETTLE_SECONDS=0)
+class RecommendationEngineTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pen, cls.ink, cls.paper, cls.desk = [
+            Product.objects.create(name=name, description=name, price="10.00") for name in ["Pen", "Ink", "Paper", "Desk"]
+        ]
+
+    def order(self, *products):
+        order = Order.objects.create(stripe_checkout_id=f"cs_{Order.objects.count()}", amount="10.00", currency="usd", customer_email="b@example.com", status="Paid")
+        for product in products:
+            OrderItem.objects.create(order=order, product=product)
+
+    def recommended(self, product):
+        return list(Recommendation.objects.filter(product=product).values_list("recommended_id", "score"))
+
+    def test_incremental_build_matches_full_rebuild(self):
+        self.order(self.pen, self.ink)
+        self.order(self.pen, self.ink, self.pen)
+        self.order(self.pen, self.paper)
+        call_command("build_recommendations", chunk_size=2, stdout=StringIO())
+
+        self.order(self.paper, self.desk)
+        self.order(self.pen, self.paper)
+        self.order(self.pen, self.paper)
+        call_command("build_recommendations", chunk_size=2, stdout=StringIO())
+        incremental = {p.id: self.recommended(p) for p in [self.pen, self.ink, self.paper, self.desk]}
+        pairs = set(CoPurchase.objects.values_list("product_id", "other_id", "count"))
+
+        call_command("build_recommendations", full=True, stdout=StringIO())
+        self.assertEqual(incremental, {p.id: self.recommended(p) for p in [self.pen, self.ink, self.paper, self.desk]})
+        self.assertEqual(pairs, set(CoPurchase.objects.values_list("product_id", "other_id", "count")))
+
+        self.assertEqual(incremental[self.pen.id], [(self.paper.id, 0.6), (self.ink.id, 0.4)])
+        self.assertIn((self.pen.id, self.pen.id, 5), pairs)
+
+    @override_settings(RECOMMENDATIONS_SETTLE_SECONDS=60)
+    def test_recent_orders_wait_for_a_later_build(self):
+        self.order(self.pen, self.ink)
+        self.order(self.pen, self.paper)
+        self.order(self.ink, self.paper)
+        first, late, last = Order.objects.order_by("id")
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        # The middle order's transaction hasn't had time to commit, so the
+        # build stops short of it even though a later order is settled.
+        Order.objects.filter(pk__in=[first.pk, last.pk]).update(created_at=an_hour_ago)
+        call_command("build_recommendations", stdout=StringIO())
+        self.assertEqual(RecommendationWatermark.objects.get().last_order_id, first.id)
+        self.assertEqual(self.recommended(self.pen), [(self.ink.id, 1.0)])
+
+        Order.objects.filter(pk=late.pk).update(created_at=an_hour_ago)
+        call_command("build_recommendations", stdout=StringIO())
+        self.assertEqual(RecommendationWatermark.objects.get().last_order_id, last.id)
+        self.assertEqual(self.recommended(self.pen), [(self.ink.id, 0.5), (self.paper.id, 0.5)])
+
+    def test_endpoints(self):
+        self.order(self.pen, self.ink)
+        self.order(self.paper, self.ink)
+        self.order(self.paper, self.desk)
+        call_command("build_recommendations", stdout=StringIO())
+
+        response = self.client.get(reverse("product-recommendations", args=[self.ink.id]))
+        self.assertEqual([row["product"]["id"] for row in response.data], [self.pen.id, self.paper.id])
+
+        cart = Cart.objects.create(cart_code="rec1")
+        CartItem.objects.create(cart=cart, product=self.ink)
+        CartItem.objects.create(cart=cart, product=self.paper)
+        response = self.client.get(reverse("cart-recommendations", args=["rec1"]))
+        self.assertEqual([row["product"]["id"] for row in response.data], [self.pen.id, self.desk.id])
+
+
+class CartMutationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [Product.objects.create(name=f"Snack {i}", description="Tasty", price="2.50") for i in range(4)]
+
+    def quantities(self, cart_code):
+        return dict(CartItem.objects.filter(cart__cart_code=cart_code).values_list("product_id", "quantity"))
+
+    def test_add_to_cart_increments(self):
+        url = reverse("add_to_cart")
+        self.client.post(url, {"cart_code": "c1", "product_id": self.products[0].id}, content_type="application/json")
+        response = self.client.post(url, {"cart_code": "c1", "product_id": self.products[0].id, "quantity": 2}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["cartitems"][0]["quantity"], 3)
+
+    def test_batch_operations_apply_atomically(self):
+        ops = [{"op": "add", "product_id": p.id, "quantity": 2} for p in self.products]
+        self.client.post(reverse("update_cart"), {"cart_code": "c2", "operations": ops}, content_type="application/json")
+
+        ops = [
+            {"op": "add", "product_id": self.products[0].id, "quantity": 1},
+            {"op": "set", "product_id": self.products[1].id, "quantity": 5},
+            {"op": "set", "product_id": self.products[2].id, "quantity": 0},
+            {"op": "remove", "product_id": self.products[3].id},
+        ]
+        response = self.client.post(reverse("update_cart"), {"cart_code": "c2", "operations": ops}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities("c2"), {self.products[0].id: 3, self.products[1].id: 5})
+        self.assertEqual(response.json()["cart_total"], 20.0)
+
+    def test_unknown_product_rejects_whole_batch(self):
+        ops = [{"op": "add", "product_id": self.products[0].id}, {"op": "add", "product_id": 999999}]
+        response = self.client.post(reverse("update_cart"), {"cart_code": "c3", "operations": ops}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities("c3"), {})
+
+    def test_cart_response_query_count_is_constant(self):
+        url = reverse("get_cart", args=["c4"])
+        self.client.post(reverse("update_cart"), {"cart_code": "c4", "operations": [{"op": "add", "product_id": self.products[0].id}]}, content_type="application/json")
+        with self.assertNumQueries(3):
+            self.client.get(url)
+        ops = [{"op": "add", "product_id": p.id} for p in self.products]
+        self.client.post(reverse("update_cart"), {"cart_code": "c4", "operations": ops}, content_type="application/json")
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+
+class CartPricingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cart = Cart.objects.create(cart_code="price1")
+        for i, price in enumerate(["19.99", "0.10", "250.00"]):
+            product = Product.objects.create(name=f"Item {i}", description="Item", price=price)
+            CartItem.objects.create(cart=cls.cart, product=product, quantity=i + 1)
+
+    def test_totals_are_computed_in_one_query(self):
+        with self.assertNumQueries(1):
+            totals = cart_totals(self.cart)
+        self.assertEqual(totals, {"cart_total": Decimal("770.19"), "total_quantity": 6})
+
+        cart = with_cart_totals(Cart.objects.all()).get(id=self.cart.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(cart_totals(cart), totals)
+
+    def test_every_cart_view_agrees(self):
+        cart = self.client.get(reverse("get_cart", args=["price1"])).json()
+        self.assertEqual(cart["cart_total"], 770.19)
+        self.assertEqual([line["sub_total"] for line in cart["cartitems"]], [19.99, 0.2, 750.0])
+
+        with self.assertNumQueries(2):
+            stat = self.client.get(reverse("get_cart_stat"), {"cart_code": "price1"}).json()
+        self.assertEqual(stat["num_of_items"], 6)
+
+    def test_empty_cart_totals_are_zero(self):
+        empty = Cart.objects.create(cart_code="price2")
+        self.assertEqual(cart_totals(empty), {"cart_total": Decimal("0.00"), "total_quantity": 0})
+
+
+class FulfillmentTests(TestCase):
+
+    def make_cart(self, cart_code, lines):
+        cart = Cart.objects.create(cart_code=cart_code)
+        for i in range(lines):
+            product = Product.objects.create(name=f"{cart_code} {i}", description="Item", price=Decimal("10.00") + i)
+            CartItem.objects.create(cart=cart, product=product, quantity=i + 1)
+        return cart
+
+    def fulfill(self, cart_code):
+        return fulfill_cart(cart_code, checkout_id=f"cs_{cart_code}", amount=100, currency="usd", customer_email="a@example.com")
+
+    def test_order_copies_cart_with_unit_prices(self):
+        self.make_cart("ful1", 3)
+        order = self.fulfill("ful1")
+
+        items = list(order.items.order_by("quantity").values_list("quantity", "unit_price"))
+        self.assertEqual(items, [(1, Decimal("10.00")), (2, Decimal("11.00")), (3, Decimal("12.00"))])
+        self.assertEqual(order.status, "Paid")
+        self.assertFalse(Cart.objects.filter(cart_code="ful1").exists())
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        self.make_cart("ful2", 2)
+        self.make_cart("ful3", 20)
+        with CaptureQueriesContext(connection) as small:
+            self.fulfill("ful2")
+        with CaptureQueriesContext(connection) as large:
+            self.fulfill("ful3")
+        self.assertEqual(len(small), len(large))
+
+    def test_failure_leaves_cart_untouched(self):
+        self.make_cart("ful4", 2)
+        Order.objects.create(stripe_checkout_id="cs_ful4", amount=1, currency="usd", customer_email="a@example.com")
+        with self.assertRaises(IntegrityError):
+            self.fulfill("ful4")
+        self.assertEqual(CartItem.objects.filter(cart__cart_code="ful4").count(), 2)
+        self.assertEqual(OrderItem.objects.count(), 0)
+
+    def test_mpesa_callback_fulfills_cart(self):
+        self.make_cart("ful5", 2)
+        PaymentRequest.objects.create(cart_code="ful5", email="m@example.com")
+        body = {"Body": {"stkCallback": {"ResultCode": 0, "AccountReference": "ful5", "CheckoutRequestID": "ws_CO_ful5"}}}
+        self.client.post(reverse("mpesa_callback"), body, content_type="application/json")
+        webhooks.run_pending()
+
+        order = Order.objects.get(customer_email="m@example.com")
+        self.assertEqual(order.amount, Decimal("32.00"))
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(PaymentRequest.objects.get(cart_code="ful5").status, "Paid")
+
+
+class WebhookIdempotencyTests(TestCase):
+    secret = "whsec_test"
+
+    def setUp(self):
+        for cart_code in ["hook1", "hook2"]:
+            cart = Cart.objects.create(cart_code=cart_code)
+            product = Product.objects.create(name=cart_code, description="Item", price="5.00")
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+
+    def post_stripe_event(self, event):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(self.secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+        with mock.patch.object(views, "endpoint_secret", self.secret):
+            return self.client.post(
+                reverse("webhook"), payload, content_type="application/json",
+                HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+            )
+
+    def test_stripe_retry_fulfills_once(self):
+        session = {
+            "id": "cs_hook1", "object": "checkout.session", "amount_total": 1000, "currency": "usd",
+            "customer_email": "s@example.com", "metadata": {"cart_code": "hook1"},
+        }
+        event = {"id": "evt_1", "object": "event", "type": "checkout.session.completed", "data": {"object": session}}
+        for _ in range(2):
+            self.assertEqual(self.post_stripe_event(event).status_code, 200)
+        self.assertEqual(Order.objects.count(), 0)
+        webhooks.run_pending()
+
+        self.assertEqual(Order.objects.filter(stripe_checkout_id="cs_hook1").count(), 1)
+        self.assertEqual(WebhookEvent.objects.get(provider="stripe").event_id, "evt_1")
+
+    def test_mpesa_retry_fulfills_once(self):
+        PaymentRequest.objects.create(cart_code="hook2", email="m@example.com")
+        body = {"Body": {"stkCallback": {"ResultCode": 0, "AccountReference": "hook2", "CheckoutRequestID": "ws_CO_1"}}}
+        for _ in range(2):
+            response = self.client.post(reverse("mpesa_callback"), body, content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+        webhooks.run_pending()
+
+        order = Order.objects.get()
+        self.assertEqual(order.stripe_checkout_id, "ws_CO_1")
+        self.assertEqual(order.items.count(), 1)
+
+    def test_failed_event_is_retried_with_backoff(self):
+        # No PaymentRequest yet, so the first attempt fails.
+        body = {"Body": {"stkCallback": {"ResultCode": 0, "AccountReference": "hook2", "CheckoutRequestID": "ws_CO_2"}}}
+        self.client.post(reverse("mpesa_callback"), body, content_type="application/json")
+        event, = webhooks.run_pending()
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.PENDING, 1))
+        self.assertIn("DoesNotExist", event.last_error)
+        self.assertEqual(Order.objects.count(), 0)
+
+        # Not due again until the backoff has passed.
+        self.assertEqual(webhooks.run_pending(), [])
+        PaymentRequest.objects.create(cart_code="hook2", email="m@example.com")
+        WebhookEvent.objects.update(run_at=timezone.now())
+        event, = webhooks.run_pending()
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.DONE, 2))
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertGreaterEqual(event.latency, event.duration)
+
+    @override_settings(WEBHOOK_MAX_ATTEMPTS=2, WEBHOOK_RETRY_DELAY=10, WEBHOOK_RETRY_MAX_DELAY=15)
+    def test_event_is_dead_lettered_after_max_attempts(self):
+        self.assertEqual([webhooks.retry_delay(n).total_seconds() for n in (1, 2, 3)], [10, 15, 15])
+
+        body = {"Body": {"stkCallback": {"ResultCode": 0, "AccountReference": "missing", "CheckoutRequestID": "ws_CO_3"}}}
+        self.client.post(reverse("mpesa_callback"), body, content_type="application/json")
+        for _ in range(2):
+            WebhookEvent.objects.update(run_at=timezone.now())
+            webhooks.run_pending()
+
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.DEAD, 2))
+        WebhookEvent.objects.update(run_at=timezone.now())
+        self.assertEqual(webhooks.run_pending(), [])
+
+    def test_worker_command_drains_queue(self):
+        PaymentRequest.objects.create(cart_code="hook2", email="m@example.com")
+        body = {"Body": {"stkCallback": {"ResultCode": 0, "AccountReference": "hook2", "CheckoutRequestID": "ws_CO_4"}}}
+        self.client.post(reverse("mpesa_callback"), body, content_type="application/json")
+
+        out = StringIO()
+        call_command("run_webhook_worker", "--once", stdout=out)
+        self.assertIn("Processed 1 events: 1 done", out.getvalue())
+        self.assertEqual(PaymentRequest.objects.get(cart_code="hook2").status, "Paid")
+
+    def test_first_attempt_runs_inline_after_commit(self):
+        PaymentRequest.objects.create(cart_code="hook2", email="m@example.com")
+        body = {"Body": {"stkCallback": {"ResultCode": 0, "AccountReference": "hook2", "CheckoutRequestID": "ws_CO_5"}}}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("mpesa_callback"), body, content_type="application/json")
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.PENDING)
+
+        body["Body"]["stkCallback"]["CheckoutRequestID"] = "ws_CO_6"
+        with override_settings(WEBHOOK_INLINE=True), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("mpesa_callback"), body, content_type="application/json")
+        # Only the new event; the older one is left to the worker.
+        self.assertEqual(WebhookEvent.objects.get(event_id="ws_CO_6").status, WebhookEvent.DONE)
+        self.assertEqual(WebhookEvent.objects.get(event_id="ws_CO_5").status, WebhookEvent.PENDING)
+        self.assertEqual(PaymentRequest.objects.get(cart_code="hook2").status, "Paid")
+
+
+class DarajaClientTests(TestCase):
+
+    def setUp(self):
+        self.daraja = FakeDaraja()
+        self.daraja.__enter__()
+        self.addCleanup(self.daraja.__exit__)
+
+    def client_for(self, **kwargs):
+        return DarajaClient("key", "secret", "174379", "passkey", "https://shop.example/cb", base_url=self.daraja.url, **kwargs)
+
+    def test_token_and_connection_are_reused(self):
+        client = self.client_for()
+        for _ in range(3):
+            self.assertEqual(client.stk_push("254700000000", 10, "cart1", "Payment").status_code, 200)
+
+        self.assertEqual(self.daraja.token_requests, 1)
+        self.assertEqual(self.daraja.connections, 1)
+        self.assertEqual(self.daraja.stk_pushes[0]["AccountReference"], "cart1")
+
+    def test_token_is_refreshed_before_it_expires(self):
+        self.daraja.expires_in = 120
+        client = self.client_for()
+        with mock.patch("apiapp.daraja.time.monotonic", return_value=1000):
+            client.access_token()
+        with mock.patch("apiapp.daraja.time.monotonic", return_value=1059):
+            client.access_token()
+        self.assertEqual(self.daraja.token_requests, 1)
+        with mock.patch("apiapp.daraja.time.monotonic", return_value=1060):
+            client.access_token()
+        self.assertEqual(self.daraja.token_requests, 2)
+
+    def test_revoked_token_is_replaced(self):
+        client = self.client_for()
+        client.access_token()
+        self.daraja.revoke_token()
+        self.assertEqual(client.stk_push("254700000000", 10, "cart1", "Payment").status_code, 200)
+        self.assertEqual(self.daraja.token_requests, 2)
+
+    def test_lipa_na_mpesa_view(self):
+        cart = Cart.objects.create(cart_code="mpesa1")
+        CartItem.objects.create(cart=cart, product=Product.objects.create(name="Item", description="Item", price="2.00"), quantity=1)
+        with override_settings(MPESA_BASE_URL=self.daraja.url, MPESA_SHORTCODE="174379", MPESA_PASSKEY="passkey",
+                               MPESA_CONSUMER_KEY="key", MPESA_CONSUMER_SECRET="secret"):
+            for _ in range(2):
+                response = self.client.post(reverse("lipa_na_mpesa"), {"phone": "254700000000", "cart_code": "mpesa1", "email": "m@example.com"})
+                self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.daraja.token_requests, 1)
+        self.assertEqual(self.daraja.stk_pushes[0]["Amount"], 280)
+        self.assertEqual(PaymentRequest.objects.get(cart_code="mpesa1").email, "m@example.com")
+
+
+class AsyncPaymentViewTests(TestCase):
+
+    def setUp(self):
+        self.daraja = FakeDaraja()
+        self.daraja.__enter__()
+        self.addCleanup(self.daraja.__exit__)
+        cart = Cart.objects.create(cart_code="async1")
+        CartItem.objects.create(cart=cart, product=Product.objects.create(name="Item", description="Item", price="2.50"), quantity=2)
+
+    async def test_concurrent_stk_pushes_share_token_and_pool(self):
+        with override_settings(MPESA_BASE_URL=self.daraja.url, MPESA_SHORTCODE="174379", MPESA_PASSKEY="passkey",
+                               MPESA_CONSUMER_KEY="key", MPESA_CONSUMER_SECRET="secret", PAYMENT_MAX_CONCURRENCY=4):
+            body = {"phone": "254700000000", "cart_code": "async1", "email": "m@example.com"}
+            responses = await asyncio.gather(*(
+                self.async_client.post(reverse("lipa_na_mpesa_async"), body, content_type="application/json")
+                for _ in range(12)
+            ))
+
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual(self.daraja.token_requests, 1)
+        self.assertEqual(len(self.daraja.stk_pushes), 12)
+        self.assertLessEqual(self.daraja.connections, 4)
+        self.assertEqual(self.daraja.stk_pushes[0]["Amount"], 700)
+
+    async def test_stk_push_rejects_unknown_cart(self):
+        body = {"phone": "254700000000", "cart_code": "nope", "email": "m@example.com"}
+        response = await self.async_client.post(reverse("lipa_na_mpesa_async"), body, content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+
+    async def test_checkout_session(self):
+        create = mock.AsyncMock(return_value={"id": "cs_async", "url": "https://checkout.stripe.com/x"})
+        with mock.patch.object(async_views, "get_stripe_client") as get_client:
+            get_client.return_value.checkout.sessions.create_async = create
+            response = await self.async_client.post(
+                reverse("create_checkout_session_async"), {"cart_code": "async1", "email": "s@example.com"},
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.json(), {"data": {"id": "cs_async", "url": "https://checkout.stripe.com/x"}})
+        params = create.call_args.kwargs["params"]
+        self.assertEqual(params["metadata"], {"cart_code": "async1"})
+        self.assertEqual([line["quantity"] for line in params["line_items"]], [2, 1])
+
+    def test_middleware_chain_stays_async(self):
+        from django.core.handlers.asgi import ASGIHandler
+
+        # Django logs "... adapted." for every sync-only middleware it wraps.
+        with self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler()
+
+    async def test_static_files_in_async_mode(self):
+        async def view(request):
+            return HttpResponse("view")
+
+        static = middleware.WhiteNoiseMiddleware(view)
+        static.add_file_to_dictionary("/static/app.css", __file__)
+        static.autorefresh = False
+
+        response = await static(RequestFactory().get("/static/app.css"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content)[:6], b"import")
+        self.assertEqual((await static(RequestFactory().get("/api/"))).content, b"view")
+
+
+class PaymentStatusPushTests(TransactionTestCase):
+    # The long-poll view reads the status from its own thread, so the test
+    # data has to be committed.
+
+    def setUp(self):
+        cart = Cart.objects.create(cart_code="push1")
+        CartItem.objects.create(cart=cart, product=Product.objects.create(name="Item", description="Item", price="2.00"), quantity=1)
+        PaymentRequest.objects.create(cart_code="push1", email="m@example.com")
+
+    def process_callback(self, result_code):
+        body = {"Body": {"stkCallback": {"ResultCode": result_code, "AccountReference": "push1", "CheckoutRequestID": "ws_CO_push"}}}
+        self.client.post(reverse("mpesa_callback"), body, content_type="application/json")
+        webhooks.run_pending()
+
+    async def test_websocket_hears_callback(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/payment-status/push1/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(await communicator.receive_json_from(), {"cart_code": "push1", "status": "Pending"})
+
+        await sync_to_async(self.process_callback)(0)
+        self.assertEqual(await communicator.receive_json_from(), {"cart_code": "push1", "status": "Paid"})
+        self.assertEqual((await communicator.receive_output())["type"], "websocket.close")
+
+    @override_settings(PAYMENT_STATUS_RECHECK=0.05)
+    async def test_websocket_rechecks_without_channel_layer_message(self):
+        # As when the webhook worker publishes to another process's in-memory layer.
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/payment-status/push1/")
+        await communicator.connect()
+        self.assertEqual(await communicator.receive_json_from(), {"cart_code": "push1", "status": "Pending"})
+
+        await PaymentRequest.objects.filter(cart_code="push1").aupdate(status="Paid")
+        self.assertEqual(await communicator.receive_json_from(timeout=2), {"cart_code": "push1", "status": "Paid"})
+        self.assertEqual((await communicator.receive_output())["type"], "websocket.close")
+
+    async def test_websocket_closes_for_unknown_cart(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/payment-status/nope/")
+        await communicator.connect()
+        self.assertEqual(await communicator.receive_json_from(), {"cart_code": "nope", "status": "NotFound"})
+        self.assertEqual((await communicator.receive_output())["type"], "websocket.close")
+
+    @override_settings(PAYMENT_STATUS_RECHECK=0.05, PAYMENT_STATUS_SOCKET_TIMEOUT=0.2)
+    async def test_websocket_gives_up_after_timeout(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/payment-status/push1/")
+        await communicator.connect()
+        self.assertEqual(await communicator.receive_json_from(), {"cart_code": "push1", "status": "Pending"})
+        self.assertEqual((await communicator.receive_output(timeout=2))["type"], "websocket.close")
+
+    async def test_long_poll_answers_when_status_changes(self):
+        waiting = asyncio.ensure_future(self.async_client.get(reverse("payment_status_wait"), {"cart_code": "push1", "timeout": 10}))
+        await asyncio.sleep(0.1)
+        self.assertFalse(waiting.done())
+
+        # Off the thread-sensitive executor, which the pending request holds.
+        await sync_to_async(self.process_callback, thread_sensitive=False)(1032)
+        response = await asyncio.wait_for(waiting, 2)
+        self.assertEqual(response.json(), {"status": "Declined"})
+
+    async def test_long_poll_times_out_with_current_status(self):
+        response = await self.async_client.get(reverse("payment_status_wait"), {"cart_code": "push1", "timeout": 0})
+        self.assertEqual(response.json(), {"status": "Pending"})
+        response = await self.async_client.get(reverse("payment_status_wait"), {"cart_code": "nope"})
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PAYMENT_STATUS_WAIT_TIMEOUT=0.1, PAYMENT_STATUS_RECHECK=0.05)
+    async def test_long_poll_ignores_non_finite_timeout(self):
+        for timeout in ["nan", "inf", "-inf"]:
+            response = await asyncio.wait_for(
+                self.async_client.get(reverse("payment_status_wait"), {"cart_code": "push1", "timeout": timeout}), 2
+            )
+            self.assertEqual(response.json(), {"status": "Pending"})
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every query the hot endpoints run against a seeded catalogue
+    and fail on any full table scan, so a dropped index or a filter that
+    stops matching one shows up here.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        products = Product.objects.bulk_create(
+            Product(name=f"Product {i}", slug=f"product-{i}", description="Item", price=i % 500 + 1, featured=i % 50 == 0)
+            for i in range(3000)
+        )
+        users = CustomUser.objects.bulk_create(
+            CustomUser(username=f"user{i}", email=f"user{i}@example.com", password="!") for i in range(300)
+        )
+        Review.objects.bulk_create(
+            Review(product=products[(i * 7 + j) % len(products)], user=user, rating=j % 5 + 1, review="Fine")
+            for i, user in enumerate(users) for j in range(20)
+        )
+        Wishlist.objects.bulk_create(
+            Wishlist(user=user, product=products[(i * 11 + j) % len(products)]) for i, user in enumerate(users) for j in range(10)
+        )
+        CustomerAddress.objects.bulk_create(CustomerAddress(customer=user, city="Nairobi") for user in users)
+        orders = Order.objects.bulk_create(
+            Order(stripe_checkout_id=f"cs_{i}", amount=10, currency="usd", customer_email=f"User{i % 300}@Example.com", status="Paid")
+            for i in range(3000)
+        )
+        OrderItem.objects.bulk_create(OrderItem(order=order, product=products[i], quantity=1) for i, order in enumerate(orders))
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        cache.clear()
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("EXPLAIN " + sql)
+                return [row[0].strip() for row in cursor.fetchall() if "Seq Scan" in row[0]]
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            return [row[-1] for row in cursor.fetchall() if re.fullmatch(r"SCAN (TABLE )?\w+( AS \w+)?", row[-1])]
+
+    def assertNoFullScans(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        selects = [query["sql"] for query in queries if query["sql"].startswith("SELECT")]
+        self.assertTrue(selects)
+        for sql in selects:
+            with self.subTest(url=url, sql=sql):
+                self.assertEqual(self.full_scans(sql), [])
+
+    def test_product_list(self):
+        self.assertNoFullScans(reverse("product_list"))
+
+    def test_reviews(self):
+        product_id = Review.objects.values_list("product_id", flat=True).first()
+        self.assertNoFullScans(reverse("get_reviews", args=[product_id]))
+
+    def test_orders_by_email(self):
+        self.assertNoFullScans(reverse("get_orders"), {"email": "user7@example.com"})
+
+    def test_wishlists_and_address_by_email(self):
+        self.assertNoFullScans(reverse("my_wishlists"), {"email": "user7@example.com"})
+        self.assertNoFullScans(reverse("get_address"), {"email": "user7@example.com"})
+
+
+class ApiBenchmarkTests(TestCase):
+    def test_seed_shop(self):
+        counts = seeding.seed_shop(users=5, categories=2, products=20, reviews=30, carts=4, wishlists=10, orders=6)
+
+        self.assertEqual(counts["users"], 5)
+        self.assertEqual(counts["reviews"], Review.objects.count())
+        self.assertEqual(counts["order_items"], OrderItem.objects.filter(unit_price__isnull=False).count())
+        self.assertEqual(ProductRating.objects.count(), Review.objects.values("product").distinct().count())
+        self.assertTrue(CustomUser.objects.get(email="shopper1@example.com").check_password(seeding.SEED_PASSWORD))
+
+    def test_every_route_is_measured(self):
+        seeding.seed_shop(users=10, categories=2, products=20, reviews=30, carts=6, wishlists=10, orders=6)
+
+        report = benchmark.run(iterations=2)
+
+        self.assertEqual(set(report["endpoints"]), {pattern.name for pattern in urls.urlpatterns})
+        for name, result in report["endpoints"].items():
+            with self.subTest(name=name):
+                if "skipped" in result:
+                    self.assertEqual(result["skipped"], "calls Stripe")
+                    continue
+                self.assertEqual([code for code in result["status_codes"] if code >= "500"], [])
+                self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        instrumentation.registry.clear()
+        category = Category.objects.create(name="Kitchen", slug="kitchen")
+        for i in range(3):
+            Product.objects.create(name=f"Pan {i}", slug=f"pan-{i}", price=10, category=category)
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("product_list"))
+
+        timing = re.fullmatch(
+            r'db;dur=[\d.]+;desc="(\d+) queries", serialize;dur=[\d.]+, total;dur=[\d.]+', response["Server-Timing"]
+        )
+        self.assertIsNotNone(timing)
+        self.assertEqual(int(timing.group(1)), len(queries))
+
+    def test_structured_log_line(self):
+        with self.assertLogs("apiapp.requests", "DEBUG") as logs:
+            self.client.get(reverse("product_list"))
+
+        record = logs.records[0]
+        self.assertEqual((record.view, record.method, record.status_code), ("product_list", "GET", 200))
+        self.assertGreater(record.queries, 0)
+
+    def test_metrics_endpoint(self):
+        for _ in range(3):
+            self.client.get(reverse("product_list"))
+        self.client.get(reverse("product_detail", args=["pan-0"]))
+
+        body = self.client.get(reverse("metrics")).content.decode()
+
+        self.assertIn('apiapp_request_duration_seconds_count{view="product_list"} 3', body)
+        self.assertIn('apiapp_request_queries{view="product_list",quantile="0.95"}', body)
+        self.assertIn('apiapp_request_duration_seconds_count{view="product_detail"} 1', body)
+        self.assertIn('apiapp_request_errors_total{view="product_list"} 0', body)
+
+    def test_async_mode(self):
+        async def view(request):
+            def query():
+                # A thread of its own, so a connection of its own.
+                try:
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                finally:
+                    connection.close()
+
+            await sync_to_async(query, thread_sensitive=False)()
+            return HttpResponse("ok")
+
+        middleware = instrumentation.RequestMetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get("/"))
+
+        self.assertIn('desc="1 queries"', response["Server-Timing"])
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_measured(self):
+        response = self.client.get(reverse("product_list"))
+
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(instrumentation.registry.views, {})
+
+    @override_settings(METRICS_TOKEN="scrape-me")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape-me")
+        self.assertEqual(response.status_code, 200)
+
+
+class LoggingTests(TestCase):
+    callback = {"Body": {"stkCallback": {
+        "ResultCode": 0, "CheckoutRequestID": "ws_CO_1",
+        "CallbackMetadata": {"Item": [{"Name": "Amount", "Value": 140}, {"Name": "PhoneNumber", "Value": 254700000000}]},
+    }}}
+
+    def record(self, **extra):
+        record = logging.makeLogRecord({"name": "apiapp.views", "levelname": "INFO", "msg": "M-Pesa callback received"})
+        for key, value in extra.items():
+            setattr(record, key, value)
+        return record
+
+    def test_redaction(self):
+        record = self.record(payload={"email": "a@example.com", "password": "hunter22", "cart_code": "abc", **self.callback}, token="secret")
+        log.RedactFilter().filter(record)
+
+        self.assertEqual(record.token, log.MASK)
+        self.assertEqual((record.payload["email"], record.payload["password"], record.payload["cart_code"]), (log.MASK, log.MASK, "abc"))
+        items = record.payload["Body"]["stkCallback"]["CallbackMetadata"]["Item"]
+        self.assertEqual(items, [{"Name": "Amount", "Value": 140}, {"Name": "PhoneNumber", "Value": log.MASK}])
+        # The caller's data is left alone.
+        self.assertEqual(self.callback["Body"]["stkCallback"]["CallbackMetadata"]["Item"][1]["Value"], 254700000000)
+
+    def test_json_lines_written_off_thread(self):
+        threads = []
+
+        class Formatter(log.JsonFormatter):
+            def format(self, record):
+                threads.append(threading.current_thread())
+                return super().format(record)
+
+        stream = StringIO()
+        handler = log.BackgroundStreamHandler(stream)
+        handler.setFormatter(Formatter())
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            handler.handle(logging.makeLogRecord({
+                "name": "apiapp.views", "levelno": logging.ERROR, "levelname": "ERROR", "msg": "failed %s",
+                "args": ("hard",), "exc_info": sys.exc_info(), "cart_code": "abc",
+            }))
+        handler.close()
+
+        entry = json.loads(stream.getvalue())
+        self.assertEqual((entry["level"], entry["message"], entry["cart_code"]), ("ERROR", "failed hard", "abc"))
+        self.assertIn("ZeroDivisionError", entry["exception"])
+        self.assertNotEqual(threads, [threading.current_thread()])
+
+    def test_views_log_instead_of_printing(self):
+        with mock.patch("builtins.print") as printed, self.assertLogs("apiapp.views", "INFO") as logs:
+            self.client.post(reverse("mpesa_callback"), self.callback, content_type="application/json")
+
+        printed.assert_not_called()
+        self.assertEqual(logs.records[0].payload["Body"]["stkCallback"]["CheckoutRequestID"], "ws_CO_1")
+
+
+class TokenAuthCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.local_cache.clear()
+        response = self.client.post(reverse("register"), {
+            "email": "cached@example.com", "password": "Cached-pass-2024", "password_confirm": "Cached-pass-2024",
+        }, content_type="application/json")
+        self.key = response.json()["token"]
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {self.key}"}
+
+    def profile(self):
+        return self.client.get(reverse("profile"), **self.auth)
+
+    def test_cached_requests_skip_the_database(self):
+        self.profile()
+        with self.assertNumQueries(0):
+            response = self.profile()
+
+        self.assertEqual(response.json()["email"], "cached@example.com")
+
+    def test_caches_hold_token_digests_only(self):
+        self.profile()
+        self.profile()
+
+        self.assertIn(authentication.digest(self.key), authentication.local_cache.entries)
+        self.assertFalse(any(self.key in str(key) for key in authentication.local_cache.entries))
+        self.assertNotIn("password", authentication.local_cache.get(authentication.digest(self.key))["user"])
+
+    def test_per_process_cache_backend_is_not_used(self):
+        # LocMem can't be invalidated from another process, so only the
+        # short-lived LRU holds snapshots.
+        self.profile()
+        self.profile()
+
+        self.assertIsNone(authentication.shared_cache())
+        self.assertIsNone(cache.get(authentication.cache_key(authentication.digest(self.key))))
+        expires, _ = authentication.local_cache.entries[authentication.digest(self.key)]
+        self.assertLessEqual(expires - time.monotonic(), 30)
+
+    def test_shared_cache_backend(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location},
+        }):
+            self.profile()
+            shared_key = authentication.cache_key(authentication.digest(self.key))
+            self.assertIsNotNone(cache.get(shared_key))
+
+            # Another process: nothing in its LRU, the snapshot comes from the shared cache.
+            authentication.local_cache.clear()
+            with self.assertNumQueries(0):
+                self.assertEqual(self.profile().status_code, 200)
+
+            self.assertEqual(self.client.post(reverse("logout"), **self.auth).status_code, 200)
+            self.assertEqual(cache.get(shared_key), authentication.TOMBSTONE)
+            authentication.local_cache.clear()
+            self.assertEqual(self.profile().status_code, 401)
+
+    def test_logout_revokes_cached_token(self):
+        self.profile()
+        self.profile()
+
+        self.assertEqual(self.client.post(reverse("logout"), **self.auth).status_code, 200)
+        self.assertEqual(self.profile().status_code, 401)
+
+    def test_deactivation_revokes_cached_token(self):
+        self.profile()
+        self.profile()
+
+        user = CustomUser.objects.get(email="cached@example.com")
+        user.is_active = False
+        user.save()
+
+        self.assertEqual(self.profile().status_code, 401)
+
+    def test_saving_cached_user_keeps_password(self):
+        self.profile()
+        self.profile()
+
+        response = self.client.post(reverse("complete-profile"), {"phone_number": "+254700000001"}, **self.auth)
+
+        self.assertEqual(response.status_code, 200)
+        user = CustomUser.objects.get(email="cached@example.com")
+        self.assertEqual(user.phone_number, "+254700000001")
+        self.assertTrue(user.check_password("Cached-pass-2024"))
+        self.assertEqual(self.profile().json()["phone_number"], "+254700000001")
+
+    def test_tokens_are_stored_hashed(self):
+        token = AuthToken.objects.get()
+        self.assertEqual(token.digest, authentication.digest(self.key))
+        self.assertNotEqual(token.digest, self.key)
+
+    def test_each_login_gets_its_own_token(self):
+        response = self.client.post(reverse("login"), {
+            "email_or_phone": "cached@example.com", "password": "Cached-pass-2024",
+        }, content_type="application/json")
+        other = {"HTTP_AUTHORIZATION": f"Token {response.json()['token']}"}
+
+        self.assertEqual(self.client.post(reverse("logout"), **self.auth).status_code, 200)
+        self.assertEqual(self.profile().status_code, 401)
+        self.assertEqual(self.client.get(reverse("profile"), **other).status_code, 200)
+
+    def test_migration_hashes_existing_tokens(self):
+        migration = importlib.import_module("apiapp.migrations.0014_authtoken")
+        key = "0123456789abcdef0123456789abcdef01234567"
+        Token.objects.create(user=CustomUser.objects.get(email="cached@example.com"), key=key)
+
+        migration.hash_existing_tokens(apps, None)
+
+        self.assertFalse(Token.objects.exists())
+        self.assertEqual(self.client.get(reverse("profile"), HTTP_AUTHORIZATION=f"Token {key}").status_code, 200)
+
+    @override_settings(AUTH_TOKEN_LOCAL_SIZE=2)
+    def test_local_cache_is_bounded(self):
+        for n in range(3):
+            authentication.local_cache.set(n, n, 60)
+
+        self.assertEqual(list(authentication.local_cache.entries), [1, 2])
+
+
+class LoginPipelineTests(TestCase):
+    password = "Login-pipeline-2024"
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="login", email="login@example.com", phone_number="+254700000002", password=self.password
+        )
+
+    def login(self, email_or_phone, password=None):
+        return self.client.post(reverse("login"), {
+            "email_or_phone": email_or_phone, "password": password or self.password,
+        }, content_type="application/json")
+
+    def test_single_user_fetch(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.login("+254700000002")
+
+        self.assertEqual(response.status_code, 200)
+        user_selects = [q for q in queries if q["sql"].startswith("SELECT") and 'FROM "apiapp_customuser"' in q["sql"]]
+        self.assertEqual(len(user_selects), 1)
+
+    def test_new_passwords_use_the_configured_hasher(self):
+        self.assertTrue(self.user.password.startswith("argon2$argon2id$"))
+        self.assertIn("m=19456,t=2,p=1", self.user.password)
+
+    def test_unknown_accounts_verify_with_the_default_hasher(self):
+        with mock.patch("django.contrib.auth.hashers.check_password", wraps=check_password) as checked:
+            self.assertEqual(self.login("nobody@example.com").status_code, 401)
+
+        encoded = checked.call_args.args[1]
+        self.assertEqual(identify_hasher(encoded).algorithm, "argon2")
+        self.assertFalse(identify_hasher(encoded).must_update(encoded))
+        with override_settings(PASSWORD_HASHERS=["apiapp.hashers.BCryptSHA256PasswordHasher"]):
+            self.assertEqual(identify_hasher(hashers.dummy_hash(tuple(settings.PASSWORD_HASHERS))).algorithm, "bcrypt_sha256")
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(password=make_password(self.password, hasher="pbkdf2_sha256"))
+
+        self.assertEqual(self.login("login@example.com").status_code, 200)
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("argon2$"))
+        self.assertEqual(self.login("login@example.com").status_code, 200)
+
+    def test_rejections(self):
+        self.assertEqual(self.login("login@example.com", "Wrong-password-1").status_code, 401)
+        self.assertEqual(self.login("nobody@example.com").status_code, 401)
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.login("login@example.com")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()["errors"]["non_field_errors"], ["User account is disabled"])
+
+
+class UniqueIdentifierTests(TestCase):
+    def register(self, email):
+        return self.client.post(reverse("register"), {
+            "email": email, "password": "Unique-name-2024", "password_confirm": "Unique-name-2024",
+        }, content_type="application/json")
+
+    def test_next_free(self):
+        self.assertEqual(identifiers.next_free("pan", set()), "pan")
+        self.assertEqual(identifiers.next_free("pan", {"pan", "pan-1", "pan-3", "pan-lid", "pan-2x"}), "pan-2")
+        self.assertEqual(identifiers.next_free("pan", {"pan"}, "_"), "pan_1")
+        self.assertEqual(identifiers.next_free("abcdef", {"abcdef"}, max_length=6), "abcd-1")
+
+    def test_usernames_in_one_lookup(self):
+        for domain in ["one", "two", "three"]:
+            self.assertEqual(self.register(f"jane@{domain}.example.com").status_code, 201)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.register("jane@four.example.com").status_code, 201)
+
+        usernames = CustomUser.objects.filter(email__startswith="jane@").order_by("id").values_list("username", flat=True)
+        self.assertEqual(list(usernames), ["jane", "jane_1", "jane_2", "jane_3"])
+        lookups = [q for q in queries if q["sql"].startswith("SELECT") and '"apiapp_customuser"."username"' in q["sql"].split("WHERE")[-1]]
+        self.assertEqual(len(lookups), 1)
+
+    def test_slugs(self):
+        Product.objects.create(name="Shoes", price=10)
+        category = Category.objects.create(name="Shoes")
+        products = [Product.objects.create(name="Shoes", price=10) for _ in range(2)]
+
+        # Category slugs are unique among categories, not products.
+        self.assertEqual(category.slug, "shoes")
+        self.assertEqual(Category.objects.create(name="Shoes").slug, "shoes-1")
+        self.assertEqual([product.slug for product in products], ["shoes-1", "shoes-2"])
+
+    def test_slugs_at_max_length(self):
+        # SlugField max_length is 50: suffixed slugs are cut short to fit.
+        slugs = [Product.objects.create(name="x" * 60, price=10).slug for _ in range(12)]
+        self.assertEqual(slugs[:3], ["x" * 50, "x" * 48 + "-1", "x" * 48 + "-2"])
+        self.assertEqual(slugs[-1], "x" * 47 + "-11")
+        self.assertEqual(len(set(slugs)), 12)
+
+    def test_retries_when_the_value_is_taken_meanwhile(self):
+        Product.objects.create(name="Kettle", price=10)
+        stale = mock.patch.object(identifiers, "taken_values", side_effect=[set(), {"kettle"}])
+
+        with stale:
+            product = Product.objects.create(name="Kettle", price=12)
+
+        self.assertEqual(product.slug, "kettle-1")
+
+
+class FastSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Kitchen", image="image/upload/v12/kitchen.jpg")
+        Category.objects.create(name="Garden")
+        cls.products = [
+            Product.objects.create(name="Pan", price=Decimal("12.50"), category=cls.category, featured=True),
+            Product.objects.create(name="Pot", price=20, image="sample.jpg", featured=True),
+            Product.objects.create(name="Lid", price=3, image="image/upload/v12/lid.jpg", category=cls.category),
+        ]
+        cls.user = CustomUser.objects.create_user(username="fast", email="fast@example.com", password="!", first_name="F", last_name="S")
+        for product in cls.products:
+            Wishlist.objects.create(user=cls.user, product=product)
+        for n in range(3):
+            order = Order.objects.create(stripe_checkout_id=f"cs_fast{n}", amount=10, currency="usd", customer_email="fast@example.com", status="Paid")
+            for product in cls.products[:n]:
+                OrderItem.objects.create(order=order, product=product, quantity=n)
+
+    def assertSameBytes(self, serializer_class, queryset):
+        fast = FastListSerializer(serializer_class)
+        expected = JSONRenderer().render(serializer_class(queryset.order_by("pk"), many=True).data)
+        self.assertEqual(JSONRenderer().render(fast.data(fast.rows(queryset.order_by("pk")))), expected)
+
+    def test_matches_drf_output(self):
+        self.assertSameBytes(ProductListSerializer, Product.objects.all())
+        self.assertSameBytes(CategoryListSerializer, Category.objects.all())
+        self.assertSameBytes(OrderSerializer, Order.objects.all())
+        self.assertSameBytes(WishlistSerializer, Wishlist.objects.all())
+
+    def test_orders_in_two_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("get_orders"), {"email": "FAST@example.com"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([len(order["items"]) for order in response.json()["results"]], [2, 1, 0])
+        self.assertEqual(len(queries), 2)
+
+    def test_unsupported_fields_fail_at_compile_time(self):
+        with self.assertRaises(TypeError):
+            FastListSerializer(ProductDetailSerializer).writer
+
+
+class JSONRendererTests(TestCase):
+    def payload(self):
+        return {
+            "price": Decimal("12.50"),
+            "created": datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            "day": date(2024, 5, 1),
+            "id": uuid.UUID(int=7),
+            "label": lazy(lambda: "Rafiki \u2028 café", str)(),
+            "image": CloudinaryResource("x", type="upload", resource_type="image", version="12", format="jpg"),
+            "counts": {1: 2},
+            "big": 2 ** 70,
+            "items": [None, True, 1.5],
+        }
+
+    def render(self, use_orjson, **kwargs):
+        renderer = renderers.JSONRenderer()
+        renderer.use_orjson = use_orjson
+        return renderer.render(self.payload(), **kwargs)
+
+    def test_same_bytes_with_and_without_orjson(self):
+        expected = self.render(False)
+        self.assertEqual(self.render(True), expected)
+        self.assertEqual(json.loads(expected)["image"], "image/upload/v12/x.jpg")
+        self.assertIn(b'"created":"2024-05-01T12:30:15.123456Z"', expected)
+        self.assertIn(b"\\u2028", expected)
+
+        # Indented output goes through the stdlib encoder.
+        indented = self.render(True, accepted_media_type="application/json; indent=4")
+        self.assertEqual(indented, self.render(False, accepted_media_type="application/json; indent=4"))
+
+    def test_parser(self):
+        for use_orjson in (True, False):
+            parser = renderers.JSONParser()
+            parser.use_orjson = use_orjson
+            self.assertEqual(parser.parse(BytesIO('{"q": "café", "n": [1, 2.5]}'.encode())), {"q": "café", "n": [1, 2.5]})
+            with self.assertRaises(ParseError):
+                parser.parse(BytesIO(b'{"q": NaN}'))
+
+    def test_api_uses_it(self):
+        response = self.client.post(reverse("login"), '{"email_or_phone": "nobody@example.com", "password": "x"}', content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+        self.assertIsInstance(response.accepted_renderer, renderers.JSONRenderer)
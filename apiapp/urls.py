@@ -1,5 +1,5 @@
 from django.urls import path 
-from . import views  
+from . import async_views, instrumentation, views  
 
 
 
@@ -10,6 +10,7 @@ urlpatterns = [
     path("category_list", views.category_list, name="category_list"),
     path("categories/<slug:slug>", views.category_detail, name="category_detail"),
     path("add_to_cart/", views.add_to_cart, name="add_to_cart"),
+    path("update_cart/", views.update_cart, name="update_cart"),
     path("update_cartitem_quantity/", views.update_cartitem_quantity, name="update_cartitem_quantity"),
     path("add_review/", views.add_review, name="add_review"),
     path("update_review/<int:pk>/", views.update_review, name="update_review"),
@@ -40,9 +41,16 @@ urlpatterns = [
     path('auth/logout/', views.logout_user, name='logout'),
     path('auth/profile/', views.get_user_profile, name='profile'),
     path("lipa_na_mpesa/", views.lipa_na_mpesa, name="lipa_na_mpesa"),
+    # Async variants for ASGI deployments (apiapp/async_views.py)
+    path("async/create_checkout_session/", async_views.create_checkout_session, name="create_checkout_session_async"),
+    path("async/lipa_na_mpesa/", async_views.lipa_na_mpesa, name="lipa_na_mpesa_async"),
+    path("payment_status/wait/", async_views.payment_status_wait, name="payment_status_wait"),
     path("mpesa-callback/", views.mpesa_callback, name="mpesa_callback"),
      path('payment_status/', views.payment_status, name='payment_status'),
      path('complete-profile/', views.complete_profile, name='complete-profile'),
      path('similar/<int:product_id>/', views.similar_products, name='similar-products'),
+     path('recommendations/cart/<str:cart_code>/', views.cart_recommendations, name='cart-recommendations'),
+     path('recommendations/<int:product_id>/', views.product_recommendations, name='product-recommendations'),
+     path('metrics/', instrumentation.metrics, name='metrics'),
 ]
 
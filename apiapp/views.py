@@ -1,27 +1,44 @@
 import json
+import logging
 import stripe 
 from django.conf import settings
 from django.shortcuts import get_object_or_404, render
 from django.contrib.auth import get_user_model
-from django.db.models import Q 
-from django.db.models import Avg
+from django.db.models import Prefetch, Value
+from django.db.models.functions import Upper
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Cart, CartItem, Category, CustomerAddress, Order, OrderItem, PaymentRequest, Product, Review, Wishlist
-from .serializers import CartItemSerializer, CartSerializer, CategoryDetailSerializer, CategoryListSerializer, CompleteProfileSerializer, CustomerAddressSerializer, OrderSerializer, ProductListSerializer, ProductDetailSerializer, ProductSerializer, ReviewSerializer, SimpleCartSerializer, UserLoginSerializer, UserRegistrationSerializer, UserSerializer, WishlistSerializer
+from rest_framework.exceptions import NotFound
+from .models import AuthToken, Cart, CartItem, Category, CustomerAddress, Order, OrderItem, PaymentRequest, Product, ProductRating, Recommendation, Review, SimilarProduct, Wishlist
+from .serializers import REVIEWS_PAGE_SIZE
+from .cache import cached_catalog_response
+from .fast_serializers import FastListSerializer
+from .pagination import get_cursor, get_page_size, keyset_page, next_offset_cursor, offset_page, page_payload
+from .search import search_products
+from . import daraja, recommendations
+from .carts import apply_cart_operations, get_cart_queryset, set_line_quantity
+from .pricing import cart_totals, with_cart_totals
+from .webhooks import record_event
+from .conditional import categories_version, category_version, cart_version_from_path, cart_version_from_query, conditional_on, featured_products_version
+from .serializers import CartItemSerializer, CartOperationsSerializer, CartSerializer, CategoryDetailSerializer, CategoryListSerializer, CompleteProfileSerializer, CustomerAddressSerializer, OrderSerializer, ProductListSerializer, ProductDetailSerializer, ProductSerializer, RecommendationSerializer, ReviewSerializer, SimpleCartSerializer, UserLoginSerializer, UserRegistrationSerializer, UserSerializer, WishlistSerializer
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from rest_framework.authtoken.models import Token
 from django.contrib.auth import login
-import base64
 import requests
-from datetime import datetime
 from django.utils import timezone
 from rest_framework.permissions import IsAuthenticated
 
 
+logger = logging.getLogger(__name__)
+
+# values()-based serializers for the big read-only lists (fast_serializers.py)
+FAST_PRODUCT_LIST = FastListSerializer(ProductListSerializer)
+FAST_CATEGORY_LIST = FastListSerializer(CategoryListSerializer)
+FAST_ORDERS = FastListSerializer(OrderSerializer)
+FAST_WISHLISTS = FastListSerializer(WishlistSerializer)
+
 key = settings.MPESA_CONSUMER_KEY
 secret = settings.MPESA_CONSUMER_SECRET
 # etc.
@@ -37,31 +54,73 @@ endpoint_secret = settings.WEBHOOK_SECRET
 
 User = get_user_model()
 
+
+def get_review_page(request):
+    try:
+        return max(int(request.query_params.get("reviews_page", 1)), 1)
+    except ValueError:
+        return 1
+
+
+def get_product_detail_queryset(reviews_page=1):
+    """
+    Products ready for ProductDetailSerializer: rating row (with its
+    histogram) joined in, one page of reviews prefetched with their users and
+    the precomputed similar products prefetched in one indexed query. Keeps
+    the detail endpoints at a fixed number of queries.
+    """
+    start = (reviews_page - 1) * REVIEWS_PAGE_SIZE
+    reviews = Review.objects.select_related("user")[start:start + REVIEWS_PAGE_SIZE]
+    similar = SimilarProduct.objects.select_related("similar")
+    return (
+        Product.objects.select_related("rating")
+        .prefetch_related(
+            Prefetch("reviews", queryset=reviews, to_attr="review_page"),
+            Prefetch("similar_links", queryset=similar, to_attr="similar_page"),
+        )
+    )
+
+
+@conditional_on(featured_products_version)
 @api_view(['GET'])
 def product_list(request):
-    products = Product.objects.filter(featured=True)
-    serializer = ProductListSerializer(products, many=True)
-    return Response(serializer.data)
+    def build():
+        products, next_cursor = keyset_page(request, FAST_PRODUCT_LIST.rows(Product.objects.filter(featured=True)), ("id",))
+        return page_payload(FAST_PRODUCT_LIST.data(products), next_cursor)
+
+    return cached_catalog_response("product_list", "featured", get_cursor(request), get_page_size(request), build=build)
 
 
 @api_view(["GET"])
 def product_detail(request, slug):
-    product = Product.objects.get(slug=slug)
-    serializer = ProductDetailSerializer(product)
-    return Response(serializer.data)
+    reviews_page = get_review_page(request)
+
+    def build():
+        product = get_product_detail_queryset(reviews_page).get(slug=slug)
+        return ProductDetailSerializer(product).data
+
+    return cached_catalog_response("product_detail", slug, reviews_page, build=build)
 
 
+@conditional_on(categories_version)
 @api_view(["GET"])
 def category_list(request):
-    categories = Category.objects.all()
-    serializer = CategoryListSerializer(categories, many=True)
-    return Response(serializer.data)
+    def build():
+        return FAST_CATEGORY_LIST.data(FAST_CATEGORY_LIST.rows(Category.objects.all()))
+
+    return cached_catalog_response("category_list", build=build)
 
+@conditional_on(category_version)
 @api_view(["GET"])
 def category_detail(request, slug):
-    category = Category.objects.get(slug=slug)
-    serializer = CategoryDetailSerializer(category)
-    return Response(serializer.data)
+    def build():
+        category = Category.objects.get(slug=slug)
+        products, next_cursor = keyset_page(request, FAST_PRODUCT_LIST.rows(category.products.all()), ("id",))
+        data = CategoryDetailSerializer(category).data
+        data["products"] = page_payload(FAST_PRODUCT_LIST.data(products), next_cursor)
+        return data
+
+    return cached_catalog_response("category_detail", slug, get_cursor(request), get_page_size(request), build=build)
 
 
 @api_view(["POST"])
@@ -69,12 +128,25 @@ def add_to_cart(request):
     cart_code = request.data.get("cart_code")
     product_id = request.data.get("product_id")
 
-    cart, created = Cart.objects.get_or_create(cart_code=cart_code)
-    product = Product.objects.get(id=product_id)
+    serializer = CartOperationsSerializer(data={
+        "cart_code": cart_code,
+        "operations": [{"op": "add", "product_id": product_id, "quantity": request.data.get("quantity", 1)}],
+    })
+    serializer.is_valid(raise_exception=True)
+    cart = apply_cart_operations(cart_code, serializer.validated_data["operations"])
 
-    cartitem, created = CartItem.objects.get_or_create(product=product, cart=cart)
-    cartitem.quantity = 1 
-    cartitem.save() 
+    serializer = CartSerializer(cart)
+    return Response(serializer.data)
+
+
+@api_view(["POST"])
+def update_cart(request):
+    """
+    Apply a batch of add/set/remove line operations to a cart atomically
+    """
+    serializer = CartOperationsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    cart = apply_cart_operations(serializer.validated_data["cart_code"], serializer.validated_data["operations"])
 
     serializer = CartSerializer(cart)
     return Response(serializer.data)
@@ -87,9 +159,7 @@ def update_cartitem_quantity(request):
 
     quantity = int(quantity)
 
-    cartitem = CartItem.objects.get(id=cartitem_id)
-    cartitem.quantity = quantity 
-    cartitem.save()
+    cartitem = set_line_quantity(cartitem_id, quantity)
 
     serializer = CartItemSerializer(cartitem)
     return Response({"data": serializer.data, "message": "Cartitem updated successfully!"})
@@ -102,8 +172,7 @@ def add_review(request):
     rating = request.data.get("rating")
     review_text = request.data.get("review")
 
-    # Debug logs
-    print("Received data:", request.data)
+    logger.debug("Review submitted", extra={"payload": request.data})
 
     # Basic validation
     if not all([product_id, email, rating, review_text]):
@@ -140,8 +209,8 @@ def add_review(request):
             rating=rating,
             review=review_text
         )
-    except Exception as e:
-        print("Failed to save review:", str(e))
+    except Exception:
+        logger.exception("Failed to save review")
         return Response({"error": "Failed to save review."}, status=500)
 
     # Serialize and return the new review
@@ -200,26 +269,20 @@ def product_search(request):
     query = request.query_params.get("query") 
     if not query:
         return Response("No query provided", status=400)
-    
-    products = Product.objects.filter(Q(name__icontains=query) | 
-                                      Q(description__icontains=query) |
-                                       Q(category__name__icontains=query) )
-    serializer = ProductListSerializer(products, many=True)
-    return Response(serializer.data)
-    
 
+    offset, limit = offset_page(request)
+    products = search_products(query, offset=offset, limit=limit + 1)
+    serializer = ProductListSerializer(products[:limit], many=True)
+    return Response(page_payload(serializer.data, next_offset_cursor(offset, limit, products)))
+    
 
 
 
 
 
-@api_view(['POST'])
-def create_checkout_session(request):
-    cart_code = request.data.get("cart_code")
-    email = request.data.get("email")
-    cart = Cart.objects.get(cart_code=cart_code)
-    try:
-        checkout_session = stripe.checkout.Session.create(
+def checkout_session_params(cart_code, email, cartitems):
+    """Stripe Checkout Session parameters for a cart, shared by the sync and async views."""
+    return dict(
             customer_email= email,
             payment_method_types=['card'],
 
@@ -233,7 +296,7 @@ def create_checkout_session(request):
                     },
                     'quantity': item.quantity,
                 }
-                for item in cart.cartitems.all()
+                for item in cartitems
             ] + [
                 {
                     'price_data': {
@@ -254,6 +317,17 @@ def create_checkout_session(request):
             success_url="https://next-shop-self.vercel.app/success",
             cancel_url="https://next-shop-self.vercel.app/failed",
             metadata = {"cart_code": cart_code}
+    )
+
+
+@api_view(['POST'])
+def create_checkout_session(request):
+    cart_code = request.data.get("cart_code")
+    email = request.data.get("email")
+    cart = Cart.objects.get(cart_code=cart_code)
+    try:
+        checkout_session = stripe.checkout.Session.create(
+            **checkout_session_params(cart_code, email, cart.cartitems.select_related("product"))
         )
         return Response({'data': checkout_session})
     except Exception as e:
@@ -283,40 +357,14 @@ def my_webhook_view(request):
     event['type'] == 'checkout.session.completed'
     or event['type'] == 'checkout.session.async_payment_succeeded'
   ):
-    session = event['data']['object']
-    cart_code = session.get("metadata", {}).get("cart_code")
-
-    fulfill_checkout(session, cart_code)
+    # Queued as a job (see webhooks.py); a retried delivery is ignored.
+    record_event("stripe", event['id'], event['type'], json.loads(payload))
 
 
   return HttpResponse(status=200)
 
 
 
-def fulfill_checkout(session, cart_code):
-    
-    order = Order.objects.create(stripe_checkout_id=session["id"],
-        amount=session["amount_total"],
-        currency=session["currency"],
-        customer_email=session["customer_email"],
-        status="Paid")
-    
-
-    print(session)
-
-
-    cart = Cart.objects.get(cart_code=cart_code)
-    cartitems = cart.cartitems.all()
-
-    for item in cartitems:
-        orderitem = OrderItem.objects.create(order=order, product=item.product, 
-                                             quantity=item.quantity)
-    
-    cart.delete()
-
-
-
-
 # Newly Added
 
 
@@ -350,14 +398,15 @@ def get_orders(request):
         if not email:
             return Response({"error": "Email is required"}, status=400)
 
-        orders = Order.objects.filter(customer_email__iexact=email)
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        # Same match as customer_email__iexact, but in the form order_email_created_idx indexes.
+        orders = Order.objects.annotate(email_upper=Upper("customer_email")).filter(email_upper=Upper(Value(email)))
+        orders, next_cursor = keyset_page(request, FAST_ORDERS.rows(orders), ("-created_at", "-id"))
+        return Response(page_payload(FAST_ORDERS.data(orders), next_cursor))
 
+    except NotFound:
+        raise
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print("Error in get_orders:", error_trace)
+        logger.exception("Error in get_orders")
         return Response({"error": str(e)}, status=500)
 
 
@@ -401,9 +450,9 @@ def get_address(request):
 @api_view(["GET"])
 def my_wishlists(request):
     email = request.query_params.get("email")
-    wishlists = Wishlist.objects.filter(user__email=email)
-    serializer = WishlistSerializer(wishlists, many=True)
-    return Response(serializer.data)
+    wishlists = FAST_WISHLISTS.rows(Wishlist.objects.filter(user__email=email))
+    wishlists, next_cursor = keyset_page(request, wishlists, ("-created", "-id"))
+    return Response(page_payload(FAST_WISHLISTS.data(wishlists), next_cursor))
 
 
 @api_view(["GET"])
@@ -417,9 +466,10 @@ def product_in_wishlist(request):
 
 
 
+@conditional_on(cart_version_from_path)
 @api_view(['GET'])
 def get_cart(request, cart_code):
-    cart = Cart.objects.filter(cart_code=cart_code).first()
+    cart = get_cart_queryset().filter(cart_code=cart_code).first()
     
     if cart:
         serializer = CartSerializer(cart)
@@ -430,10 +480,11 @@ def get_cart(request, cart_code):
 
 
 
+@conditional_on(cart_version_from_query)
 @api_view(['GET'])
 def get_cart_stat(request):
     cart_code = request.query_params.get("cart_code")
-    cart = Cart.objects.filter(cart_code=cart_code).first()
+    cart = with_cart_totals(Cart.objects.filter(cart_code=cart_code)).first()
 
     if cart:
         serializer = SimpleCartSerializer(cart)
@@ -475,7 +526,7 @@ def register_user(request):
         user = serializer.save()
         
         # Create token for the user
-        token, created = Token.objects.get_or_create(user=user)
+        token, key = AuthToken.issue(user)
         
         # Serialize user data
         user_serializer = UserSerializer(user)
@@ -483,7 +534,7 @@ def register_user(request):
         return Response({
             'message': 'User registered successfully',
             'user': user_serializer.data,
-            'token': token.key
+            'token': key
         }, status=status.HTTP_201_CREATED)
     
     return Response({
@@ -503,8 +554,8 @@ def login_user(request):
     if serializer.is_valid():
         user = serializer.validated_data['user']
         
-        # Create or get token
-        token, created = Token.objects.get_or_create(user=user)
+        # Create a token for this login; only its hash is stored
+        token, key = AuthToken.issue(user)
         
         # Serialize user data
         user_serializer = UserSerializer(user)
@@ -512,7 +563,7 @@ def login_user(request):
         return Response({
             'message': 'Login successful',
             'user': user_serializer.data,
-            'token': token.key
+            'token': key
         }, status=status.HTTP_200_OK)
     
     return Response({
@@ -524,11 +575,15 @@ def login_user(request):
 @api_view(['POST'])
 def logout_user(request):
     """
-    Logout user by deleting their token
+    Logout user by deleting the token they authenticated with
     """
     try:
-        # Delete the user's token
-        request.user.auth_token.delete()
+        # Delete the request's token; other logins keep theirs. Session
+        # logins have no token of their own, so they drop all of them.
+        if isinstance(request.auth, AuthToken):
+            request.auth.delete()
+        else:
+            request.user.auth_tokens.all().delete()
         return Response({
             'message': 'Logout successful'
         }, status=status.HTTP_200_OK)
@@ -548,29 +603,12 @@ def get_user_profile(request):
 
 
 # Mpesa integration
-def generate_mpesa_access_token():
-    consumer_key = settings.MPESA_CONSUMER_KEY
-    consumer_secret = settings.MPESA_CONSUMER_SECRET
-    auth = (consumer_key, consumer_secret)
-
-    res = requests.get(
-        "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials",
-        auth=auth
-    )
+USD_TO_KES = 140
 
-    try:
-        return res.json()["access_token"]
-    except Exception as e:
-        print(" Failed to get access token")
-        print("Status:", res.status_code)
-        print("Response:", res.text)
-        raise e
-    
-def get_lipa_na_mpesa_password():
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    data_to_encode = settings.MPESA_SHORTCODE + settings.MPESA_PASSKEY + timestamp
-    encoded = base64.b64encode(data_to_encode.encode())
-    return encoded.decode('utf-8'), timestamp
+
+def mpesa_amount(cart):
+    """The cart total (USD), in whole shillings, loaded through with_cart_totals()."""
+    return int(cart_totals(cart)["cart_total"] * USD_TO_KES)
 
 
 @api_view(['POST'])
@@ -583,7 +621,7 @@ def lipa_na_mpesa(request):
         return Response({"error": "Phone, email and cart_code are required"}, status=400)
 
     try:
-        cart = Cart.objects.get(cart_code=cart_code)
+        cart = with_cart_totals(Cart.objects.all()).get(cart_code=cart_code)
     except Cart.DoesNotExist:
         return Response({"error": "Invalid cart code"}, status=404)
 
@@ -592,52 +630,23 @@ def lipa_na_mpesa(request):
         defaults={"email": email}
     )
 
-    USD_TO_KES = 140
-    amount_usd = sum(item.product.price * item.quantity for item in cart.cartitems.all())
-    amount_kes = int(amount_usd * USD_TO_KES)
+    amount_kes = mpesa_amount(cart)
 
     try:
-        access_token = generate_mpesa_access_token()
-        password, timestamp = get_lipa_na_mpesa_password()
-    except Exception as e:
-        print("Failed generating M-Pesa credentials:", str(e))
+        res = daraja.get_client().stk_push(phone, amount_kes, account_reference=cart_code, description="Payment for cart")
+    except daraja.DarajaError as e:
+        logger.error("Failed generating M-Pesa credentials", extra={"error": str(e)})
         return Response({"error": "M-Pesa credentials error", "details": str(e)}, status=500)
+    except requests.RequestException as e:
+        logger.warning("Failed reaching Safaricom", extra={"error": str(e)})
+        return Response({"error": "M-Pesa is unreachable", "details": str(e)}, status=502)
 
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-
-    payload = {
-        "BusinessShortCode": settings.MPESA_SHORTCODE,
-        "Password": password,
-        "Timestamp": timestamp,
-        "TransactionType": "CustomerPayBillOnline",
-        "Amount": amount_kes,
-        "PartyA": phone,
-        "PartyB": settings.MPESA_SHORTCODE,
-        "PhoneNumber": phone,
-        "CallBackURL": settings.MPESA_CALLBACK_URL,
-        "AccountReference": cart_code,
-        "TransactionDesc": "Payment for cart",
-    }
-
-    print("📤 Sending STK Push Payload:", json.dumps(payload, indent=2))
-
-    res = requests.post(
-        "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest",
-        headers=headers,
-        json=payload
-    )
-
-    print("Safaricom response:")
-    print("Status Code:", res.status_code)
-    print("Response:", res.text)
+    logger.info("Safaricom STK push response", extra={"status_code": res.status_code, "response": res.text})
 
     try:
         return Response(res.json(), status=res.status_code)
-    except Exception as e:
-        print("Error decoding Safaricom response:", e)
+    except Exception:
+        logger.error("Error decoding Safaricom response", extra={"status_code": res.status_code, "response": res.text})
         return Response({
             "error": "Failed to decode Safaricom response",
             "details": res.text
@@ -646,40 +655,17 @@ def lipa_na_mpesa(request):
 @api_view(["POST"])
 def mpesa_callback(request):
     data = request.data
-    print("M-Pesa Callback Data:", data)
+    logger.info("M-Pesa callback received", extra={"payload": data})
 
     try:
         result_code = data["Body"]["stkCallback"]["ResultCode"]
-        metadata = data["Body"]["stkCallback"].get("CallbackMetadata", {})
-        cart_code = data["Body"]["stkCallback"]["AccountReference"]
-
-        if result_code == 0:
-            cart = Cart.objects.get(cart_code=cart_code)
-            payment_request = PaymentRequest.objects.get(cart_code=cart_code)
-            email = payment_request.email
-
-            # ✅ Create the order
-            order = Order.objects.create(
-                amount=sum(item.product.price * item.quantity for item in cart.cartitems.all()),
-                currency="KES",
-                customer_email=email,
-                status="Paid"
-            )
-
-            for item in cart.cartitems.all():
-                OrderItem.objects.create(order=order, product=item.product, quantity=item.quantity)
+        checkout_request_id = data["Body"]["stkCallback"]["CheckoutRequestID"]
 
-            # ✅ Update payment status instead of deleting
-            payment_request.status = "Paid"
-            payment_request.save()
-
-            cart.delete()
-
-        else:
-            PaymentRequest.objects.filter(cart_code=cart_code).update(status="Declined")
+        # Queued as a job (see webhooks.py); a retried callback is ignored.
+        record_event("mpesa", checkout_request_id, str(result_code), data)
 
-    except Exception as e:
-        print("Error processing callback:", e)
+    except Exception:
+        logger.exception("Error processing M-Pesa callback")
 
     return Response({"message": "Callback received"}, status=200)
 
@@ -699,40 +685,37 @@ def payment_status(request):
 def get_reviews(request, product_id):
     try:
         # product = Product.objects.get(id=product_id)
-        reviews = Review.objects.filter(product_id=product_id)
+        reviews = Review.objects.filter(product_id=product_id).select_related("user")
+        reviews, next_cursor = keyset_page(request, reviews, ("-created", "-id"))
         serializer = ReviewSerializer(reviews, many=True)
-        return Response(serializer.data)
+        return Response(page_payload(serializer.data, next_cursor))
     except Product.DoesNotExist:
         return Response({"error": "Product not found."}, status=404)
     
 #Added get_ratings view
 @api_view(['GET'])
 def get_rating(request, product_id):
-    try:
-        product = Product.objects.get(id=product_id)
-        reviews = Review.objects.filter(product=product)
-
-        # Calculate average rating and total reviews
-        average_rating = reviews.aggregate(avg=Avg('rating'))['avg'] or 0
-        total_reviews = reviews.count()
-
-        # Rating breakdown
-        breakdown = {
-            "poor": reviews.filter(rating=1).count(),
-            "fair": reviews.filter(rating=2).count(),
-            "good": reviews.filter(rating=3).count(),
-            "very_good": reviews.filter(rating=4).count(),
-            "excellent": reviews.filter(rating=5).count(),
-        }
-
-        return Response({
-            "average_rating": round(average_rating, 1),
-            "total_reviews": total_reviews,
-            "breakdown": breakdown
-        })
+    product_rating = ProductRating.objects.filter(product_id=product_id).first()
+
+    if product_rating is None:
+        if not Product.objects.filter(id=product_id).exists():
+            return Response({"error": "Product not found."}, status=404)
+        product_rating = ProductRating(product_id=product_id)
+
+    # Rating breakdown
+    breakdown = {
+        "poor": product_rating.one_star,
+        "fair": product_rating.two_star,
+        "good": product_rating.three_star,
+        "very_good": product_rating.four_star,
+        "excellent": product_rating.five_star,
+    }
 
-    except Product.DoesNotExist:
-        return Response({"error": "Product not found."}, status=404)
+    return Response({
+        "average_rating": round(product_rating.average_rating, 1),
+        "total_reviews": product_rating.total_reviews,
+        "breakdown": breakdown
+    })
     
 
 
@@ -754,6 +737,27 @@ def complete_profile(request):
 #similar products view
 @api_view(['GET'])
 def similar_products(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
+    product = get_object_or_404(get_product_detail_queryset(get_review_page(request)), id=product_id)
     serializer = ProductDetailSerializer(product, context={'request': request})
-    return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+#frequently bought together views
+@api_view(['GET'])
+def product_recommendations(request, product_id):
+    recs = Recommendation.objects.filter(product_id=product_id).select_related("recommended")
+    serializer = RecommendationSerializer(recs, many=True)
+    return Response(serializer.data)
+
+
+@api_view(['GET'])
+def cart_recommendations(request, cart_code):
+    product_ids = list(CartItem.objects.filter(cart__cart_code=cart_code).values_list("product_id", flat=True))
+    if not product_ids:
+        return Response([])
+
+    results = [
+        {"product": ProductListSerializer(product).data, "score": score}
+        for product, score in recommendations.for_cart(product_ids)
+    ]
+    return Response(results)
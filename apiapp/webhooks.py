@@ -0,0 +1,167 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from . import payment_events
+from .fulfillment import fulfill_cart
+from .models import Cart, PaymentRequest, WebhookEvent
+from .pricing import cart_totals, with_cart_totals
+
+
+# Payment webhooks are queued as jobs. The endpoints verify the delivery and
+# record it with record_event(); `manage.py run_webhook_worker` processes
+# pending events one at a time with run_one(), so deployments run it as its
+# own process next to the web server. WEBHOOK_INLINE (off by default, meant for
+# development and tests) also makes the new event's first attempt right after
+# it commits, on the request thread, so payments are fulfilled without a
+# worker; retries still need one.
+#
+# A worker claims an event with SELECT ... FOR UPDATE SKIP LOCKED, so
+# concurrent workers never wait on or double-process each other's events, and
+# keeps the row locked while it processes it: the handler's writes and the
+# event's new status commit together, and a worker that dies mid-event just
+# releases it for the next one. A failed attempt is retried with exponential
+# backoff until WEBHOOK_MAX_ATTEMPTS, after which the event is left dead for
+# someone to look at.
+
+logger = logging.getLogger(__name__)
+
+STRIPE_FULFILLMENT_EVENTS = {"checkout.session.completed", "checkout.session.async_payment_succeeded"}
+
+
+def record_event(provider, event_id, event_type, payload):
+    """
+    Store an inbound webhook event as a pending job and return True, or
+    return False if this (provider, event_id) was already recorded.
+
+    A duplicate costs one failed insert on the unique key. Concurrent
+    deliveries of the same event wait on the unique index and only one of
+    them is recorded.
+    """
+    try:
+        with transaction.atomic():
+            event = WebhookEvent.objects.create(provider=provider, event_id=event_id, event_type=event_type, payload=payload)
+    except IntegrityError:
+        return False
+    if settings.WEBHOOK_INLINE:
+        transaction.on_commit(lambda: run_inline(event.id))
+    return True
+
+
+def run_inline(event_id):
+    # Failures are recorded on the event for a worker to retry; anything else
+    # (e.g. the database going away) must not fail the webhook response.
+    try:
+        run_one(event_id=event_id)
+    except Exception:
+        logger.exception("Inline webhook processing failed", extra={"event_id": event_id})
+
+
+def handle_stripe(event):
+    if event.event_type not in STRIPE_FULFILLMENT_EVENTS:
+        return
+    session = event.payload["data"]["object"]
+    fulfill_cart(
+        session.get("metadata", {}).get("cart_code"),
+        checkout_id=session["id"],
+        amount=session["amount_total"],
+        currency=session["currency"],
+        customer_email=session["customer_email"],
+    )
+
+
+def handle_mpesa(event):
+    callback = event.payload["Body"]["stkCallback"]
+    cart_code = callback["AccountReference"]
+
+    if callback["ResultCode"] != 0:
+        if PaymentRequest.objects.filter(cart_code=cart_code).update(status="Declined"):
+            transaction.on_commit(lambda: payment_events.publish(cart_code, "Declined"))
+        return
+
+    cart = with_cart_totals(Cart.objects.all()).get(cart_code=cart_code)
+    payment_request = PaymentRequest.objects.get(cart_code=cart_code)
+    fulfill_cart(
+        cart_code,
+        checkout_id=event.event_id,
+        amount=cart_totals(cart)["cart_total"],
+        currency="KES",
+        customer_email=payment_request.email,
+    )
+    payment_request.status = "Paid"
+    payment_request.save()
+    transaction.on_commit(lambda: payment_events.publish(cart_code, "Paid"))
+
+
+HANDLERS = {
+    "stripe": handle_stripe,
+    "mpesa": handle_mpesa,
+}
+
+
+def retry_delay(attempts):
+    """Backoff before retry number `attempts`: 1x, 2x, 4x ... the base delay, capped."""
+    delay = settings.WEBHOOK_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.WEBHOOK_RETRY_MAX_DELAY))
+
+
+def claim(now, event_id=None):
+    """Lock and return the next due event (or event_id, if due), or None. Call inside a transaction."""
+    due = WebhookEvent.objects.filter(status=WebhookEvent.PENDING, run_at__lte=now).order_by("run_at", "id")
+    if event_id is not None:
+        due = due.filter(id=event_id)
+    if connection.features.has_select_for_update_skip_locked:
+        return due.select_for_update(skip_locked=True).first()
+
+    # SQLite has no row locks; claim by bumping attempts only if no other
+    # worker has done so since we read the row.
+    for event in due[:10]:
+        claimed = WebhookEvent.objects.filter(id=event.id, status=WebhookEvent.PENDING, attempts=event.attempts)
+        if claimed.update(attempts=event.attempts + 1):
+            return event
+    return None
+
+
+def run_one(now=None, event_id=None):
+    """
+    Process the next due event (only event_id, if given) and return it with
+    its new status, or return None when nothing is due or another worker has
+    it.
+    """
+    with transaction.atomic():
+        event = claim(now or timezone.now(), event_id)
+        if event is None:
+            return None
+
+        event.attempts += 1
+        event.started_at = timezone.now()
+        try:
+            with transaction.atomic():
+                HANDLERS[event.provider](event)
+        except Exception:
+            event.last_error = traceback.format_exc()
+            if event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+                event.status = WebhookEvent.DEAD
+            else:
+                event.run_at = timezone.now() + retry_delay(event.attempts)
+        else:
+            event.status = WebhookEvent.DONE
+            event.last_error = ""
+        event.finished_at = timezone.now()
+        event.save()
+    return event
+
+
+def run_pending(limit=None):
+    """Process due events until none are left (or limit is reached); return them."""
+    processed = []
+    while limit is None or len(processed) < limit:
+        event = run_one()
+        if event is None:
+            break
+        processed.append(event)
+    return processed
@@ -51,6 +51,7 @@ CORS_ALLOW_HEADERS = ['*']
 CORS_ALLOW_METHODS = ['*']
 
 INSTALLED_APPS = [
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -60,15 +61,18 @@ INSTALLED_APPS = [
     'corsheaders',
     'apiapp',
     'rest_framework',
-    'rest_framework.authtoken',
+    'rest_framework.authtoken',  # only for migrating its old tokens to apiapp.AuthToken
     'cloudinary', 
     'cloudinary_storage'
 ]
 
 MIDDLEWARE = [
+    'apiapp.instrumentation.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # WhiteNoise, async-capable like the rest of the chain so async views
+    # stay on the event loop under ASGI.
+    'apiapp.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -95,6 +99,20 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'ecommerceApiProject.wsgi.application'
+ASGI_APPLICATION = 'ecommerceApiProject.asgi.application'
+
+# Payment status push (apiapp/payment_events.py). Statuses are published from
+# whichever process handles the webhook, so instant updates need a layer
+# shared between processes, e.g.
+# CHANNEL_LAYER_BACKEND=channels_redis.core.RedisChannelLayer plus CHANNEL_LAYER_URL.
+# Without one, listeners notice within PAYMENT_STATUS_RECHECK seconds.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': os.getenv('CHANNEL_LAYER_BACKEND', 'channels.layers.InMemoryChannelLayer'),
+    }
+}
+if os.getenv('CHANNEL_LAYER_URL'):
+    CHANNEL_LAYERS['default']['CONFIG'] = {'hosts': [os.getenv('CHANNEL_LAYER_URL')]}
 
 cloudinary.config(
     cloudinary_url=os.environ.get('CLOUDINARY_URL')
@@ -152,24 +170,152 @@ if not DATABASES['default']:
 
 
 
+# Cache
+# LocMem by default, which is per-process: the catalog cache is then skipped,
+# since a catalog change made in one worker couldn't invalidate the others.
+# Point CACHE_BACKEND/CACHE_LOCATION at a shared backend (e.g.
+# django.core.cache.backends.filebased.FileBasedCache or Redis) to enable it.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'inova-shop'),
+    }
+}
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
+
 MPESA_CONSUMER_KEY = os.getenv("MPESA_CONSUMER_KEY")
 MPESA_CONSUMER_SECRET = os.getenv("MPESA_CONSUMER_SECRET")
 MPESA_SHORTCODE = os.getenv("MPESA_SHORTCODE")
 MPESA_PASSKEY = os.getenv("MPESA_PASSKEY")
 MPESA_CALLBACK_URL = os.getenv("MPESA_CALLBACK_URL")
 MPESA_BASE_URL = os.getenv("MPESA_BASE_URL")
+MPESA_TIMEOUT = float(os.getenv("MPESA_TIMEOUT", 10))
+MPESA_RETRIES = int(os.getenv("MPESA_RETRIES", 3))
+# Outbound calls in flight per provider per process, for the async payment views
+PAYMENT_MAX_CONCURRENCY = int(os.getenv("PAYMENT_MAX_CONCURRENCY", 100))
+# Longest a payment status long-poll is held, and how often it re-reads the status meanwhile
+PAYMENT_STATUS_WAIT_TIMEOUT = float(os.getenv("PAYMENT_STATUS_WAIT_TIMEOUT", 25))
+PAYMENT_STATUS_RECHECK = float(os.getenv("PAYMENT_STATUS_RECHECK", 5))
+# Longest a payment status WebSocket stays open waiting for a final status
+PAYMENT_STATUS_SOCKET_TIMEOUT = float(os.getenv("PAYMENT_STATUS_SOCKET_TIMEOUT", 600))
  
+# Browsable API (used by REST_FRAMEWORK below). It's for development, so it's
+# off on Render (which sets RENDER) unless BROWSABLE_API says otherwise.
+BROWSABLE_API = os.getenv('BROWSABLE_API', 'false' if os.getenv('RENDER') else str(DEBUG)).lower() in ('1', 'true', 'yes')
+
 # # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'apiapp.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
    'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # <-- Allow public access by default
     ],
+    # orjson-backed JSON with a stdlib fallback (apiapp/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'apiapp.renderers.JSONRenderer',
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if BROWSABLE_API else []),
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'apiapp.renderers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
+
+# Keyset pagination for list endpoints (apiapp/pagination.py)
+PAGINATION_PAGE_SIZE = int(os.getenv('PAGINATION_PAGE_SIZE', 20))
+PAGINATION_MAX_PAGE_SIZE = int(os.getenv('PAGINATION_MAX_PAGE_SIZE', 100))
+
+# Neighbours stored per product by apiapp/similarity.py
+SIMILAR_PRODUCTS_K = int(os.getenv('SIMILAR_PRODUCTS_K', 10))
+
+# "Frequently bought together" per product (apiapp/recommendations.py)
+RECOMMENDATIONS_TOP_N = int(os.getenv('RECOMMENDATIONS_TOP_N', 10))
+# How old an order must be before a build counts it, so orders whose
+# transactions commit late aren't skipped.
+RECOMMENDATIONS_SETTLE_SECONDS = int(os.getenv('RECOMMENDATIONS_SETTLE_SECONDS', 300))
+
+# Webhook job queue (apiapp/webhooks.py, manage.py run_webhook_worker)
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 8))
+WEBHOOK_RETRY_DELAY = float(os.getenv('WEBHOOK_RETRY_DELAY', 30))
+WEBHOOK_RETRY_MAX_DELAY = float(os.getenv('WEBHOOK_RETRY_MAX_DELAY', 3600))
+# Make each new event's first attempt on the request thread once it's recorded,
+# so payments go through without a worker. For development and tests only;
+# deployments run `manage.py run_webhook_worker` as its own process.
+WEBHOOK_INLINE = os.getenv('WEBHOOK_INLINE', 'false').lower() in ('1', 'true', 'yes')
+
+# Request instrumentation (apiapp/instrumentation.py): share of requests
+# measured, samples kept per URL name, and the bearer token /metrics wants
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 1.0))
+METRICS_WINDOW = int(os.getenv('METRICS_WINDOW', 1000))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Token auth snapshots (apiapp/authentication.py): seconds kept in the shared
+# cache (skipped when CACHES is per-process, like LocMem), and size and
+# seconds of each process's own LRU in front of it. AUTH_TOKEN_LOCAL_TTL is how
+# long other processes may keep accepting a revoked token.
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 300))
+AUTH_TOKEN_LOCAL_SIZE = int(os.getenv('AUTH_TOKEN_LOCAL_SIZE', 10000))
+AUTH_TOKEN_LOCAL_TTL = int(os.getenv('AUTH_TOKEN_LOCAL_TTL', 30))
+
+# Logging (apiapp/log.py): JSON lines written from a background thread, with
+# credentials and personal details masked. LOG_FORMAT=text for a readable
+# console; LOG_LEVELS sets levels per logger, e.g.
+# LOG_LEVELS="apiapp.requests=WARNING,django.db.backends=DEBUG".
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'redact': {'()': 'apiapp.log.RedactFilter'},
+    },
+    'formatters': {
+        'json': {'()': 'apiapp.log.JsonFormatter'},
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'background': {
+            'class': 'apiapp.log.BackgroundStreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': os.getenv('LOG_FORMAT', 'json'),
+            'filters': ['redact'],
+        },
+    },
+    'root': {'handlers': ['background'], 'level': 'WARNING'},
+    'loggers': {
+        'apiapp': {'level': LOG_LEVEL},
+        **{
+            name.strip(): {'level': level.strip().upper()}
+            for name, level in (item.split('=', 1) for item in os.getenv('LOG_LEVELS', '').split(',') if '=' in item)
+        },
+    },
+}
+
+# Password hashing (apiapp/hashers.py). PASSWORD_HASHER picks the hasher for
+# new passwords: argon2 (default), bcrypt or pbkdf2. Hashes made by the others
+# still verify and are rehashed on the user's next login. The Argon2 default is
+# OWASP's recommended argon2id cost (19 MiB, 2 passes, 1 lane); don't go below it.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'argon2')
+PASSWORD_ARGON2_TIME_COST = int(os.getenv('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv('PASSWORD_ARGON2_MEMORY_COST', 19456))
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv('PASSWORD_ARGON2_PARALLELISM', 1))
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv('PASSWORD_BCRYPT_ROUNDS', 12))
+PASSWORD_HASHER_CLASSES = {
+    'argon2': 'apiapp.hashers.Argon2PasswordHasher',
+    'bcrypt': 'apiapp.hashers.BCryptSHA256PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [
+    PASSWORD_HASHER_CLASSES[PASSWORD_HASHER],
+    *(hasher for name, hasher in PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {